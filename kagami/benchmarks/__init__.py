@@ -0,0 +1,20 @@
+"""
+Standalone benchmarks, run from the kagami directory
+Ex. python -m benchmarks.gamble
+
+The cog modules read the bot config when they're imported,
+placeholders are set here so the benchmarks can run without a .env file
+"""
+import os
+
+_PLACEHOLDERS = {
+    "BOT_TOKEN": "benchmark",
+    "OWNER_ID": "0",
+    "ADMIN_GUILD_ID": "0",
+    "DATA_PATH": "./",
+    "DB_NAME": "benchmark.db",
+    "LAVALINK_URI": "http://127.0.0.1:2333",
+    "LAVALINK_PASSWORD": "youshallnotpass",
+}
+for _key, _value in _PLACEHOLDERS.items():
+    os.environ.setdefault(_key, _value)
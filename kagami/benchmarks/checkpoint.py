@@ -0,0 +1,79 @@
+"""
+Cost of checkpointing a live queue after a few edits, the whole queue as a snapshot against only the edits as QueueDelta rows
+python -m benchmarks.checkpoint [track_count ...] [--edits N]
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+import aiosqlite
+from wavelink import Playable
+
+from cogs.voice.db import SessionSnapshot, SnapshotTrack, QueueDelta, decode_track
+from cogs.voice.voice import SessionQueue, QueueJournal
+from benchmarks.mock_lavalink import make_tracks
+
+
+def edit(queue: SessionQueue, extra: list[Playable], edits: int, rng: random.Random) -> None:
+    """About what a few minutes of a busy session does, tracks played, queued, moved and removed"""
+    assert queue.history is not None
+    for i in range(edits):
+        match i % 4:
+            case 0:
+                queue.history.put(queue.get())
+            case 1:
+                queue.put_at(rng.randrange(len(queue) + 1), rng.choice(extra))
+            case 2:
+                queue.move(rng.randrange(len(queue)), rng.randrange(len(queue)))
+            case _:
+                del queue[rng.randrange(len(queue))]
+
+async def main(sizes: list[int], edits: int) -> None:
+    rng = random.Random(0)
+    extra = [Playable(decode_track(e)) for e in make_tracks(50)] # pyright: ignore [reportArgumentType]
+    print(f"{edits} edits between checkpoints")
+    print(f"{'tracks':>7} {'snapshot':>10} {'deltas':>10} {'rows':>5} {'replay':>10}")
+    for size in sizes:
+        queue = SessionQueue()
+        assert queue.history is not None
+        journal = QueueJournal()
+        queue.history._items.bind(journal, lambda: 0) # pyright: ignore [reportAttributeAccessIssue]
+        queue._items.bind(journal, lambda: len(queue.history or ()))
+        queue.put([Playable(decode_track(e)) for e in make_tracks(size)]) # pyright: ignore [reportArgumentType]
+        with tempfile.TemporaryDirectory() as tmp:
+            async with aiosqlite.connect(os.path.join(tmp, "checkpoint.db")) as db:
+                for table in (SnapshotTrack, SessionSnapshot, QueueDelta):
+                    await table.create_table(db)
+                await SessionSnapshot.save(db, 0, "0", [], [t.encoded for t in queue], 0)
+                journal.compacted(0)
+                journal.base = "0"
+                await db.commit()
+                edit(queue, extra, edits, rng)
+
+                start = time.perf_counter()
+                deltas = journal.take(0, len(queue.history))
+                await QueueDelta.appendMany(db, deltas)
+                await db.commit()
+                delta_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                await SessionSnapshot.save(db, 0, "1", [t.encoded for t in queue.history], [t.encoded for t in queue], len(queue.history) - 1)
+                await db.commit()
+                snapshot_time = time.perf_counter() - start
+
+                start = time.perf_counter()
+                history, upcoming = await QueueDelta.loadCheckpoint(db, 0, "0")
+                replay_time = time.perf_counter() - start
+                assert history == [t.encoded for t in queue.history] and upcoming == [t.encoded for t in queue]
+        print(f"{size:>7} {snapshot_time * 1000:>8.1f}ms {delta_time * 1000:>8.2f}ms {len(deltas):>5} {replay_time * 1000:>8.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.checkpoint")
+    parser.add_argument("sizes", nargs="*", type=int, default=[1_000, 10_000, 50_000])
+    parser.add_argument("--edits", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.edits))
@@ -0,0 +1,55 @@
+"""
+Time to turn a saved TrackList back into Playables against a mock Lavalink
+python -m benchmarks.decode [track_count ...] [--latency SECONDS]
+"""
+import argparse
+import asyncio
+import time
+
+import aiohttp
+from wavelink import Playable
+
+from cogs.voice.db import decode_tracks
+from benchmarks.mock_lavalink import MockLavalink, make_tracks
+
+
+async def sequential(node, encoded: list[str]) -> list[Playable]:
+    """The old path, one GET v4/decodetrack after another"""
+    tracks: list[Playable] = []
+    for e in encoded:
+        data = await node.send(path="v4/decodetrack", params={"encodedTrack": e})
+        tracks.append(Playable(data))
+    return tracks
+
+async def main(sizes: list[int], latency: float) -> None:
+    mock = MockLavalink(latency=latency)
+    await mock.start()
+    async with aiohttp.ClientSession() as session:
+        node = mock.node(session)
+        print(f"mock lavalink latency: {latency * 1000:g}ms per request")
+        print(f"{'tracks':>7} {'sequential':>12} {'batched':>12} {'local':>12}   (seconds, requests)")
+        for size in sizes:
+            encoded = make_tracks(size)
+            results: list[str] = []
+            reference: list[str | None] | None = None
+            for run in (lambda: sequential(node, encoded),
+                        lambda: decode_tracks(node, encoded, local=False),
+                        lambda: decode_tracks(node, encoded)):
+                mock.requests = 0
+                start = time.perf_counter()
+                tracks = await run()
+                elapsed = time.perf_counter() - start
+                titles = [t.title if t is not None else None for t in tracks]
+                assert reference is None or titles == reference, "decoded tracks differ"
+                reference = titles
+                results.append(f"{elapsed:7.3f} {mock.requests:>4}")
+            print(f"{size:>7} " + " ".join(f"{r:>12}" for r in results))
+    await mock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.decode")
+    parser.add_argument("sizes", nargs="*", type=int, default=[30, 300, 3000])
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds added to every mock response")
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.latency))
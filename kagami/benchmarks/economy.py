@@ -0,0 +1,207 @@
+"""
+Monte Carlo simulation of the swedish fish economy, needs numpy
+Replays synthetic chat activity against a fish catalog and one of the prob_* curves
+to see how fast wealth builds up before changing anything on the live bot
+
+python -m benchmarks.economy [--db PATH] [--curve NAME ...] [--threshold N ...] [options]
+Passing several curves, thresholds or windows sweeps every combination and prints a summary row for each
+
+Messages per user are a poisson process whose hourly rate is drawn from a lognormal,
+every message rolls each fish once with the rarity weight the cog would give it from the user's recent messages
+Reaction boosting is not modeled, every catch counts once
+"""
+import argparse
+import itertools
+import math
+import random
+import sqlite3
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from cogs import swedish
+from cogs.swedish import SwedishFish
+from benchmarks.gamble import make_fish
+
+# Curve value before the jitter, mirrors the prob_* functions in cogs.swedish
+CURVES = {
+    "exp": lambda r: np.power(2.0, 1 - r),
+    "quad": lambda r: np.power(r, -2.0),
+    "threehalfs": lambda r: np.power(r, -1.5),
+    "fourfifths": lambda r: np.power(r, -1.25),
+}
+
+expected_probability = np.vectorize(swedish.expected_probability, otypes=[float])
+
+
+@dataclass
+class Params:
+    curve: str
+    threshold: int
+    window: float
+    users: int
+    hours: int
+    rate: float # median messages per user-hour
+    sigma: float # lognormal spread of the per user rate
+    top: int
+
+
+@dataclass
+class Result:
+    params: Params
+    messages: int
+    seconds: float
+    catches_per_user_hour: np.ndarray
+    wealth: np.ndarray
+    hourly_wealth: np.ndarray
+    top_turnover: float
+    top_distinct: int
+
+
+def load_catalog(path: str) -> list[SwedishFish]:
+    with sqlite3.connect(path) as db:
+        rows = db.execute("SELECT name, emoji_id, rarity FROM SwedishFish").fetchall()
+    return [SwedishFish(name, emoji_id, rarity) for name, emoji_id, rarity in rows]
+
+def probability_table(rarities: np.ndarray, curve: str, max_weight: int) -> np.ndarray:
+    """Catch chance of every fish for every rarity weight, shape (max_weight + 1, fish)"""
+    weights = np.arange(max_weight + 1)[:, None]
+    with np.errstate(divide="ignore"):
+        base = CURVES[curve](rarities[None, :] + weights)
+    return expected_probability(base)
+
+def message_weights(rng: np.random.Generator, p: Params) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Draws every message for the run, returns (user, hour, rarity weight) per message
+    The weight is the number of the user's messages inside the window over the threshold, same as on_message
+    """
+    seconds = p.hours * 3600
+    rates = rng.lognormal(math.log(p.rate), p.sigma, p.users)
+    counts = rng.poisson(rates * p.hours)
+    users = np.repeat(np.arange(p.users), counts)
+    times = rng.random(len(users)) * seconds
+    span = seconds + p.window + 1 # keeps every user's messages in their own range of keys
+    keys = users * span + times
+    order = np.argsort(keys, kind="stable")
+    users, times, keys = users[order], times[order], keys[order]
+    first = np.searchsorted(keys, keys - p.window, side="left") # a message exactly one window old still counts, as in RecentMessageTracker
+    recent = np.arange(len(keys)) - first + 1
+    weights = np.maximum(recent - p.threshold, 0)
+    hours = (times // 3600).astype(np.int64)
+    return users, hours, weights
+
+def simulate(catalog: list[SwedishFish], p: Params, seed: int | None=None) -> Result:
+    rng = np.random.default_rng(seed)
+    start = time.perf_counter()
+    rarities = np.array([f.rarity for f in catalog], dtype=float)
+    users, hours, weights = message_weights(rng, p)
+    max_weight = int(weights.max(initial=0)) # nothing caps the count per user, the table covers the heaviest spammer of the run
+    probs = probability_table(rarities, p.curve, max_weight)
+    wealth = np.zeros(p.users, dtype=np.int64)
+    catches = np.zeros(p.users, dtype=np.int64)
+    hourly_wealth = np.zeros(p.hours, dtype=np.int64)
+    previous_top: set[int] = set()
+    turnover: list[float] = []
+    ever_top: set[int] = set()
+    n_weights = max_weight + 1
+    by_hour = np.argsort(hours, kind="stable")
+    hour_bounds = np.searchsorted(hours[by_hour], np.arange(p.hours + 1))
+    for hour in range(p.hours):
+        idx = by_hour[hour_bounds[hour]:hour_bounds[hour + 1]]
+        # messages per (user, weight) this hour, then one binomial draw per fish instead of one roll per message
+        cells = np.bincount(users[idx] * n_weights + weights[idx], minlength=p.users * n_weights)
+        active = np.flatnonzero(cells)
+        caught = rng.binomial(cells[active][:, None], probs[active % n_weights])
+        active_users = active // n_weights
+        np.add.at(catches, active_users, caught.sum(axis=1))
+        np.add.at(wealth, active_users, caught @ rarities.astype(np.int64))
+        hourly_wealth[hour] = wealth.sum()
+
+        top = set(np.argsort(-wealth, kind="stable")[:p.top].tolist())
+        if previous_top:
+            turnover.append(len(top - previous_top) / p.top)
+        previous_top = top
+        ever_top |= top
+
+    return Result(
+        params=p,
+        messages=len(users),
+        seconds=time.perf_counter() - start,
+        catches_per_user_hour=catches / p.hours,
+        wealth=wealth,
+        hourly_wealth=hourly_wealth,
+        top_turnover=float(np.mean(turnover)) if turnover else 0.0,
+        top_distinct=len(ever_top),
+    )
+
+def gini(values: np.ndarray) -> float:
+    values = np.sort(values.astype(float))
+    total = values.sum()
+    if total == 0:
+        return 0.0
+    n = len(values)
+    return float((2 * np.arange(1, n + 1) - n - 1) @ values / (n * total))
+
+def top_share(values: np.ndarray, fraction: float) -> float:
+    total = values.sum()
+    if total == 0:
+        return 0.0
+    count = max(1, int(len(values) * fraction))
+    return float(np.sort(values)[-count:].sum() / total)
+
+def report(r: Result) -> None:
+    p = r.params
+    print(f"curve={p.curve} threshold={p.threshold} window={p.window:g}s users={p.users} hours={p.hours} median rate={p.rate:g}/h")
+    print(f"  {r.messages:,} messages simulated in {r.seconds:.2f}s ({r.messages / r.seconds:,.0f} messages/s)")
+    c = r.catches_per_user_hour
+    print(f"  catches per user-hour: mean {c.mean():.3f}, median {np.median(c):.3f}, p90 {np.percentile(c, 90):.3f}, max {c.max():.3f}")
+    w = r.wealth
+    percentiles = np.percentile(w, [10, 25, 50, 75, 90, 99])
+    print("  net worth percentiles: " + ", ".join(f"p{q} {v:,.0f}" for q, v in zip([10, 25, 50, 75, 90, 99], percentiles)))
+    print(f"  gini {gini(w):.3f}, top 1% hold {top_share(w, 0.01):.1%}, top 10% hold {top_share(w, 0.10):.1%}")
+    growth = np.diff(r.hourly_wealth, prepend=0)
+    print(f"  economy grows {growth.mean():,.0f} per hour ({growth.mean() / p.users:,.2f} per user-hour)")
+    print(f"  top {p.top} turnover {r.top_turnover:.1%} per hour, {r.top_distinct} distinct users ever in the top {p.top}")
+
+def summary_header() -> None:
+    print(f"{'curve':>11} {'thresh':>6} {'window':>6} {'catch/u-h':>10} {'worth/u-h':>10} {'gini':>6} {'top10%':>7} {'churn/h':>8}")
+
+def summary_row(r: Result) -> None:
+    p = r.params
+    print(f"{p.curve:>11} {p.threshold:>6} {p.window:>6g} {r.catches_per_user_hour.mean():>10.3f} "
+          f"{r.wealth.sum() / (p.users * p.hours):>10.2f} {gini(r.wealth):>6.3f} {top_share(r.wealth, 0.10):>7.1%} {r.top_turnover:>8.1%}")
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.economy", description="Swedish fish economy simulator")
+    parser.add_argument("--db", help="bot database to read the fish catalog from, a random catalog is used otherwise")
+    parser.add_argument("--fish", type=int, default=20, help="size of the random catalog")
+    parser.add_argument("--curve", nargs="+", choices=list(CURVES), default=["threehalfs"])
+    parser.add_argument("--threshold", nargs="+", type=int, default=[swedish.RECENT_MESSAGE_THRESHOLD])
+    parser.add_argument("--window", nargs="+", type=float, default=[swedish.FISHING_WINDOW], help="seconds")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--hours", type=int, default=24 * 7)
+    parser.add_argument("--rate", type=float, default=12, help="median messages per user-hour")
+    parser.add_argument("--sigma", type=float, default=1.0, help="lognormal spread of user activity")
+    parser.add_argument("--top", type=int, default=10, help="leaderboard size used for churn")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    catalog = load_catalog(args.db) if args.db else make_fish(args.fish)
+    print(f"{len(catalog)} fish, rarities {sorted(f.rarity for f in catalog)}")
+    combos = list(itertools.product(args.curve, args.threshold, args.window))
+    results = [
+        simulate(catalog, Params(curve, threshold, window, args.users, args.hours, args.rate, args.sigma, args.top), args.seed)
+        for curve, threshold, window in combos
+    ]
+    if len(results) == 1:
+        report(results[0])
+        return
+    summary_header()
+    for r in results:
+        summary_row(r)
+
+
+if __name__ == "__main__":
+    main()
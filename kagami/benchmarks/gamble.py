@@ -0,0 +1,55 @@
+"""
+Gambles per second for the swedish fish catalog
+python -m benchmarks.gamble [fish_count ...]
+"""
+import sys
+import time
+import random
+from collections.abc import Callable
+
+from cogs import swedish
+from cogs.swedish import SwedishFish, SwedishFishCatalog
+
+
+def make_fish(count: int) -> list[SwedishFish]:
+    return [SwedishFish(name=f"fish_{i}", emoji_id=i, rarity=random.randint(1, 100)) for i in range(count)]
+
+def legacy_gamble(fish: list[SwedishFish], rarity_weight: int) -> list[SwedishFish]:
+    """The old per fish path minus the database query, rolls a copy of every fish"""
+    out: list[SwedishFish] = []
+    for f in fish:
+        f = SwedishFish(f.name, f.emoji_id, f.rarity + rarity_weight)
+        out.append(f) if f.roll() else ...
+    return out
+
+def rate(func: Callable[[], object], seconds: float=1.0) -> float:
+    count = 0
+    start = time.perf_counter()
+    end = start + seconds
+    while (now:=time.perf_counter()) < end:
+        for _ in range(100):
+            func()
+        count += 100
+    return count / (now - start)
+
+def main(sizes: list[int]) -> None:
+    print(f"numpy available: {swedish.np is not None}")
+    print(f"{'fish':>6} {'legacy':>12} {'catalog':>12} {'numpy':>12}   (gambles / second)")
+    for size in sizes:
+        fish = make_fish(size)
+        catalog = SwedishFishCatalog()
+        catalog.load(fish)
+
+        legacy = rate(lambda: legacy_gamble(fish, 1))
+        catalog.NUMPY_THRESHOLD = sys.maxsize
+        pure = rate(lambda: catalog.gamble(1))
+        if swedish.np is not None:
+            catalog.NUMPY_THRESHOLD = 0
+            vectorized = f"{rate(lambda: catalog.gamble(1)):12,.0f}"
+        else:
+            vectorized = f"{'-':>12}"
+        print(f"{size:>6} {legacy:12,.0f} {pure:12,.0f} {vectorized}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10, 50, 200, 1000])
@@ -0,0 +1,72 @@
+"""
+Memory held by a long session history, fully in memory against capped with the rest spilled to sqlite
+python -m benchmarks.history [track_count ...] [--limit N]
+"""
+import argparse
+import asyncio
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+import aiosqlite
+from wavelink import Playable
+
+from cogs.voice.db import HistorySpill, decode_track, decode_tracks
+from cogs.voice.voice import SessionQueue, track_size, HISTORY_MEMORY_LIMIT
+from benchmarks.mock_lavalink import make_tracks
+
+
+def build_history(encoded: list[str], limit: int | None) -> tuple[SessionQueue, list[str]]:
+    """Plays every track into a history, past limit the oldest are handed back as encoded strings like spill_history does"""
+    history = SessionQueue(history=False)
+    spilled: list[str] = []
+    for e in encoded:
+        history.put(Playable(decode_track(e))) # pyright: ignore [reportArgumentType]
+        if limit is not None and len(history) > limit:
+            spilled.append(history[0].encoded)
+            del history[0]
+    return history, spilled
+
+def measure(encoded: list[str], limit: int | None) -> tuple[int, SessionQueue, list[str]]:
+    gc.collect()
+    tracemalloc.start()
+    history, spilled = build_history(encoded, limit)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, history, spilled
+
+async def read_back(path: str, spilled: list[str]) -> tuple[int, float]:
+    """Writes the spilled tracks like spill_history and times reading one page of them back"""
+    async with aiosqlite.connect(path) as db:
+        await HistorySpill.create_table(db)
+        await HistorySpill.appendMany(db, 0, 0, spilled)
+        await db.commit()
+        start = time.perf_counter()
+        encoded = await HistorySpill.selectRange(db, 0, len(spilled) // 2, len(spilled) // 2 + 10)
+        await decode_tracks(None, encoded) # pyright: ignore [reportArgumentType]
+        return os.path.getsize(path), time.perf_counter() - start
+
+async def main(sizes: list[int], limit: int) -> None:
+    print(f"history capped at {limit} tracks in memory")
+    print(f"{'tracks':>7} {'all in memory':>14} {'capped':>10} {'saved':>10} {'estimate':>10} {'db file':>10} {'page read':>10}")
+    for size in sizes:
+        encoded = make_tracks(size)
+        full, history, _ = measure(encoded, None)
+        estimate = sum(track_size(t) for t in history)
+        del history
+        capped, history, spilled = measure(encoded, limit)
+        with tempfile.TemporaryDirectory() as tmp:
+            db_size, page_time = await read_back(os.path.join(tmp, "history.db"), spilled) if spilled else (0, 0.0)
+        estimate = estimate * len(spilled) // size
+        print(f"{size:>7} {full / 1e6:>12.1f}MB {capped / 1e6:>8.1f}MB {(full - capped) / 1e6:>8.1f}MB "
+              f"{estimate / 1e6:>8.1f}MB {db_size / 1e6:>8.1f}MB {page_time * 1000:>8.2f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.history")
+    parser.add_argument("sizes", nargs="*", type=int, default=[1_000, 10_000, 50_000])
+    parser.add_argument("--limit", type=int, default=HISTORY_MEMORY_LIMIT)
+    args = parser.parse_args()
+    asyncio.run(main(args.sizes, args.limit))
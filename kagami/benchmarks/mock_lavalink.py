@@ -0,0 +1,199 @@
+"""
+A stand in for a Lavalink node so the voice code can be benchmarked without a real one
+Only the endpoints the benchmarks need are served, each response is delayed by latency seconds
+The websocket sends ready and then stats every stats_interval seconds, the load it reports is whatever the attributes are set to
+Once a client turned resuming on, connecting again with its Session-Id resumes the session and keeps its players
+"""
+import asyncio
+import base64
+import struct
+from types import SimpleNamespace
+from typing import Any
+
+import aiohttp
+from aiohttp import web
+import wavelink
+
+from cogs.voice.db import decode_track
+
+
+def _write_utf(out: bytearray, value: str) -> None:
+    raw = value.encode("utf-16", "surrogatepass").decode("utf-16", "surrogatepass").encode("utf-8", "surrogatepass").replace(b"\x00", b"\xc0\x80")
+    out += struct.pack(">H", len(raw)) + raw
+
+def _write_nullable_utf(out: bytearray, value: str | None) -> None:
+    out += struct.pack(">?", value is not None)
+    if value is not None:
+        _write_utf(out, value)
+
+def encode_track(title: str, author: str, length: int, identifier: str, uri: str | None=None,
+                 artwork_url: str | None=None, isrc: str | None=None, source_name: str="youtube",
+                 is_stream: bool=False, position: int=0) -> str:
+    """Encodes a track the same way lavaplayer does, version 3 of the format"""
+    body = bytearray(struct.pack(">B", 3))
+    _write_utf(body, title)
+    _write_utf(body, author)
+    body += struct.pack(">q", length)
+    _write_utf(body, identifier)
+    body += struct.pack(">?", is_stream)
+    _write_nullable_utf(body, uri)
+    _write_nullable_utf(body, artwork_url)
+    _write_nullable_utf(body, isrc)
+    _write_utf(body, source_name)
+    body += struct.pack(">q", position)
+    return base64.b64encode(struct.pack(">I", (1 << 30) | len(body)) + body).decode()
+
+def make_tracks(count: int) -> list[str]:
+    return [
+        encode_track(f"Track {i} ♪", f"Artist {i % 50}", 180_000 + i, f"id{i:08}",
+                     uri=f"https://www.youtube.com/watch?v=id{i:08}", artwork_url=f"https://i.ytimg.com/vi/id{i:08}/hq.jpg")
+        for i in range(count)
+    ]
+
+
+class MockLavalink:
+    def __init__(self, latency: float=0.005, port: int=0, stats_interval: float=60) -> None:
+        self.latency: float = latency
+        self.port: int = port
+        self.stats_interval: float = stats_interval
+        self.requests: int = 0
+        self.session_id: str = "mock"
+        self.sessions: int = 0
+        self.resuming: bool = False
+        # reported load
+        self.players: int = 0
+        self.playing: int = 0
+        self.system_load: float = 0.0
+        self.deficit: int = 0
+        self.nulled: int = 0
+        self.updates: dict[int, dict[str, Any]] = {} # guild id -> body of the last player update
+        self.player_state: dict[int, dict[str, Any]] = {} # guild id -> every update merged, what lavalink would hold
+        self.sockets: list[web.WebSocketResponse] = []
+        self.app = web.Application()
+        self.app.router.add_get("/v4/decodetrack", self.decodetrack)
+        self.app.router.add_post("/v4/decodetracks", self.decodetracks)
+        self.app.router.add_get("/v4/websocket", self.websocket)
+        self.app.router.add_get("/v4/info", self.info)
+        self.app.router.add_get("/v4/stats", self.stats)
+        self.app.router.add_patch("/v4/sessions/{session}", self.update_session)
+        self.app.router.add_get("/v4/sessions/{session}/players/{guild}", self.get_player)
+        self.app.router.add_patch("/v4/sessions/{session}/players/{guild}", self.update_player)
+        self.app.router.add_delete("/v4/sessions/{session}/players/{guild}", self.destroy_player)
+        self.runner: web.AppRunner | None = None
+
+    @property
+    def uri(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    async def start(self) -> None:
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1] # pyright: ignore
+
+    async def close(self) -> None:
+        """Shuts the node down, connected clients see the websocket close"""
+        for socket in self.sockets:
+            await socket.close()
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def respond(self, data: Any) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.latency)
+        return web.json_response(data)
+
+    async def decodetrack(self, request: web.Request) -> web.Response:
+        return await self.respond(decode_track(request.query["encodedTrack"]))
+
+    async def decodetracks(self, request: web.Request) -> web.Response:
+        encoded: list[str] = await request.json()
+        return await self.respond([decode_track(e) for e in encoded])
+
+    def stats_payload(self, frames: bool) -> dict[str, Any]:
+        return {
+            "players": self.players,
+            "playingPlayers": self.playing,
+            "uptime": 1000,
+            "memory": {"free": 0, "used": 0, "allocated": 0, "reservable": 0},
+            "cpu": {"cores": 4, "systemLoad": self.system_load, "lavalinkLoad": self.system_load / 2},
+            "frameStats": {"sent": 3000 - self.deficit, "nulled": self.nulled, "deficit": self.deficit} if frames else None,
+        }
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self.sockets.append(socket)
+        resumed = self.resuming and request.headers.get("Session-Id") == self.session_id
+        if not resumed:
+            self.sessions += 1
+            self.session_id = f"mock{self.sessions}"
+            self.resuming = False
+            self.player_state.clear()
+        await socket.send_json({"op": "ready", "resumed": resumed, "sessionId": self.session_id})
+        try:
+            while not socket.closed:
+                await socket.send_json({"op": "stats", **self.stats_payload(frames=True)})
+                try:
+                    message = await socket.receive(timeout=self.stats_interval)
+                except asyncio.TimeoutError:
+                    continue
+                if message.type in (aiohttp.WSMsgType.CLOSE, aiohttp.WSMsgType.CLOSING, aiohttp.WSMsgType.CLOSED):
+                    break
+        except ConnectionResetError:
+            pass
+        return socket
+
+    async def info(self, request: web.Request) -> web.Response:
+        return await self.respond({"version": {"semver": "4.0.8"}, "sourceManagers": ["youtube", "http"], "filters": [], "plugins": []})
+
+    async def stats(self, request: web.Request) -> web.Response:
+        return await self.respond(self.stats_payload(frames=False)) # lavalink leaves frame stats out over rest
+
+    async def update_session(self, request: web.Request) -> web.Response:
+        body: dict[str, Any] = await request.json()
+        self.resuming = body.get("resuming", self.resuming)
+        return await self.respond(body)
+
+    def player_payload(self, guild: int) -> dict[str, Any]:
+        state = self.player_state[guild]
+        track = state.get("track")
+        return {
+            "guildId": str(guild),
+            "track": decode_track(track["encoded"]) if track else None,
+            "volume": state.get("volume", 100),
+            "paused": state.get("paused", False),
+            "state": {"time": 0, "position": state.get("position", 0), "connected": True, "ping": 0},
+            "voice": {"token": "", "endpoint": "", "sessionId": ""},
+            "filters": state.get("filters", {}),
+        }
+
+    async def get_player(self, request: web.Request) -> web.Response:
+        guild = int(request.match_info["guild"])
+        if request.match_info["session"] != self.session_id or guild not in self.player_state:
+            self.requests += 1
+            return web.json_response({"status": 404, "error": "Not Found", "message": "Player not found", "path": request.path}, status=404)
+        return await self.respond(self.player_payload(guild))
+
+    async def update_player(self, request: web.Request) -> web.Response:
+        guild = int(request.match_info["guild"])
+        body: dict[str, Any] = await request.json()
+        self.updates[guild] = body
+        state = self.player_state.setdefault(guild, {})
+        if request.query.get("noReplace") == "True" and state.get("track"):
+            body = {k: v for k, v in body.items() if k not in ("track", "position")}
+        state.update(body)
+        return await self.respond(self.player_payload(guild))
+
+    async def destroy_player(self, request: web.Request) -> web.Response:
+        self.updates.pop(int(request.match_info["guild"]), None)
+        self.player_state.pop(int(request.match_info["guild"]), None)
+        self.requests += 1
+        return web.Response(status=204)
+
+    def node(self, session: aiohttp.ClientSession) -> wavelink.Node:
+        """A node pointed at the mock, only usable for REST calls since nothing is connected"""
+        client = SimpleNamespace(user=SimpleNamespace(id=0))
+        return wavelink.Node(uri=self.uri, password="mock", session=session, client=client) # pyright: ignore [reportArgumentType]
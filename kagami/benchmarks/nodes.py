@@ -0,0 +1,84 @@
+"""
+Where new players land across a few mock Lavalink nodes with different loads, and moving players off a node that goes down
+python -m benchmarks.nodes [--players N]
+"""
+import argparse
+import asyncio
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Any
+
+import wavelink
+from wavelink import Playable
+
+from cogs.voice import nodes as lavalink
+from cogs.voice.db import decode_track
+from benchmarks.mock_lavalink import MockLavalink, make_tracks
+
+
+class FakePlayer:
+    """Just what migrate_player touches on a wavelink.Player"""
+    def __init__(self, guild_id: int, node: wavelink.Node, track: Playable) -> None:
+        self.guild = SimpleNamespace(id=guild_id)
+        self._node = node
+        self._voice_state: dict[str, Any] = {"voice": {"session_id": "session", "token": "token", "endpoint": "endpoint"}}
+        self.volume = 100
+        self.paused = False
+        self.filters = wavelink.Filters()
+        self.current = track
+        self.position = 42_000
+
+    @property
+    def node(self) -> wavelink.Node:
+        return self._node
+
+def show(mocks: dict[str, MockLavalink]) -> None:
+    print(f"{'node':>6} {'playing':>8} {'cpu':>5} {'deficit':>8} {'healthy':>8} {'penalty':>9} {'players':>8}")
+    for node in lavalink.lavalink_nodes():
+        mock = mocks[node.identifier]
+        print(f"{node.identifier:>6} {mock.playing:>8} {mock.system_load:>5.2f} {mock.deficit:>8} {str(node.healthy):>8} {node.penalty:>9.1f} {len(node.players):>8}")
+
+async def main(player_count: int) -> None:
+    mocks = {"a": MockLavalink(latency=0), "b": MockLavalink(latency=0), "c": MockLavalink(latency=0)}
+    mocks["a"].playing, mocks["a"].system_load = 2, 0.10
+    mocks["b"].playing, mocks["b"].system_load = 8, 0.05
+    mocks["c"].playing, mocks["c"].system_load, mocks["c"].deficit = 0, 0.05, 300 # idle but dropping frames
+    client = SimpleNamespace(user=SimpleNamespace(id=0), dispatch=lambda *args, **kwargs: None)
+    nodes: list[wavelink.Node] = []
+    for name, mock in mocks.items():
+        await mock.start()
+        nodes.append(lavalink.LavalinkNode(identifier=name, uri=mock.uri, password="mock", client=client, retries=0)) # pyright: ignore [reportArgumentType]
+    await wavelink.Pool.connect(nodes=nodes)
+    await asyncio.sleep(0.1) # the websocket stats with frames come right after ready
+    await lavalink.check_nodes()
+    show(mocks)
+
+    track = Playable(decode_track(make_tracks(1)[0])) # pyright: ignore [reportArgumentType]
+    for guild_id in range(player_count):
+        node = lavalink.best_node()
+        node._players[guild_id] = FakePlayer(guild_id, node, track) # pyright: ignore [reportPrivateUsage, reportArgumentType]
+    print(f"\n{player_count} new players placed: {dict(sorted(Counter(p.node.identifier for n in nodes for p in n.players.values()).items()))}")
+    show(mocks)
+
+    busiest = max(lavalink.lavalink_nodes(), key=lambda n: len(n.players))
+    print(f"\nstopping node {busiest.identifier} with {len(busiest.players)} players")
+    await mocks[busiest.identifier].close()
+    start = time.perf_counter()
+    moved = 0
+    for _ in range(lavalink.NODE_MIGRATE_AFTER):
+        await asyncio.sleep(0.1)
+        moved += await lavalink.check_nodes()
+    elapsed = time.perf_counter() - start
+    resumed = sum(1 for m in mocks.values() for body in m.updates.values() if body.get("position") == 42_000 and body.get("voice"))
+    print(f"moved {moved} players in {elapsed:.2f}s over {lavalink.NODE_MIGRATE_AFTER} checks, {resumed} resumed with their track and voice state")
+    show(mocks)
+    for mock in mocks.values():
+        await mock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.nodes")
+    parser.add_argument("--players", type=int, default=30, help="new players to place")
+    args = parser.parse_args()
+    asyncio.run(main(args.players))
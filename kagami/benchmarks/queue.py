@@ -0,0 +1,95 @@
+"""
+Reordering cost of a long queue, the old list slicing against SessionQueue's BlockList
+python -m benchmarks.queue [track_count ...] [--ops N] [--seed N]
+"""
+import argparse
+import random
+import time
+from collections.abc import Callable
+
+from wavelink import Playable
+
+from cogs.voice.db import decode_track
+from cogs.voice.voice import SessionQueue
+from benchmarks.mock_lavalink import make_tracks
+
+type Op = tuple[str, int, int, int]
+
+
+def make_ops(rng: random.Random, size: int, count: int) -> list[Op]:
+    """(kind, a, b, n) with indices drawn against the queue length, which stays at size since every op is balanced"""
+    ops: list[Op] = []
+    for _ in range(count):
+        kind = rng.choice(["move", "pop_put", "playat", "shift", "page"])
+        ops.append((kind, rng.randrange(size), rng.randrange(size), rng.randint(1, 20)))
+    return ops
+
+def run_list(queue: list[Playable], ops: list[Op]) -> None:
+    """How the commands used to edit queue._items, rebuilding it by slicing and concatenating"""
+    for kind, a, b, n in ops:
+        match kind:
+            case "move":
+                items = queue[a:a + n]
+                queue = queue[:a] + queue[a + n:]
+                queue = queue[:b] + items + queue[b:]
+            case "pop_put":
+                track = queue.pop(a)
+                queue.insert(b, track)
+            case "playat":
+                items = queue[-n:]
+                del queue[-n:]
+                queue = queue[:b] + items + queue[b:]
+            case "shift":
+                items = queue[:n]
+                del queue[:n]
+                queue = items + queue
+            case "page":
+                _ = queue[a:a + 10]
+
+def run_blocks(queue: SessionQueue, ops: list[Op]) -> None:
+    for kind, a, b, n in ops:
+        match kind:
+            case "move":
+                items = queue[a:a + n]
+                del queue[a:a + n]
+                queue.put_many_at(b, items)
+            case "pop_put":
+                queue.move(a, b)
+            case "playat":
+                items = queue[-n:]
+                del queue[-n:]
+                queue.put_many_at(b, items)
+            case "shift":
+                items = queue[:n]
+                del queue[:n]
+                queue.put_many_at(0, items)
+            case "page":
+                _ = queue[a:a + 10]
+
+def timed(fn: Callable[[], object]) -> float:
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.queue")
+    parser.add_argument("sizes", nargs="*", type=int, default=[1_000, 10_000, 50_000])
+    parser.add_argument("--ops", type=int, default=2_000, help="edits per run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"{args.ops} random moves, pops, playats, shifts and page reads per run")
+    print(f"{'tracks':>7} {'list':>10} {'blocklist':>10} {'speedup':>8}")
+    for size in args.sizes:
+        tracks = [Playable(decode_track(e)) for e in make_tracks(size)] # pyright: ignore [reportArgumentType]
+        ops = make_ops(rng, size, args.ops)
+        queue = SessionQueue()
+        queue.put(tracks)
+        list_time = timed(lambda: run_list(list(tracks), ops))
+        block_time = timed(lambda: run_blocks(queue, ops))
+        print(f"{size:>7} {list_time:>9.3f}s {block_time:>9.3f}s {list_time / block_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+"""
+Memory of a big playlist import held as Playables against the TrackRecords SessionQueue keeps, and the cost of hydrating one back
+python -m benchmarks.records [track_count ...]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from wavelink import Playable
+
+from cogs.voice.db import decode_track
+from cogs.voice.voice import SessionQueue
+from benchmarks.mock_lavalink import make_tracks
+
+
+def measure(encoded: list[str], compact: bool) -> tuple[int, list[Playable] | SessionQueue]:
+    """Memory held once every track is queued, the encoded strings themselves are allocated outside the trace"""
+    gc.collect()
+    tracemalloc.start()
+    tracks = [Playable(decode_track(e)) for e in encoded] # pyright: ignore [reportArgumentType]
+    held: list[Playable] | SessionQueue = tracks
+    if compact:
+        held = SessionQueue()
+        held.put(tracks)
+        del tracks
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, held
+
+def main() -> None:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.records")
+    parser.add_argument("sizes", nargs="*", type=int, default=[1_000, 10_000, 50_000])
+    args = parser.parse_args()
+
+    print(f"{'tracks':>7} {'playables':>10} {'records':>10} {'ratio':>6} {'per track':>16} {'hydrate':>9}")
+    for size in args.sizes:
+        encoded = make_tracks(size)
+        full, held = measure(encoded, False)
+        del held
+        compact, queue = measure(encoded, True)
+        assert isinstance(queue, SessionQueue)
+        start = time.perf_counter()
+        while queue:
+            queue.get()
+        hydrate = (time.perf_counter() - start) / size
+        print(f"{size:>7} {full / 1e6:>8.1f}MB {compact / 1e6:>8.1f}MB {full / compact:>5.1f}x "
+              f"{full // size:>6}B -> {compact // size:>4}B {hydrate * 1e6:>7.1f}us")
+
+
+if __name__ == "__main__":
+    main()
@@ -61,6 +61,7 @@ connection_pool_size = get("CONNECTION_POOL_SIZE", int, 5)
 
 lavalink_uri = get("LAVALINK_URI", str)
 lavalink_password = get("LAVALINK_PASSWORD", str)
+lavalink_nodes = get("LAVALINK_NODES", list, list()) # [{"uri": "<uri>", "password": "<password>"}], more nodes to balance players across
 
 ignore_schema_updates = get("IGNORE_SCHEMA_UPDATES", bool, False)
 ignore_trigger_updates = get("IGNORE_TRIGGER_UPDATES", bool, False)
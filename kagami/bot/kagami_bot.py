@@ -44,6 +44,8 @@ class Kagami(commands.Bot):
         self.raw_data = {}
         self.database = None
         self.dbman: DatabaseManager = None
+        self.application_emojis: dict[int, discord.Emoji] = {}
+        self.closing: bool = False # lets cog_unload tell a shutdown apart from an extension reload
         self.changeCmdError()
         self.init_data()
         # self.restart_on_close = False
@@ -66,8 +68,21 @@ class Kagami(commands.Bot):
                                ignore_schema_updates=config.ignore_schema_updates,
                                ignore_trigger_updates=config.ignore_trigger_updates)
 
+        await self.refresh_application_emojis()
         await self.load_all_extensions()
 
+    async def refresh_application_emojis(self) -> None:
+        """
+        Refetches the bot's application emojis into memory
+        Lets cogs react with them without a REST call for each reaction
+        """
+        emojis = await self.fetch_application_emojis()
+        self.application_emojis = {emoji.id: emoji for emoji in emojis}
+        my_logger.info(f"Cached {len(emojis)} application emojis")
+
+    def get_application_emoji(self, emoji_id: int) -> discord.Emoji | None:
+        return self.application_emojis.get(emoji_id, None)
+
     async def load_all_extensions(self):
         for file in os.listdir("cogs"):
             await self.load_cog_extension(file)
@@ -93,6 +108,7 @@ class Kagami(commands.Bot):
         self.run(token=config.token, log_handler=discord_log_handler, log_level=logging.INFO) # Set to info so it isn't nonsense webhook spam
 
     async def close(self):
+        self.closing = True
         for cog in self.cogs:
             cog_obj = self.get_cog(cog)
             await cog_obj.cog_unload()
@@ -5,6 +5,12 @@ from dataclasses import dataclass
 import random
 import math
 import sys
+import functools
+import time
+import heapq
+import itertools
+from collections import deque
+from collections.abc import Awaitable, Callable
 from datetime import datetime, timedelta
 
 import aiosqlite
@@ -13,13 +19,19 @@ from aiosqlite import Connection
 from io import BytesIO
 from PIL import Image, ImageFile
 
+try:
+    import numpy as np
+    np_rng = np.random.default_rng()
+except ImportError: # numpy is optional, only used to speed up rolling large catalogs
+    np = None
+
 import discord
 from discord import CategoryChannel, ForumChannel, app_commands, Message, Guild, channel
 from discord.abc import PrivateChannel
 from discord.app_commands import Choice, Transformer, Transform
 
 from discord.app_commands.models import app_command_option_factory
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord.ext.commands import GroupCog, Cog
 
 from bot import Kagami, config
@@ -27,26 +39,39 @@ from bot import Kagami, config
 from common.interactions import respond
 from common.database import Table, DatabaseManager, ConnectionContext
 from common.tables import Guild, GuildSettings, BotEmoji, User, PersistentSettings
-from common.paginator import Scroller, SimpleCallback, ScrollerState
+from common.paginator import Scroller, SimpleCallback, KeysetCallback, ScrollerState
 
 from common.logging import setup_logging
 from common.utils import acstr
+from common.images import ingest_image, ImageTooLarge, InvalidImage, DownloadFailed
 logger = setup_logging(__name__)
 
 type Interaction = discord.Interaction[Kagami]
 FISHING_WINDOW_DEFAULT = 30
 RECENT_MESSAGE_THRESHOLD_DEFAULT = 1
 REACTION_FADE_DELAY_DEFAULT = 30
+RECENT_MESSAGE_MAX_USERS_DEFAULT = 10_000
+WALLET_FLUSH_INTERVAL_DEFAULT = 60
+WALLET_FLUSH_THRESHOLD_DEFAULT = 500
+IMAGE_MAX_DOWNLOAD_DEFAULT = 8_000_000
 
 # Module Constant importing
 FISHING_WINDOW: int = config.get("SWEDISH_FISHING_WINDOW_SECONDS", int, FISHING_WINDOW_DEFAULT)
 RECENT_MESSAGE_THRESHOLD: int = config.get("SWEDISH_FISHING_WINDOW_MESSAGE_THRESHOLD", int, RECENT_MESSAGE_THRESHOLD_DEFAULT)
 REACTION_FADE_DELAY: int = config.get("SWEDISH_REACTION_FADE_SECONDS", int, REACTION_FADE_DELAY_DEFAULT) # seconds until the reactions fade away
+RECENT_MESSAGE_MAX_USERS: int = config.get("SWEDISH_RECENT_MESSAGE_MAX_USERS", int, RECENT_MESSAGE_MAX_USERS_DEFAULT)
+WALLET_FLUSH_INTERVAL: int = config.get("SWEDISH_WALLET_FLUSH_SECONDS", int, WALLET_FLUSH_INTERVAL_DEFAULT)
+WALLET_FLUSH_THRESHOLD: int = config.get("SWEDISH_WALLET_FLUSH_THRESHOLD", int, WALLET_FLUSH_THRESHOLD_DEFAULT)
+IMAGE_MAX_DOWNLOAD: int = config.get("SWEDISH_IMAGE_MAX_DOWNLOAD_BYTES", int, IMAGE_MAX_DOWNLOAD_DEFAULT)
 f"""
 Environment Variables:
     SWEDISH_FISHING_WINDOW_SECONDS (default={FISHING_WINDOW_DEFAULT}) - The interval that your most recent messages are considered for reduced odds when fishing
     SWEDISH_FISHING_WINDOW_MESSAGE_THRESHOLD (default={RECENT_MESSAGE_THRESHOLD_DEFAULT}) - The maximum number of messages you can send within the window before reduced odds take affect
     SWEDISH_REACTION_FADE_SECONDS (default={REACTION_FADE_DELAY_DEFAULT}) - The number of seconds until fish reactions disapear from messages
+    SWEDISH_RECENT_MESSAGE_MAX_USERS (default={RECENT_MESSAGE_MAX_USERS_DEFAULT}) - The most users whose recent messages are tracked at once, the least recently active are forgotten first
+    SWEDISH_WALLET_FLUSH_SECONDS (default={WALLET_FLUSH_INTERVAL_DEFAULT}) - How often caught fish are written to the wallet table
+    SWEDISH_WALLET_FLUSH_THRESHOLD (default={WALLET_FLUSH_THRESHOLD_DEFAULT}) - The number of pending wallet rows that forces an early write
+    SWEDISH_IMAGE_MAX_DOWNLOAD_BYTES (default={IMAGE_MAX_DOWNLOAD_DEFAULT}) - The largest fish image that will be downloaded, it's shrunk down to emoji size afterwards
 """
 
 @dataclass
@@ -146,15 +171,57 @@ class SwedishFishSettings(Table, schema_version=2, trigger_version=1, index_vers
 
     @classmethod
     async def selectCurrent(cls, db: Connection, guild_id: int, channel_id: int) -> SwedishFishSettings:
-        channel_settings = await SwedishFishSettings(guild_id, channel_id).select(db)
-        guild_settings = await SwedishFishSettings(guild_id, 0).select(db)
-        settings = SwedishFishSettings(guild_id, channel_id)
-        if channel_settings is not None:
-            settings = channel_settings
-        elif guild_settings is not None:
-            settings = guild_settings
+        """The channel's settings, falling back on the guild default and then the table defaults"""
+        query = f"""
+        SELECT * FROM {SwedishFishSettings}
+        WHERE guild_id = :guild_id AND channel_id IN (:channel_id, 0)
+        ORDER BY channel_id = 0
+        LIMIT 1
+        """
+        db.row_factory = SwedishFishSettings.row_factory
+        async with db.execute(query, {"guild_id": guild_id, "channel_id": channel_id}) as cur:
+            res = await cur.fetchone()
+        return res if res is not None else SwedishFishSettings(guild_id, channel_id)
+
+    @property
+    def all_disabled(self) -> bool:
+        return not self.wallet_enabled and not self.reactions_enabled
+
+
+class SwedishFishSettingsCache:
+    """
+    Resolved settings per (guild, channel) so messages don't need the database to find them
+    Anything that changes a guild's settings rows must invalidate that guild
+    """
+    def __init__(self) -> None:
+        self._guilds: dict[int, dict[int, SwedishFishSettings]] = {}
+        self._generations: dict[int, int] = {} # bumped on invalidate so an in flight lookup can't store stale settings
+
+    def __len__(self) -> int:
+        return sum(len(channels) for channels in self._guilds.values())
+
+    def get(self, guild_id: int, channel_id: int) -> SwedishFishSettings | None:
+        channels = self._guilds.get(guild_id, None)
+        return channels.get(channel_id, None) if channels is not None else None
+
+    async def resolve(self, dbman: DatabaseManager, guild_id: int, channel_id: int) -> SwedishFishSettings:
+        settings = self.get(guild_id, channel_id)
+        if settings is not None:
+            return settings
+        generation = self._generations.get(guild_id, 0)
+        async with dbman.conn() as db:
+            settings = await SwedishFishSettings.selectCurrent(db, guild_id, channel_id)
+        if self._generations.get(guild_id, 0) == generation:
+            self._guilds.setdefault(guild_id, {})[channel_id] = settings
         return settings
 
+    def invalidate(self, guild_id: int) -> None:
+        """Guild defaults apply to every channel, so the whole guild is dropped"""
+        self._guilds.pop(guild_id, None)
+        self._generations[guild_id] = self._generations.get(guild_id, 0) + 1
+
+settings_cache = SwedishFishSettingsCache()
+
 def prob_exp(rarity: float) -> float:
     CF = 0.99
     R = random.random() * 0.10 + 0.95
@@ -175,13 +242,42 @@ def prob_fourfifths(rarity: float) -> float:
     R = random.random() * 0.10 + 0.95
     return min(math.pow(rarity, -1.25)* R, 1) * CF
 
+PROB_CF = 0.99
+PROB_JITTER_LOW, PROB_JITTER_HIGH = 0.95, 1.05
+
+def expected_probability(base: float) -> float:
+    """
+    The chance of a single roll succeeding once the jitter from the prob_* functions is averaged out
+    base: the curve value before jitter, ex. rarity^-1.5 for prob_threehalfs
+    Rolling once against this is the same as drawing the jitter and then rolling against the result
+    """
+    lo, hi = PROB_JITTER_LOW, PROB_JITTER_HIGH
+    if base * hi <= 1:
+        mean = base * (lo + hi) / 2
+    elif base * lo >= 1:
+        mean = 1.0
+    else: # the cap of 1 kicks in partway through the jitter range
+        t = 1 / base
+        mean = (base * (t*t - lo*lo) / 2 + (hi - t)) / (hi - lo)
+    return mean * PROB_CF
+
+def threehalfs_base(rarity: float) -> float:
+    return math.pow(rarity, -1.5) if rarity > 0 else math.inf
+
 @dataclass
-class SwedishFish(Table, schema_version=3, trigger_version=1):
+class SwedishFish(Table, schema_version=3, trigger_version=2):
     name: str
     emoji_id: int
     rarity: int=0
 
-    def to_partial_emoji(self) -> discord.PartialEmoji:
+    def to_partial_emoji(self, bot: Kagami | None=None) -> discord.PartialEmoji:
+        """
+        Uses the bot's cached application emoji when given, otherwise builds it from the fish's name
+        Neither case needs the database or a REST call
+        """
+        emoji = bot.get_application_emoji(self.emoji_id) if bot is not None else None
+        if emoji is not None:
+            return discord.PartialEmoji(name=emoji.name, id=emoji.id, animated=emoji.animated)
         return discord.PartialEmoji.from_str(f"{FISH_PREFIX}_{self.name}:{self.emoji_id}")
 
     def probability(self) -> float:
@@ -223,7 +319,35 @@ class SwedishFish(Table, schema_version=3, trigger_version=1):
 
     @classmethod
     async def create_triggers(cls, db: Connection):
-        triggers = [""]
+        # Keeps SwedishFishNetWorth in line with the wallets when a fish's value changes
+        def revalue(old_rarity: str, new_rarity: str) -> str:
+            return f"""
+            UPDATE {SwedishFishNetWorth}
+            SET total = total + ({new_rarity} - {old_rarity}) * (
+                SELECT COALESCE(SUM(fw.count), 0) FROM {SwedishFishWallet} AS fw
+                WHERE fw.fish_name = OLD.name
+                AND fw.user_id = {SwedishFishNetWorth}.user_id
+                AND ({SwedishFishNetWorth}.guild_id = 0 OR fw.guild_id = {SwedishFishNetWorth}.guild_id)
+            )
+            WHERE user_id IN (SELECT user_id FROM {SwedishFishWallet} WHERE fish_name = OLD.name);
+            """
+        triggers = [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {SwedishFish}_revalue_net_worth_after_update
+            AFTER UPDATE OF rarity ON {SwedishFish}
+            WHEN NEW.rarity != OLD.rarity
+            BEGIN
+                {revalue("OLD.rarity", "NEW.rarity")}
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {SwedishFish}_revalue_net_worth_after_delete
+            AFTER DELETE ON {SwedishFish}
+            BEGIN
+                {revalue("OLD.rarity", "0")}
+            END;
+            """
+        ]
         for trigger in triggers:
             await db.execute(trigger)
 
@@ -271,21 +395,6 @@ class SwedishFish(Table, schema_version=3, trigger_version=1):
         res = await db.execute_fetchall(query)
         return res
 
-    @classmethod
-    async def gamble(cls, db: Connection, rarity_weight: int=0) -> list[SwedishFish]:
-        query = f"""
-        SELECT * FROM {SwedishFish}
-        """
-        db.row_factory = SwedishFish.row_factory
-        fish: SwedishFish
-        out: list[SwedishFish] = []
-        async with db.execute(query) as cur:
-            async for fish in cur:
-                fish.rarity += rarity_weight
-                # logger.debug(f"gamble: {fish.name=}, {fish.rarity=}")
-                out.append(fish) if fish.roll() else ...
-        return out
-
     # @classmethod
     # async def gamble(cls, db: Connection) -> list[tuple()]
     #     query = f"""
@@ -312,7 +421,7 @@ class SwedishFish(Table, schema_version=3, trigger_version=1):
         await db.execute(query, (self.name,))
 
 @dataclass
-class SwedishFishWallet(Table, schema_version=5, trigger_version=6):
+class SwedishFishWallet(Table, schema_version=5, trigger_version=7, index_version=1):
     user_id: int
     guild_id: int
     fish_name: str | None
@@ -347,6 +456,15 @@ class SwedishFishWallet(Table, schema_version=5, trigger_version=6):
     @classmethod
     @override
     async def create_triggers(cls, db: aiosqlite.Connection):
+        # Adds a row's value onto its guild's and the global (guild_id = 0) net worth
+        def add_value(row: str, sign: str="") -> str:
+            value = f"{sign}{row}.count * COALESCE((SELECT rarity FROM {SwedishFish} WHERE name = {row}.fish_name), 0)"
+            return f"""
+            INSERT INTO {SwedishFishNetWorth}(guild_id, user_id, total)
+            VALUES ({row}.guild_id, {row}.user_id, {value}), (0, {row}.user_id, {value})
+            ON CONFLICT (guild_id, user_id)
+            DO UPDATE SET total = total + excluded.total;
+            """
         triggers = [
             f"""
             CREATE TRIGGER IF NOT EXISTS {SwedishFishWallet}_insert_settings_before_insert
@@ -355,12 +473,44 @@ class SwedishFishWallet(Table, schema_version=5, trigger_version=6):
                 INSERT OR IGNORE INTO {SwedishFishSettings}(guild_id, channel_id)
                 VALUES (NEW.guild_id, 0);
             END;
-            """
+            """,
             # ON CONFLICT(guild_id, channel_id) DO NOTHING;
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {SwedishFishWallet}_add_net_worth_after_insert
+            AFTER INSERT ON {SwedishFishWallet}
+            BEGIN
+                {add_value("NEW")}
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {SwedishFishWallet}_update_net_worth_after_update
+            AFTER UPDATE ON {SwedishFishWallet}
+            BEGIN
+                {add_value("OLD", "-")}
+                {add_value("NEW")}
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {SwedishFishWallet}_subtract_net_worth_after_delete
+            AFTER DELETE ON {SwedishFishWallet}
+            BEGIN
+                {add_value("OLD", "-")}
+            END;
+            """,
         ]
         for trigger in triggers:
             await db.execute(trigger)
 
+    @classmethod
+    @override
+    async def create_indexes(cls, db: Connection) -> None:
+        # Used by the SwedishFish revalue triggers
+        query = f"""
+        CREATE INDEX IF NOT EXISTS {SwedishFishWallet}_fish_name
+        ON {SwedishFishWallet}(fish_name, user_id)
+        """
+        await db.execute(query)
+
     @override
     async def upsert(self, db: aiosqlite.Connection) -> None:
         query = f"""
@@ -476,6 +626,40 @@ class SwedishFishWallet(Table, schema_version=5, trigger_version=6):
         # logger.debug(f"FishWallet.list(self): {len(list(rows))=}")
         return list(rows)
 
+    async def listAfter(self, db: Connection, after: tuple[int, str] | None, limit: int=10, reverse: bool=False) -> list[aiosqlite.Row]:
+        """
+        Keyset paged version of list, rows come after the (rarity, name) key
+        or before it nearest first when reverse is set, counts are summed per fish
+        """
+        compare, direction = (">", "ASC") if not reverse else ("<", "DESC")
+        query = f"""
+        SELECT 
+            sf.name as name, 
+            be.name as emoji_name,
+            be.id as emoji_id,
+            sf.rarity as rarity,
+            SUM(fw.count) as count,
+            sf.rarity * SUM(fw.count) as total
+        FROM {SwedishFishWallet} AS fw
+        INNER JOIN {SwedishFish} AS sf
+            ON sf.name = fw.fish_name
+        INNER JOIN {BotEmoji} AS be
+            ON sf.emoji_id = be.id
+        WHERE (:guild_id = 0 OR guild_id = :guild_id)
+        AND (:user_id = 0 OR user_id = :user_id)
+        AND (:after_rarity IS NULL OR (sf.rarity, sf.name) {compare} (:after_rarity, :after_name))
+        GROUP BY sf.name
+        ORDER BY sf.rarity {direction}, sf.name {direction}
+        LIMIT :limit
+        """
+        db.row_factory = aiosqlite.Row
+        params = self.asdict()
+        after_rarity, after_name = after if after is not None else (None, None)
+        params.update({"after_rarity": after_rarity, "after_name": after_name, "limit": limit})
+        async with db.execute(query, params) as cur:
+            rows = await cur.fetchall()
+        return list(rows)
+
     async def take(self, db: Connection) -> SwedishFishWallet | None:
         """
         Take a certain number of fish from a wallet
@@ -523,7 +707,20 @@ class SwedishFishWallet(Table, schema_version=5, trigger_version=6):
             # logger.debug(f"wallet give {res=}")
         return res
 
-            
+    @classmethod
+    async def giveMany(cls, db: Connection, rows: list[tuple[int, int, str, int]]) -> None:
+        """
+        Adds counts onto many wallets at once
+        rows: (guild_id, user_id, fish_name, count)
+        """
+        query = f"""
+        INSERT INTO {SwedishFishWallet}(guild_id, user_id, fish_name, count)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (user_id, guild_id, fish_name)
+        DO UPDATE SET count = count + excluded.count
+        """
+        await db.executemany(query, rows)
+
     async def select(self, db: Connection) -> SwedishFishWallet | None:
         """
         Returns an updated version of the current row
@@ -575,7 +772,10 @@ class SwedishFishWallet(Table, schema_version=5, trigger_version=6):
         """
         Gives the net worth of each user as specified by the pseudo row
         Follows similar selection rules from selectAll
+        Reads from SwedishFishNetWorth unless a specific fish is asked for
         """
+        if self.fish_name is None:
+            return await SwedishFishNetWorth.selectTop(db, self.guild_id, self.user_id, limit, offset)
         query = f"""
         SELECT user_id, Sum(fw.count * sf.rarity) as total
         FROM {SwedishFishWallet} as fw
@@ -600,6 +800,8 @@ class SwedishFishWallet(Table, schema_version=5, trigger_version=6):
         Give the total wealth across all users in the pseudo row query
         Follows similar selection rules from selectAll
         """
+        if self.fish_name is None:
+            return await SwedishFishNetWorth.selectTotal(db, self.guild_id)
         query = f"""
         SELECT Sum(fw.count * sf.rarity) as total
         FROM {SwedishFishWallet} as fw
@@ -614,6 +816,189 @@ class SwedishFishWallet(Table, schema_version=5, trigger_version=6):
         return res["total"] if res is not None else 0 
 
 
+@dataclass
+class SwedishFishNetWorth(Table, schema_version=1, index_version=2):
+    """
+    Materialized SUM(count * rarity) per user, kept current by triggers on SwedishFishWallet and SwedishFish
+    guild_id == 0 holds each user's total across all servers
+    """
+    guild_id: int
+    user_id: int
+    total: int=0
+
+    @classmethod
+    @override
+    async def create_table(cls, db: Connection):
+        exists = await cls._exists(db)
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {SwedishFishNetWorth} (
+            guild_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        """
+        await db.execute(query)
+        if not exists:
+            await cls.rebuild(db)
+
+    @classmethod
+    @override
+    async def create_indexes(cls, db: Connection) -> None:
+        query = f"""
+        CREATE INDEX IF NOT EXISTS {SwedishFishNetWorth}_guild_total
+        ON {SwedishFishNetWorth}(guild_id, total DESC, user_id DESC)
+        """
+        await db.execute(query)
+
+    @classmethod
+    @override
+    async def insert_from_temp(cls, db: Connection):
+        # create_table already rebuilt every total from the wallets, copying the old rows would duplicate them
+        pass
+
+    @classmethod
+    async def rebuild(cls, db: Connection) -> None:
+        """Recomputes every total from the wallets"""
+        queries = [
+            f"DELETE FROM {SwedishFishNetWorth}",
+            f"""
+            INSERT INTO {SwedishFishNetWorth}(guild_id, user_id, total)
+            SELECT fw.guild_id, fw.user_id, SUM(fw.count * COALESCE(sf.rarity, 0))
+            FROM {SwedishFishWallet} AS fw
+            LEFT JOIN {SwedishFish} AS sf
+                ON sf.name = fw.fish_name
+            GROUP BY fw.guild_id, fw.user_id
+            """,
+            f"""
+            INSERT INTO {SwedishFishNetWorth}(guild_id, user_id, total)
+            SELECT 0, user_id, SUM(total) FROM {SwedishFishNetWorth}
+            WHERE guild_id != 0
+            GROUP BY user_id
+            """,
+        ]
+        for query in queries:
+            await db.execute(query)
+
+    @classmethod
+    async def selectTop(cls, db: Connection, guild_id: int, user_id: int=0, limit: int=10, offset: int=0) -> list[aiosqlite.Row]:
+        """
+        user_id, total ordered by total
+        guild_id == 0 gives the global ranking
+        """
+        query = f"""
+        SELECT user_id, total FROM {SwedishFishNetWorth}
+        WHERE guild_id = :guild_id
+        AND (:user_id = 0 OR user_id = :user_id)
+        ORDER BY total DESC, user_id DESC
+        LIMIT :limit OFFSET :offset
+        """
+        db.row_factory = aiosqlite.Row
+        params = {"guild_id": guild_id, "user_id": user_id, "limit": limit, "offset": offset}
+        async with db.execute(query, params) as cur:
+            rows = await cur.fetchall()
+        return list(rows)
+
+    @classmethod
+    async def selectTopAfter(cls, db: Connection, guild_id: int, after: tuple[int, int] | None, limit: int=10, reverse: bool=False) -> list[aiosqlite.Row]:
+        """
+        Keyset paged version of selectTop, rows come after the (total, user_id) key in leaderboard order
+        or before it nearest first when reverse is set
+        """
+        compare, direction = ("<", "DESC") if not reverse else (">", "ASC")
+        query = f"""
+        SELECT user_id, total FROM {SwedishFishNetWorth}
+        WHERE guild_id = :guild_id
+        AND (:after_total IS NULL OR (total, user_id) {compare} (:after_total, :after_user_id))
+        ORDER BY total {direction}, user_id {direction}
+        LIMIT :limit
+        """
+        db.row_factory = aiosqlite.Row
+        after_total, after_user_id = after if after is not None else (None, None)
+        params = {"guild_id": guild_id, "after_total": after_total, "after_user_id": after_user_id, "limit": limit}
+        async with db.execute(query, params) as cur:
+            rows = await cur.fetchall()
+        return list(rows)
+
+    @classmethod
+    async def selectTotal(cls, db: Connection, guild_id: int) -> int:
+        query = f"""
+        SELECT SUM(total) AS total FROM {SwedishFishNetWorth}
+        WHERE guild_id = ?
+        """
+        db.row_factory = aiosqlite.Row
+        async with db.execute(query, (guild_id,)) as cur:
+            res = await cur.fetchone()
+        return (res["total"] or 0) if res is not None else 0
+
+    @classmethod
+    async def selectUserCount(cls, db: Connection, guild_id: int) -> int:
+        query = f"""
+        SELECT COUNT(*) AS count FROM {SwedishFishNetWorth}
+        WHERE guild_id = ?
+        """
+        db.row_factory = aiosqlite.Row
+        async with db.execute(query, (guild_id,)) as cur:
+            res = await cur.fetchone()
+        return res["count"] if res is not None else 0
+
+
+class SwedishFishCatalog:
+    """
+    In memory copy of the SwedishFish table so that messages can be gambled on without touching the database
+    Must be refreshed whenever the table changes, the sf dev commands take care of this
+    """
+    NUMPY_THRESHOLD: int = 64 # catalogs at least this large roll with numpy when it is installed
+
+    def __init__(self) -> None:
+        self._fish: tuple[SwedishFish, ...] = ()
+        self._rarities: tuple[int, ...] = ()
+        self._probabilities: dict[int, tuple[float, ...]] = {} # rarity_weight -> probability per fish
+        self._np_probabilities: dict[int, Any] = {}
+
+    def __len__(self) -> int:
+        return len(self._fish)
+
+    @property
+    def fish(self) -> tuple[SwedishFish, ...]:
+        return self._fish
+
+    def load(self, fish: list[SwedishFish]) -> None:
+        self._fish = tuple(fish)
+        self._rarities = tuple(f.rarity for f in self._fish)
+        self._probabilities.clear()
+        self._np_probabilities.clear()
+
+    async def refresh(self, db: Connection) -> None:
+        self.load(await SwedishFish.selectAll(db))
+        logger.debug(f"SwedishFishCatalog - refreshed with {len(self._fish)} fish")
+
+    def probabilities(self, rarity_weight: int=0) -> tuple[float, ...]:
+        """The chance of catching each fish, computed once per weight"""
+        probs = self._probabilities.get(rarity_weight)
+        if probs is None:
+            probs = tuple(expected_probability(threehalfs_base(r + rarity_weight)) for r in self._rarities)
+            self._probabilities[rarity_weight] = probs
+        return probs
+
+    def gamble(self, rarity_weight: int=0) -> list[SwedishFish]:
+        """
+        Rolls every fish in the catalog once, returns the ones that were caught
+        The returned fish are the catalog's own instances so they shouldn't be modified
+        """
+        probs = self.probabilities(rarity_weight)
+        if np is not None and len(probs) >= self.NUMPY_THRESHOLD:
+            np_probs = self._np_probabilities.get(rarity_weight)
+            if np_probs is None:
+                np_probs = self._np_probabilities[rarity_weight] = np.array(probs)
+            draws = np_rng.random(len(probs))
+            return [self._fish[i] for i in np.flatnonzero(draws <= np_probs)]
+        draws = [random.random() for _ in probs]
+        return [fish for fish, p, r in zip(self._fish, probs, draws) if r <= p]
+
+fish_catalog = SwedishFishCatalog()
+
+
 class Transformer_Fish(Transformer):
     async def autocomplete(self, interaction: Interaction, value: str) -> list[Choice[str]]: # pyright: ignore [reportIncompatibleMethodOverride]
         async with interaction.client.dbman.conn() as db:
@@ -633,6 +1018,8 @@ class Transformer_UserFish(Transformer):
         assert interaction.guild is not None
         # logger.debug(f"Transformer_UserFish.autocomplete: Post assertion")
         pseudo = SwedishFishWallet(interaction.user.id, interaction.guild.id, value)
+        if wallet_buffer.has_pending(interaction.user.id, interaction.guild.id): # fish only caught so far are in the buffer
+            await wallet_buffer.flush(interaction.client.dbman)
         async with interaction.client.dbman.conn() as db:
             fishes = await pseudo.selectRowsWithLikeNames(db, limit=25)
         # logger.debug(f"Transformer_UserFish.autocomplete: Got fishes, count: {len(fishes)}")
@@ -650,7 +1037,7 @@ class Transformer_UserFish(Transformer):
                                    value)
         async with interaction.client.dbman.conn() as db:
             fish = await pseudo.select(db)
-        return fish
+        return wallet_buffer.merge(fish, interaction.user.id, interaction.guild.id, value)
 
 class Transformer_UserFishCount[Kagami](Transformer):
     """
@@ -673,6 +1060,7 @@ class Transformer_UserFishCount[Kagami](Transformer):
                                    fish_name)
         async with interaction.client.dbman.conn() as db:
             fish = await pseudo.select(db)
+        fish = wallet_buffer.merge(fish, interaction.user.id, interaction.guild.id, fish_name)
         # logger.debug(f"UserFishCount - autocomplete: {fish=}")
         
         if fish is None:
@@ -706,6 +1094,7 @@ class Transformer_UserFishCount[Kagami](Transformer):
                                    fish_name)
         async with interaction.client.dbman.conn() as db:
             fish = await pseudo.select(db)
+        fish = wallet_buffer.merge(fish, interaction.user.id, interaction.guild.id, fish_name)
         # logger.debug(f"UserFishCount - transform: {fish=}")
         # value = int(value) if isinstance(value, str) and value.isdigit() else 0
         if fish is not None:
@@ -725,6 +1114,17 @@ class Cog_SwedishDev(GroupCog, group_name="sf"):
     async def cog_load(self) -> None:
         pass
 
+    async def read_image(self, interaction: Interaction, image: discord.Attachment) -> bytes | None:
+        """Downloads and shrinks an attached image to emoji size, responds with the reason and returns None if it can't"""
+        if image.size > IMAGE_MAX_DOWNLOAD:
+            await respond(interaction, f"Image is larger than {IMAGE_MAX_DOWNLOAD:,} bytes")
+            return None
+        try:
+            return await ingest_image(image.url, IMAGE_MAX_DOWNLOAD)
+        except (ImageTooLarge, InvalidImage, DownloadFailed) as e:
+            await respond(interaction, f"`{e}`")
+            return None
+
     @app_commands.command(name="add", description="adds a new fish")
     async def add(self, interaction: Interaction, name: Transform[SwedishFish | None, Transformer_Fish], image: discord.Attachment, rarity: int):
         await respond(interaction)
@@ -746,10 +1146,9 @@ class Cog_SwedishDev(GroupCog, group_name="sf"):
             return
 
         new_fish_name = interaction.namespace["name"]
-        # elif image.size > 256_000: # bytes
-        #     await respond(interaction, "Image is larger than 256kB")
-        
-        image_data = await image.read()
+        image_data = await self.read_image(interaction, image)
+        if image_data is None:
+            return
         try:
             emoji = await self.bot.create_application_emoji(name=f"{FISH_PREFIX}_{new_fish_name}", image=image_data)
         except discord.HTTPException as e:
@@ -759,9 +1158,11 @@ class Cog_SwedishDev(GroupCog, group_name="sf"):
         new_fish = SwedishFish(name=new_fish_name, emoji_id=emoji.id, rarity=rarity)
         
         async with self.dbman.conn() as db:
-            await BotEmoji.insertFromDiscord(db, emoji)
+            await BotEmoji.insertFromDiscord(db, emoji, image_data)
             await new_fish.upsert(db)
             await db.commit()
+            await fish_catalog.refresh(db)
+        await self.bot.refresh_application_emojis()
         await respond(interaction, f"Added Swedish Fish: {new_fish_name}")
 
     @app_commands.command(name="edit", description="edits an existing fish")
@@ -770,18 +1171,25 @@ class Cog_SwedishDev(GroupCog, group_name="sf"):
         if fish is None:
             await respond(interaction, "There is no fish with that name")
             return
+        image_data = None
+        if image is not None:
+            image_data = await self.read_image(interaction, image)
+            if image_data is None:
+                return
         async with self.dbman.conn() as db:
-            if image is not None:
+            if image_data is not None:
                 old_emoji = await fish.get_emoji(db)
-                image_data = await image.read()
                 await old_emoji.delete_discord(self.bot)
                 await old_emoji.delete(db)
                 emoji = await self.bot.create_application_emoji(name=f"{FISH_PREFIX}_{fish.name}", image=image_data)
-                await BotEmoji.insertFromDiscord(db, emoji)
+                await BotEmoji.insertFromDiscord(db, emoji, image_data)
                 fish.emoji_id = emoji.id
             fish.rarity = rarity if rarity else fish.rarity
             await fish.upsert(db)
             await db.commit()
+            await fish_catalog.refresh(db)
+        if image is not None:
+            await self.bot.refresh_application_emojis()
 
         await respond(interaction, f"Editted the fish")
 
@@ -794,24 +1202,43 @@ class Cog_SwedishDev(GroupCog, group_name="sf"):
             await respond(interaction, "That fish does not exist")
             return
         
+        await wallet_buffer.flush(self.dbman)
         async with self.dbman.conn() as db:
             await fish.delete(db)
             await BotEmoji.deleteFromID(db, fish.emoji_id)
             await db.commit()
+            await fish_catalog.refresh(db)
+        await self.bot.refresh_application_emojis()
 
         await respond(interaction, f"Deleted fish: {fish.name}")
 
     @app_commands.command(name="list", description="lists the fish in chat")
     async def list(self, interaction: Interaction) -> None:
         await respond(interaction)
-        async with self.dbman.conn() as db:
-            all_fish = await SwedishFish.selectAll(db)
         out: list[str] = []
-        for fish in all_fish:
-            emoji = await (await fish.get_emoji(db)).fetch_discord(self.bot)
+        for fish in fish_catalog.fish:
+            emoji = fish.to_partial_emoji(self.bot)
             out.append(f"{emoji} - {fish.name} - {fish.rarity}")
         await respond(interaction, "\n".join(out))
 
+    @app_commands.command(name="stats", description="shows the memory and queues held by swedish fish")
+    async def stats(self, interaction: Interaction) -> None:
+        await respond(interaction, ephemeral=True)
+        content = f"Recent message tracker: {len(recent_messages)} users, {recent_messages.memory_usage():,} bytes" + \
+                  f"\nPending wallet rows: {len(wallet_buffer)}" + \
+                  f"\nScheduled fishing jobs: {len(fishing_scheduler)}" + \
+                  f"\nMessages tracking boosts: {len(boost_tally)}" + \
+                  f"\nCached channel settings: {len(settings_cache)}"
+        await respond(interaction, content)
+
+    @app_commands.command(name="refresh", description="refetches the application emojis and fish catalog")
+    async def refresh(self, interaction: Interaction) -> None:
+        await respond(interaction, ephemeral=True)
+        await self.bot.refresh_application_emojis()
+        async with self.dbman.conn() as db:
+            await fish_catalog.refresh(db)
+        await respond(interaction, f"Refreshed {len(self.bot.application_emojis)} emojis and {len(fish_catalog)} fish", delete_after=5)
+
 @app_commands.default_permissions(manage_expressions=True)
 class Cog_SwedishGuildAdmin(GroupCog, group_name="fish-admin"):
     def __init__(self, bot: Kagami):
@@ -830,6 +1257,7 @@ class Cog_SwedishGuildAdmin(GroupCog, group_name="fish-admin"):
             current.reactions_enabled = not current.reactions_enabled
             await current.upsert(db)
             await db.commit()
+        settings_cache.invalidate(interaction.guild.id)
         if current.reactions_enabled:
             r = "Reactions have been enabled, you can now see the fish"
         else:
@@ -848,6 +1276,7 @@ class Cog_SwedishGuildAdmin(GroupCog, group_name="fish-admin"):
             current.wallet_enabled = not current.wallet_enabled
             await current.upsert(db)
             await db.commit()
+        settings_cache.invalidate(interaction.guild.id)
         if current.wallet_enabled:
             r = "The wallet has been enabled, you can collect fish again"
         else:
@@ -866,6 +1295,7 @@ class Cog_SwedishGuildAdmin(GroupCog, group_name="fish-admin"):
             current.fade_reactions = not current.fade_reactions
             await current.upsert(db)
             await db.commit()
+        settings_cache.invalidate(interaction.guild.id)
         if current.fade_reactions:
             r = f"Reactions will fade away after `{REACTION_FADE_DELAY}` seconds"
         else:
@@ -884,6 +1314,7 @@ class Cog_SwedishGuildAdmin(GroupCog, group_name="fish-admin"):
             current.reaction_boosting = not current.reaction_boosting
             await current.upsert(db)
             await db.commit()
+        settings_cache.invalidate(interaction.guild.id)
         if current.reaction_boosting:
             r = f"Boosting is enabled, click on fish to help others reel in more"
         else:
@@ -900,6 +1331,7 @@ class Cog_SwedishGuildAdmin(GroupCog, group_name="fish-admin"):
             if settings is not None:
                 await settings.delete(db)
                 await db.commit()
+        settings_cache.invalidate(interaction.guild.id)
         await respond(interaction, f"Cleared settings for the channel, ressetting to guild default", delete_after=5)
 
     @app_commands.command(name="settings", description="Queries the settings for the guild and channel")
@@ -924,76 +1356,240 @@ class Cog_SwedishGuildAdmin(GroupCog, group_name="fish-admin"):
                   f"\nboosting:  ({csr}, {guild_settings.reactions_enabled})"
         await respond(interaction, content, delete_after=10)
 
-class RecentOnly[T]:
-    def __init__(self, window: timedelta) -> None:
-        self._entries: list[tuple[datetime, T]] = []
-        self._window: timedelta = window
+class RecentMessageTracker:
+    """
+    Sliding window of message timestamps per user, used to weigh the odds against spamming
+    Only monotonic timestamps are kept, old ones are evicted from the left of each deque as the window moves
+    Users are kept in least recently active order so the oldest can be dropped once max_users is reached
+    """
+    def __init__(self, window: float, max_users: int) -> None:
+        self.window: float = window
+        self.max_users: int = max_users
+        self._users: dict[int, deque[float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def _evict(self, times: deque[float], now: float) -> None:
+        oldest = now - self.window
+        while times and times[0] < oldest:
+            times.popleft()
+
+    def add(self, user_id: int, now: float | None=None) -> int:
+        """Records a message and returns how many the user has sent within the window, including this one"""
+        now = time.monotonic() if now is None else now
+        times = self._users.pop(user_id, None) # reinserted to move the user to the most recent end
+        if times is None:
+            times = deque()
+            while len(self._users) >= self.max_users:
+                del self._users[next(iter(self._users))]
+        self._evict(times, now)
+        times.append(now)
+        self._users[user_id] = times
+        return len(times)
+
+    def count(self, user_id: int, now: float | None=None) -> int:
+        times = self._users.get(user_id, None)
+        if times is None:
+            return 0
+        self._evict(times, time.monotonic() if now is None else now)
+        return len(times)
 
-    @property
-    def entries(self) -> list[tuple[datetime, T]]:
-        _ = self.pop_old()
-        return self._entries
+    def sweep(self, now: float | None=None) -> int:
+        """Forgets every user without a message inside the window, returns how many were dropped"""
+        oldest = (time.monotonic() if now is None else now) - self.window
+        idle = [user_id for user_id, times in self._users.items() if not times or times[-1] < oldest]
+        for user_id in idle:
+            del self._users[user_id]
+        return len(idle)
 
-    @property
-    def items(self) -> list[T]:
-        _ = self.pop_old()
-        return [item for _, item in self._entries]
+    def memory_usage(self) -> int:
+        """Approximate bytes held by the tracker, each timestamp is a float object"""
+        float_size = sys.getsizeof(0.0)
+        return sys.getsizeof(self._users) + sum(sys.getsizeof(times) + len(times) * float_size for times in self._users.values())
+
+recent_messages = RecentMessageTracker(window=FISHING_WINDOW, max_users=RECENT_MESSAGE_MAX_USERS)
+
+
+class SwedishFishWalletBuffer:
+    """
+    Write behind buffer for fish caught from messages
+    Catches are summed in memory per (guild, user, fish) and written as one transaction
+    either on an interval, once max_pending keys have built up, or when the cog unloads
+    Anything reading a wallet should merge in the pending counts or flush first
+    """
+    def __init__(self, max_pending: int) -> None:
+        self.max_pending: int = max_pending
+        self._pending: dict[tuple[int, int, str], int] = {}
+        self._flushing: dict[tuple[int, int, str], int] = {} # counts taken by a flush that hasn't committed yet
+        self._lock: asyncio.Lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pending)
 
     @property
-    def count(self) -> int:
-        _ = self.pop_old()
-        return len(self._entries)
-
-    def append(self, item: T) -> None:
-        _ = self.pop_old()
-        now = datetime.now()
-        temp = (now, item)
-        self._entries.append(temp)
-
-    def pop_old(self) -> list[tuple[datetime, T]]:
-        """Item and time"""
-        now = datetime.now()
-        total = len(self._entries)
-        for i in range(1, total+1):
-            time, _ = self._entries[total-i]
-            if now - time > self._window:
-                # logger.debug(f"pop_old: found old, age={now-time}")
-                old = self._entries[:total-i+1]
-                self._entries = self._entries[total-i+1:]
-                return old
-        return []
-
-    # def pop_old_items(self) -> list[T]:
-    #     """Item only, no time"""
-    #     now = datetime.now()
-    #     total = len(self._entries)
-    #     for i in range(1, total+1):
-    #         time, _ = self._entries[total-i]
-    #         if now - time > self._window:
-    #             old = self._entries[:total-i+1]
-    #             self._entries = self._entries[total-i+1:]
-    #             return [item for _, item in old]
-    #     return []
-recent_messages: dict[int, RecentOnly[discord.Message]] = {}
-def add_recent_message(message: discord.Message) -> RecentOnly[discord.Message]:
-    # logger.debug(f"add_recent_message: {message.author.name=}")
-    recents = recent_messages.get(message.author.id, None)
-    if recents is None:
-        # logger.debug(f"add_recent_message: recents was None")
-        recents = RecentOnly[discord.Message](timedelta(seconds=FISHING_WINDOW))
-        # logger.debug(f"add_recent_message: created new instance")
-        recent_messages[message.author.id] = recents
-        # logger.debug(f"add_recent_message: updated reference")
-    recents.append(message)
-    # logger.debug(f"add_recent_message: appended message")
-    return recents
-
-def recent_message_count(author: discord.User | discord.Member) -> int:
-    recents = recent_messages.get(author.id, None)
-    if recents is None:
-        recents = RecentOnly[discord.Message](timedelta(seconds=FISHING_WINDOW))
-    # _ = recents.pop_old()
-    return recents.count
+    def is_full(self) -> bool:
+        return len(self._pending) >= self.max_pending
+
+    def add(self, guild_id: int, user_id: int, fish_name: str, count: int=1) -> None:
+        key = (guild_id, user_id, fish_name)
+        self._pending[key] = self._pending.get(key, 0) + count
+
+    def pending_count(self, user_id: int, guild_id: int, fish_name: str) -> int:
+        """guild_id == 0 gives the count across all servers"""
+        if guild_id != 0:
+            key = (guild_id, user_id, fish_name)
+            return self._pending.get(key, 0) + self._flushing.get(key, 0)
+        return sum(count for pending in (self._pending, self._flushing)
+                   for (_, u, f), count in pending.items() if u == user_id and f == fish_name)
+
+    def has_pending(self, user_id: int, guild_id: int) -> bool:
+        """Whether any catch of the user in the guild is still waiting to be written"""
+        return any(g == guild_id and u == user_id for pending in (self._pending, self._flushing) for g, u, _ in pending)
+
+    def merge(self, wallet: SwedishFishWallet | None, user_id: int, guild_id: int, fish_name: str) -> SwedishFishWallet | None:
+        """Adds the pending count onto a wallet row read from the database"""
+        pending = self.pending_count(user_id, guild_id, fish_name)
+        if pending == 0:
+            return wallet
+        if wallet is None:
+            wallet = SwedishFishWallet(user_id, guild_id, fish_name)
+        wallet.count += pending
+        return wallet
+
+    async def flush(self, dbman: DatabaseManager) -> int:
+        """Writes all pending counts, returns the number of rows written"""
+        async with self._lock:
+            if not self._pending:
+                return 0
+            self._flushing, self._pending = self._pending, {}
+            rows = [(guild_id, user_id, fish_name, count) for (guild_id, user_id, fish_name), count in self._flushing.items()]
+            try:
+                async with dbman.conn() as db:
+                    await SwedishFishWallet.giveMany(db, rows)
+                    await db.commit()
+            except Exception:
+                for key, count in self._flushing.items(): # put them back for the next attempt
+                    self._pending[key] = self._pending.get(key, 0) + count
+                raise
+            finally:
+                self._flushing = {}
+        logger.debug(f"SwedishFishWalletBuffer - flushed {len(rows)} wallet rows")
+        return len(rows)
+
+wallet_buffer = SwedishFishWalletBuffer(max_pending=WALLET_FLUSH_THRESHOLD)
+
+
+type ScheduledJob = Callable[[], Awaitable[None]]
+
+class FishingScheduler:
+    """
+    Delayed reaction clears and wallet tallies for fishing messages
+    Jobs sit in one heap ordered by due time and are run in batches by a single loop
+    instead of every message keeping its own sleeping task
+    Jobs are keyed by message id so the ones for a deleted message can be dropped
+    """
+    def __init__(self) -> None:
+        self._heap: list[list[Any]] = [] # [due, seq, message_id, kind, job], job is None once cancelled
+        self._seq = itertools.count()
+        self._by_message: dict[int, list[list[Any]]] = {}
+        self._depth: int = 0
+
+    def __len__(self) -> int:
+        """Number of jobs still waiting to run"""
+        return self._depth
+
+    def schedule(self, delay: float, message_id: int, kind: str, job: ScheduledJob, now: float | None=None) -> None:
+        now = time.monotonic() if now is None else now
+        entry = [now + delay, next(self._seq), message_id, kind, job]
+        heapq.heappush(self._heap, entry)
+        self._by_message.setdefault(message_id, []).append(entry)
+        self._depth += 1
+
+    def cancel(self, message_id: int, kind: str | None=None) -> int:
+        """Drops the waiting jobs of a message, only those of the given kind if one is passed, returns how many were dropped"""
+        entries = self._by_message.get(message_id, None)
+        if entries is None:
+            return 0
+        dropped = 0
+        for entry in entries:
+            if entry[4] is not None and (kind is None or entry[3] == kind):
+                entry[4] = None
+                dropped += 1
+        self._depth -= dropped
+        if all(entry[4] is None for entry in entries):
+            del self._by_message[message_id]
+        return dropped
+
+    def cancel_all(self, kind: str | None=None) -> int:
+        return sum(self.cancel(message_id, kind) for message_id in list(self._by_message))
+
+    def pop_due(self, now: float | None=None) -> list[ScheduledJob]:
+        now = time.monotonic() if now is None else now
+        due: list[ScheduledJob] = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, message_id, _, job = entry = heapq.heappop(self._heap)
+            if job is None:
+                continue
+            entry[4] = None
+            self._depth -= 1
+            due.append(job)
+            entries = self._by_message.get(message_id, None)
+            if entries is not None and all(e[4] is None for e in entries):
+                del self._by_message[message_id]
+        return due
+
+    async def run_due(self, now: float | None=None) -> int:
+        """Runs every job that is due together, returns how many ran"""
+        due = self.pop_due(now)
+        if not due:
+            return 0
+        results = await asyncio.gather(*(job() for job in due), return_exceptions=True)
+        for result in results:
+            if isinstance(result, BaseException):
+                logger.error(f"FishingScheduler - job failed: {result!r}")
+        return len(due)
+
+fishing_scheduler = FishingScheduler()
+
+
+class ReactionBoostTally:
+    """
+    Who has reacted with each caught fish on a fishing message, fed by raw gateway reaction events
+    Only messages waiting on a boosted wallet tally are tracked, they are dropped once tallied
+    Reactions from the ignored users, the author and the bot itself, never count as boosts
+    """
+    def __init__(self) -> None:
+        self._messages: dict[int, tuple[set[int], dict[int, set[int]]]] = {} # message_id: (ignored user_ids, {emoji_id: user_ids})
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def track(self, message_id: int, ignored_ids: set[int], emoji_ids: list[int]) -> None:
+        self._messages[message_id] = (ignored_ids, {emoji_id: set() for emoji_id in emoji_ids})
+
+    def add(self, message_id: int, emoji_id: int, user_id: int) -> None:
+        tracked = self._messages.get(message_id, None)
+        if tracked is None:
+            return
+        ignored_ids, reactions = tracked
+        users = reactions.get(emoji_id, None)
+        if users is not None and user_id not in ignored_ids:
+            users.add(user_id)
+
+    def remove(self, message_id: int, emoji_id: int, user_id: int) -> None:
+        tracked = self._messages.get(message_id, None)
+        if tracked is not None and (users := tracked[1].get(emoji_id, None)) is not None:
+            users.discard(user_id)
+
+    def pop(self, message_id: int) -> dict[int, int]:
+        """Stops tracking the message and gives the number of boosting users per emoji id"""
+        tracked = self._messages.pop(message_id, None)
+        if tracked is None:
+            return {}
+        return {emoji_id: len(users) for emoji_id, users in tracked[1].items()}
+
+boost_tally = ReactionBoostTally()
 
 
 class Cog_SwedishUser(GroupCog, group_name="fish"): 
@@ -1001,6 +1597,26 @@ class Cog_SwedishUser(GroupCog, group_name="fish"):
         self.bot = bot
         self.dbman = bot.dbman
 
+    @override
+    async def cog_load(self) -> None:
+        self.sweep_recent_messages.start()
+        self.flush_wallets.start()
+        self.run_scheduled.start()
+
+    @override
+    async def cog_unload(self) -> None:
+        self.sweep_recent_messages.cancel()
+        self.flush_wallets.cancel()
+        self.run_scheduled.cancel()
+        fishing_scheduler.cancel_all("clear")
+        await fishing_scheduler.run_due(math.inf) # tallies still waiting on their window are counted now rather than lost
+        await wallet_buffer.flush(self.dbman)
+
+    @tasks.loop(seconds=FISHING_WINDOW * 10)
+    async def sweep_recent_messages(self) -> None:
+        dropped = recent_messages.sweep()
+        logger.debug(f"sweep_recent_messages: dropped {dropped} idle users, tracking {len(recent_messages)} ({recent_messages.memory_usage()} bytes)")
+
     # def count_recent_messages(self, message: discord.Message) -> int:
     #     now = datetime.now()
     #     oldest = now - timedelta(seconds=REACTION_FADE_DELAY)
@@ -1012,57 +1628,85 @@ class Cog_SwedishUser(GroupCog, group_name="fish"):
             return
         assert message.guild is not None
         # logger.debug("on_message: enter")
-        async with self.dbman.conn() as db:
-            settings = await SwedishFishSettings.selectCurrent(db, message.guild.id, message.channel.id)
-            # logger.debug(f"on_message: settings: {settings}")
-            #  or default_settings
-            recents = add_recent_message(message)
-            if recents.count > RECENT_MESSAGE_THRESHOLD:
-                weight = recents.count - RECENT_MESSAGE_THRESHOLD
-                # logger.debug(f"on_message: over threshold, {weight=}")
+        recent_count = recent_messages.add(message.author.id) # every message counts towards the spam weight, even where fishing is off
+        settings = await settings_cache.resolve(self.dbman, message.guild.id, message.channel.id)
+        # logger.debug(f"on_message: settings: {settings}")
+        if settings.all_disabled:
+            return
+        if recent_count > RECENT_MESSAGE_THRESHOLD:
+            weight = recent_count - RECENT_MESSAGE_THRESHOLD
+            # logger.debug(f"on_message: over threshold, {weight=}")
+        else:
+            weight = 0
+        successes = fish_catalog.gamble(weight)
+        assert self.bot.user is not None
+        fading = settings.reactions_enabled and settings.fade_reactions and message.author != self.bot.user
+        if settings.wallet_enabled and fading and settings.reaction_boosting and successes:
+            # tracked before the bot reacts so nobody reacting straight away is missed
+            boost_tally.track(message.id, {message.author.id, self.bot.user.id}, [s.emoji_id for s in successes])
+
+        # logger.debug(f"on_message: success_count: {len(successes)}")
+        if settings.reactions_enabled and message.author != self.bot.user:
+            # logger.debug(f"on_message: reactions_enabled")
+            for s in successes:
+                try:
+                    await message.add_reaction(s.to_partial_emoji(self.bot))
+                    # logger.debug(f"on_message: added reaction: {emoji.name}")
+                except discord.HTTPException as e:
+                    logger.error(f"Discord emoji for swedish fish {s.name} with id {s.emoji_id} could not be added as a reaction") 
+            if settings.fade_reactions and successes:
+                fishing_scheduler.schedule(REACTION_FADE_DELAY, message.id, "clear", functools.partial(self.clear_reactions, message, successes))
+
+        if settings.wallet_enabled and successes: # Wallet tallied after the window has elapsed
+            # logger.debug(f"on_message: wallet enabled")
+            tally = functools.partial(self.tally_wallet, message.id, message.guild.id, message.author.id, successes)
+            if fading:
+                fishing_scheduler.schedule(max(REACTION_FADE_DELAY, FISHING_WINDOW), message.id, "tally", tally)
             else:
-                weight = 0
-            successes = await SwedishFish.gamble(db, weight)
-            
-            # logger.debug(f"on_message: success_count: {len(successes)}")
-            if settings.reactions_enabled and message.author != self.bot.user:
-                # logger.debug(f"on_message: reactions_enabled")
-                for s in successes:
-                    bot_emoji = await s.get_emoji(db)
-                    try:
-                        emoji = await bot_emoji.fetch_discord(self.bot)
-                        await message.add_reaction(emoji)
-                        # logger.debug(f"on_message: added reaction: {emoji.name}")
-                    except discord.HTTPException as e:
-                        logger.error(f"Discord emoji for swedish fish {s.name} with id {s.emoji_id} could not be retrieved") 
-                if settings.fade_reactions:
-                    await asyncio.sleep(REACTION_FADE_DELAY)
-                    try:
-                        for s in successes:
-                            partial_emoji = s.to_partial_emoji()
-                            await message.clear_reaction(partial_emoji)
-                    except discord.Forbidden as e:
-                        pass
-                    if (delta:= FISHING_WINDOW - REACTION_FADE_DELAY) > 0:
-                        await asyncio.sleep(delta)
-
-            if settings.wallet_enabled: # Wallet tallied after the window has elapsed
-                # logger.debug(f"on_message: wallet enabled")
-                for s in successes:
-                    default = SwedishFishWallet(message.author.id, message.guild.id, s.name)
-                    old = await default.select(db) or default
-                    # logger.debug(f"on_message: old: {old}")
-                    old.count += 1 
-                    if settings.reactions_enabled and settings.reaction_boosting:
-                        # reaction = discord.utils.find(lambda r: not isinstance(r.emoji, str) and r.emoji.id == s.emoji_id, message.reactions)
-                        reaction = next((reaction for reaction in message.reactions if not isinstance(reaction.emoji, str) and reaction.emoji.id == s.emoji_id), None)
-                        if reaction:
-                            async for user in reaction.users():
-                                if user != message.author:
-                                    old.count += 1
-                    await old.upsert(db)
-                    # logger.debug("on_message: upserted increment")
-                await db.commit()
+                await tally()
+
+    async def clear_reactions(self, message: discord.Message, successes: list[SwedishFish]) -> None:
+        try:
+            for s in successes:
+                partial_emoji = s.to_partial_emoji(self.bot)
+                await message.clear_reaction(partial_emoji)
+        except (discord.Forbidden, discord.NotFound) as e:
+            pass
+
+    async def tally_wallet(self, message_id: int, guild_id: int, author_id: int, successes: list[SwedishFish]) -> None:
+        boosts = boost_tally.pop(message_id)
+        for s in successes:
+            count = 1 + boosts.get(s.emoji_id, 0)
+            wallet_buffer.add(guild_id, author_id, s.name, count)
+        if wallet_buffer.is_full:
+            await wallet_buffer.flush(self.dbman)
+
+    @tasks.loop(seconds=1)
+    async def run_scheduled(self) -> None:
+        await fishing_scheduler.run_due()
+
+    @GroupCog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent) -> None:
+        if payload.emoji.id is not None:
+            boost_tally.add(payload.message_id, payload.emoji.id, payload.user_id)
+
+    @GroupCog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent) -> None:
+        if payload.emoji.id is not None:
+            boost_tally.remove(payload.message_id, payload.emoji.id, payload.user_id)
+
+    @GroupCog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent) -> None:
+        fishing_scheduler.cancel(payload.message_id, "clear")
+
+    @GroupCog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent) -> None:
+        for message_id in payload.message_ids:
+            fishing_scheduler.cancel(message_id, "clear")
+
+    @tasks.loop(seconds=WALLET_FLUSH_INTERVAL)
+    async def flush_wallets(self) -> None:
+        await wallet_buffer.flush(self.dbman)
 
 
     # @GroupCog.listener()
@@ -1158,6 +1802,7 @@ class Cog_SwedishUser(GroupCog, group_name="fish"):
             await respond(interaction, "You cannot give away fish you do not have", ephemeral=True, delete_after=5)  
             return
         request = SwedishFishWallet.from_member(interaction.user, fish.fish_name, quantity)
+        await wallet_buffer.flush(self.dbman) # take works off the stored count
         async with interaction.client.dbman.conn() as db:
             taken = await request.take(db)
             if taken is None:
@@ -1173,7 +1818,7 @@ class Cog_SwedishUser(GroupCog, group_name="fish"):
             await db.commit()
         await respond(interaction, f"Gave {given.count} {given.fish_name} fish to {user.name}", ephemeral=True, delete_after=3)
 
-    class WalletCallback(SimpleCallback[aiosqlite.Row]):
+    class WalletCallback(KeysetCallback[aiosqlite.Row, tuple[int, str]]):
         def __init__(self, user_id: int, guild_id: int) -> None:
             super().__init__(user_id=user_id, guild_id=guild_id)
 
@@ -1182,8 +1827,12 @@ class Cog_SwedishUser(GroupCog, group_name="fish"):
             return await SwedishFishWallet(user_id, guild_id, None).selectUniqueFishCount(db)
 
         @override
-        async def get_items(self, db: Connection, interaction: Interaction, state: ScrollerState, *args: Any, user_id: int, guild_id: int, **kwargs: Any) -> list[aiosqlite.Row]:
-            return await SwedishFishWallet(user_id, guild_id, None).list(db, self.PAGE_ITEM_COUNT, self.item_offset)
+        def item_key(self, item: aiosqlite.Row) -> tuple[int, str]:
+            return item["rarity"], item["name"]
+
+        @override
+        async def get_items_after(self, db: Connection, interaction: Interaction, state: ScrollerState, key: tuple[int, str] | None, limit: int, reverse: bool, *args: Any, user_id: int, guild_id: int, **kwargs: Any) -> list[aiosqlite.Row]:
+            return await SwedishFishWallet(user_id, guild_id, None).listAfter(db, key, limit, reverse)
 
         @override
         async def item_formatter(self, db: Connection, interaction: Interaction, state: ScrollerState, index: int, row: aiosqlite.Row, *args: Any, **kwargs: Any) -> str:
@@ -1211,6 +1860,7 @@ class Cog_SwedishUser(GroupCog, group_name="fish"):
         assert interaction.channel is not None
         guild_id = 0 if all_servers else interaction.guild.id
         user_id = user.id if user is not None else interaction.user.id
+        await wallet_buffer.flush(self.dbman)
         scroller = Scroller(message, interaction.user, Cog_SwedishUser.WalletCallback(user_id, guild_id))
         await scroller.update(interaction)
         # async with self.dbman.conn() as db:
@@ -1233,18 +1883,21 @@ class Cog_SwedishUser(GroupCog, group_name="fish"):
         # await respond(interaction, content)
 
 
-    class TopBalanceCallback(SimpleCallback[aiosqlite.Row]):
+    class TopBalanceCallback(KeysetCallback[aiosqlite.Row, tuple[int, int]]):
         def __init__(self, guild_id: int) -> None:
             super().__init__(guild_id=guild_id)
 
         @override
         async def get_total_item_count(self, db: Connection, interaction: Interaction, state: ScrollerState, *args: Any, guild_id: int, **kwargs: Any) -> int:
-            return await SwedishFishWallet(guild_id=guild_id, fish_name=None, user_id=0).selectUserCount(db)
+            return await SwedishFishNetWorth.selectUserCount(db, guild_id)
+
+        @override
+        def item_key(self, item: aiosqlite.Row) -> tuple[int, int]:
+            return item["total"], item["user_id"]
 
         @override
-        async def get_items(self, db: Connection, interaction: Interaction, state: ScrollerState, *args: Any, guild_id: int, **kwargs: Any) -> list[aiosqlite.Row]:
-            assert interaction.guild_id is not None
-            return await SwedishFishWallet(0, guild_id, None).netValue(db, self.PAGE_ITEM_COUNT, self.item_offset)
+        async def get_items_after(self, db: Connection, interaction: Interaction, state: ScrollerState, key: tuple[int, int] | None, limit: int, reverse: bool, *args: Any, guild_id: int, **kwargs: Any) -> list[aiosqlite.Row]:
+            return await SwedishFishNetWorth.selectTopAfter(db, guild_id, key, limit, reverse)
 
         ROW_FORMAT = "{} - {} {}"
         NAME_LENGTH = 32
@@ -1274,6 +1927,7 @@ class Cog_SwedishUser(GroupCog, group_name="fish"):
         assert interaction.guild is not None
         assert interaction.channel is not None
         guild_id = 0 if all_servers else interaction.guild.id
+        await wallet_buffer.flush(self.dbman)
         scroller = Scroller(message, interaction.user, Cog_SwedishUser.TopBalanceCallback(guild_id))
         await scroller.update(interaction)
         
@@ -1311,6 +1965,8 @@ async def setup(bot: Kagami) -> None:
     await bot.add_cog(Cog_SwedishGuildAdmin(bot))
     await bot.add_cog(Cog_SwedishDev(bot))
     await bot.dbman.setup(__name__)
+    async with bot.dbman.conn() as db:
+        await fish_catalog.refresh(db)
 
 
 
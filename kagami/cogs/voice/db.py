@@ -1,12 +1,21 @@
 from __future__ import annotations
 from typing import ClassVar, override, Any, cast, Annotated
 from enum import Flag, Enum, IntEnum, IntFlag, auto
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import struct
+import time
+import zlib
 import aiosqlite
 from aiosqlite import Connection
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from wavelink import Playable, Playlist, Node
 
 from discord import guild
+from common.blocklist import BlockList
 from common.database import Table, DatabaseManager
 from common.errors import CustomCheck
 from common.logging import setup_logging
@@ -14,6 +23,110 @@ from common.tables import Guild, GuildSettings, User
 
 logger = setup_logging(__name__)
 
+DECODE_CHUNK_SIZE = 100 # tracks per POST /v4/decodetracks
+DECODE_CONCURRENCY = 4 # decodetracks requests in flight at once
+
+SNAPSHOT_VERSION = 1
+SNAPSHOT_HEADER = ">BII" # version, history_count, upcoming_count
+SNAPSHOT_KEEP = 3 # saved sessions kept per guild
+SNAPSHOT_MAX_TRACKS = 100_000 # bound on what a snapshot is allowed to unpack to
+
+
+class _TrackReader:
+    """Reads the java DataInput encoding lavaplayer uses for encoded tracks"""
+    def __init__(self, data: bytes) -> None:
+        self.data: bytes = data
+        self.pos: int = 0
+
+    def read(self, fmt: str) -> Any:
+        value = struct.unpack_from(fmt, self.data, self.pos)[0]
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def read_utf(self) -> str:
+        length = self.read(">H")
+        raw = self.data[self.pos:self.pos + length]
+        if len(raw) != length:
+            raise ValueError("String runs past the end of the track")
+        self.pos += length
+        # modified utf-8, nulls are two bytes and characters outside the BMP are written as surrogate pairs
+        return raw.replace(b"\xc0\x80", b"\x00").decode("utf-8", "surrogatepass").encode("utf-16", "surrogatepass").decode("utf-16")
+
+    def read_nullable_utf(self) -> str | None:
+        return self.read_utf() if self.read(">?") else None
+
+
+def decode_track(encoded: str) -> dict[str, Any] | None:
+    """
+    Decodes a lavalink encoded track locally into the same payload GET /v4/decodetrack gives back
+    pluginInfo can't be recovered this way and is left empty
+    Returns None if the track can't be read, those should be decoded by lavalink instead
+    """
+    try:
+        data = base64.b64decode(encoded, validate=True)
+        header = struct.unpack_from(">I", data)[0]
+        flags, size = header >> 30, header & 0x3FFFFFFF
+        body = data[4:4 + size]
+        if len(body) != size:
+            return None
+        reader = _TrackReader(body)
+        version = reader.read(">B") if flags & 1 else 1
+        if version > 3:
+            return None
+        title = reader.read_utf()
+        author = reader.read_utf()
+        length = reader.read(">q")
+        identifier = reader.read_utf()
+        is_stream = reader.read(">?")
+        uri = reader.read_nullable_utf() if version >= 2 else None
+        artwork_url = reader.read_nullable_utf() if version >= 3 else None
+        isrc = reader.read_nullable_utf() if version >= 3 else None
+        source_name = reader.read_utf()
+        position = struct.unpack_from(">q", body, size - 8)[0] # source managers can write their own fields before it
+    except (binascii.Error, struct.error, ValueError):
+        return None
+    return {
+        "encoded": encoded,
+        "info": {
+            "identifier": identifier,
+            "isSeekable": not is_stream,
+            "author": author,
+            "length": length,
+            "isStream": is_stream,
+            "position": position,
+            "title": title,
+            "uri": uri,
+            "artworkUrl": artwork_url,
+            "isrc": isrc,
+            "sourceName": source_name,
+        },
+        "pluginInfo": {},
+        "userData": {},
+    }
+
+async def decode_tracks(node: Node, encoded_tracks: list[str], local: bool=True,
+                        chunk_size: int=DECODE_CHUNK_SIZE, concurrency: int=DECODE_CONCURRENCY) -> list[Playable | None]:
+    """
+    Decodes many tracks, one entry per encoded track in the same order, None for a track that couldn't be decoded
+    Tracks are rebuilt locally when possible, the rest go to POST /v4/decodetracks in chunks with a few requests at a time
+    """
+    payloads: list[dict[str, Any] | None] = [decode_track(e) for e in encoded_tracks] if local else [None] * len(encoded_tracks)
+    missing = [i for i, payload in enumerate(payloads) if payload is None]
+    if missing:
+        semaphore = asyncio.Semaphore(concurrency)
+        async def decode_chunk(indices: list[int]) -> None:
+            async with semaphore:
+                data = await node.send("POST", path="v4/decodetracks", data=[encoded_tracks[i] for i in indices]) # pyright: ignore [reportAny]
+            if len(data) != len(indices): # pyright: ignore [reportAny]
+                logger.warning(f"decode_tracks - lavalink decoded {len(data)} of {len(indices)} tracks, leaving the chunk undecoded") # pyright: ignore [reportAny]
+                return
+            for i, payload in zip(indices, data): # pyright: ignore [reportAny]
+                payloads[i] = payload
+        chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+        await asyncio.gather(*(decode_chunk(chunk) for chunk in chunks))
+        logger.debug(f"decode_tracks - {len(missing)} of {len(encoded_tracks)} tracks decoded by lavalink in {len(chunks)} requests")
+    return [Playable(payload) if payload is not None else None for payload in payloads] # pyright: ignore [reportArgumentType]
+
 @dataclass
 class MusicSettings(Table, schema_version=1, trigger_version=1, table_group=__package__):
     guild_id: int
@@ -188,7 +301,11 @@ class TrackListDetails(Table, schema_version=1, trigger_version=4, table_group=_
 
 
 @dataclass
-class TrackList(Table, schema_version=1, trigger_version=3, table_group=__package__):
+class TrackList(Table, schema_version=1, trigger_version=4, table_group=__package__):
+    """
+    Negative indices are only used while a whole list is being rewritten by replaceAll,
+    the index shifting triggers ignore them so bulk writes don't shift the rest of the list once per row
+    """
     guild_id: int
     name: str
     idx: int # starting at 0, represents order in playlist
@@ -213,6 +330,8 @@ class TrackList(Table, schema_version=1, trigger_version=3, table_group=__packag
 
     async def to_wavelink(self, node: Node) -> Playable:
         # logger.debug("to_wavelink - enter") # debug-dev
+        if (data := decode_track(self.encoded)) is not None:
+            return Playable(data) # pyright: ignore [reportArgumentType]
         data = await node.send(path="v4/decodetrack", params={"encodedTrack": self.encoded}) # pyright: ignore [reportAny]
         # sends a request to the REST endpoint on lavalink to decode the track, analogous to `GET /v4/decodetrack?encodedTrack=<BASE64>`
         # logger.debug("to_wavelink - exit") # debug-dev
@@ -220,8 +339,47 @@ class TrackList(Table, schema_version=1, trigger_version=3, table_group=__packag
 
     @classmethod
     async def insert_wavelink_tracks(cls, db: Connection, tracks: list[Playable], guild_id: int, name: str) -> None:
-        for i, track in enumerate(tracks):
-            await TrackList.from_wavelink(track, guild_id, name, i).insert(db)
+        await cls.replaceAll(db, guild_id, name, [track.encoded for track in tracks])
+
+    @classmethod
+    async def replaceAll(cls, db: Connection, guild_id: int, name: str, encoded_tracks: list[str]) -> None:
+        """
+        Replaces every track in the list in O(n), the shift triggers are sidestepped by staging rows at negative indices
+        Raises ValueError if the indices don't come out as 0..n-1, the caller should roll back
+        """
+        params = {"guild_id": guild_id, "name": name}
+        await cls.deleteAll(db, guild_id, name)
+        query = f"""
+        INSERT INTO {TrackList} (guild_id, name, idx, encoded)
+        VALUES (?, ?, ?, ?)
+        """
+        await db.executemany(query, ((guild_id, name, -1 - i, encoded) for i, encoded in enumerate(encoded_tracks)))
+        await db.execute(f"UPDATE {TrackList} SET idx = -1 - idx WHERE guild_id = :guild_id AND name = :name AND idx < 0", params)
+        if not await cls.isContiguous(db, guild_id, name, len(encoded_tracks)):
+            raise ValueError(f"TrackList {guild_id}/{name} indices are not contiguous after replacing {len(encoded_tracks)} tracks")
+
+    @classmethod
+    async def deleteAll(cls, db: Connection, guild_id: int, name: str) -> None:
+        """Empties the list in O(n), rows are moved to negative indices first so deleting them doesn't shift the rest"""
+        params = {"guild_id": guild_id, "name": name}
+        queries = [
+            f"UPDATE {TrackList} SET idx = -1 - idx WHERE guild_id = :guild_id AND name = :name AND idx >= 0",
+            f"DELETE FROM {TrackList} WHERE guild_id = :guild_id AND name = :name AND idx < 0",
+        ]
+        for query in queries:
+            await db.execute(query, params)
+
+    @classmethod
+    async def isContiguous(cls, db: Connection, guild_id: int, name: str, count: int | None=None) -> bool:
+        """Whether the list's indices run 0..n-1 with no gaps, and there are count of them if given"""
+        query = f"""
+        SELECT COUNT(*), COALESCE(MIN(idx), 0), COALESCE(MAX(idx), -1) FROM {TrackList}
+        WHERE guild_id = ? AND name = ?
+        """
+        db.row_factory = None
+        async with db.execute(query, (guild_id, name)) as cur:
+            total, lowest, highest = await cur.fetchone() # pyright: ignore [reportGeneralTypeIssues]
+        return lowest == 0 and highest == total - 1 and (count is None or total == count)
 
     @override
     @classmethod
@@ -246,6 +404,7 @@ class TrackList(Table, schema_version=1, trigger_version=3, table_group=__packag
             f"""
             CREATE TRIGGER IF NOT EXISTS {TrackList}_shift_indices_after_insert
             AFTER INSERT ON {TrackList}
+            WHEN NEW.idx >= 0
             BEGIN
                 UPDATE {TrackList}
                 SET idx = idx + 1
@@ -256,6 +415,7 @@ class TrackList(Table, schema_version=1, trigger_version=3, table_group=__packag
             f"""
             CREATE TRIGGER IF NOT EXISTS {TrackList}_shift_indices_after_delete
             AFTER DELETE ON {TrackList}
+            WHEN OLD.idx >= 0
             BEGIN
                 UPDATE {TrackList}
                 SET idx = idx - 1
@@ -265,6 +425,7 @@ class TrackList(Table, schema_version=1, trigger_version=3, table_group=__packag
             f"""
             CREATE TRIGGER IF NOT EXISTS {TrackList}_shift_indices_after_update
             AFTER UPDATE OF idx ON {TrackList}
+            WHEN OLD.idx >= 0 AND NEW.idx >= 0
             BEGIN
                 UPDATE {TrackList}
                 SET idx = idx + 1
@@ -361,23 +522,487 @@ class TrackList(Table, schema_version=1, trigger_version=3, table_group=__packag
         logger.debug("selectAllWavelink - enter") # debug-dev
         tracks: list[TrackList] = await cls.selectAllWhere(db, guild_id, name)
         logger.debug(f"selectAllWavelink - {len(tracks)=}") # debug-dev
-        playable_tracks: list[Playable] = []
-        for track in tracks:
-            playable_tracks += [await track.to_wavelink(node)]
+        playable_tracks = [t for t in await decode_tracks(node, [track.encoded for track in tracks]) if t is not None]
         logger.debug(f"selectAllWavelink - {len(playable_tracks)=}") # debug-dev
         return playable_tracks
 
     @classmethod
-    async def deleteWhere(cls, db: Connection, guild_id: int, name: str, idx: int) -> TrackList:
+    async def deleteWhere(cls, db: Connection, guild_id: int, name: str, idx: int) -> TrackList | None:
         query = f"""
-        SELECT * FROM {TrackList}
+        DELETE FROM {TrackList}
         WHERE guild_id = ? AND name = ? and idx = ?
         RETURNING *
         """
+        db.row_factory = TrackList.row_factory # pyright: ignore[reportAttributeAccessIssue]
         async with db.execute(query, (guild_id, name, idx)) as cur:
-            res: TrackList = await cur.fetchone() # pyright: ignore [reportAssignmentType]
+            res: TrackList | None = await cur.fetchone() # pyright: ignore [reportAssignmentType]
+        return res
+
+
+@dataclass
+class SnapshotTrack(Table, schema_version=1, trigger_version=1, table_group=__package__):
+    """
+    Per guild dictionary of encoded tracks referenced by SessionSnapshot
+    A track that shows up in several snapshots, or several times in one, is stored once
+    """
+    guild_id: int
+    id: int
+    digest: str # blake2b of encoded, what tracks are deduplicated on
+    encoded: str
+
+    @staticmethod
+    def hash_encoded(encoded: str) -> str:
+        return hashlib.blake2b(encoded.encode(), digest_size=16).hexdigest()
+
+    @override
+    @classmethod
+    async def create_table(cls, db: Connection):
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {SnapshotTrack}(
+            guild_id INTEGER NOT NULL,
+            id INTEGER PRIMARY KEY,
+            digest TEXT NOT NULL,
+            encoded TEXT NOT NULL,
+            UNIQUE (guild_id, digest),
+            FOREIGN KEY (guild_id) REFERENCES {Guild}(id)
+                ON UPDATE CASCADE ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+        )
+        """
+        await db.execute(query)
+
+    @classmethod
+    async def storeMany(cls, db: Connection, guild_id: int, encoded_tracks: list[str]) -> dict[str, int]:
+        """Adds any tracks the guild's dictionary doesn't have yet, returns the id of every given track"""
+        digests = {encoded: cls.hash_encoded(encoded) for encoded in encoded_tracks}
+        query = f"""
+        INSERT OR IGNORE INTO {SnapshotTrack} (guild_id, digest, encoded)
+        VALUES (?, ?, ?)
+        """
+        await db.executemany(query, ((guild_id, digest, encoded) for encoded, digest in digests.items()))
+        query = f"""
+        SELECT digest, id FROM {SnapshotTrack}
+        WHERE guild_id = ? AND digest IN (SELECT value FROM json_each(?))
+        """
+        db.row_factory = None
+        async with db.execute(query, (guild_id, json.dumps(list(digests.values())))) as cur:
+            ids: dict[str, int] = {digest: id for digest, id in await cur.fetchall()}
+        return {encoded: ids[digest] for encoded, digest in digests.items()}
+
+    @classmethod
+    async def selectMany(cls, db: Connection, guild_id: int, ids: set[int]) -> dict[int, str]:
+        query = f"""
+        SELECT id, encoded FROM {SnapshotTrack}
+        WHERE guild_id = ? AND id IN (SELECT value FROM json_each(?))
+        """
+        db.row_factory = None
+        async with db.execute(query, (guild_id, json.dumps(list(ids)))) as cur:
+            return {id: encoded for id, encoded in await cur.fetchall()}
+
+    @classmethod
+    async def deleteUnused(cls, db: Connection, guild_id: int, used_ids: set[int]) -> int:
+        """Drops the guild's tracks no snapshot refers to anymore, returns how many were removed"""
+        query = f"""
+        DELETE FROM {SnapshotTrack}
+        WHERE guild_id = ? AND id NOT IN (SELECT value FROM json_each(?))
+        """
+        async with db.execute(query, (guild_id, json.dumps(list(used_ids)))) as cur:
+            return cur.rowcount
+
+
+@dataclass
+class SessionSnapshot(Table, schema_version=1, trigger_version=1, table_group=__package__):
+    """
+    A whole saved queue in one row, history and upcoming tracks are packed into data as SnapshotTrack ids
+    data is zlib compressed: a header of (version, history_count, upcoming_count) then one id per track
+    Only the newest SNAPSHOT_KEEP snapshots of each guild are kept
+    """
+    guild_id: int
+    name: str # epoch seconds of when the session was saved, same as session TrackLists
+    start_index: int # index of the track that was playing, counted from the start of history
+    track_count: int
+    data: bytes
+
+    @staticmethod
+    def pack(history_ids: list[int], upcoming_ids: list[int]) -> bytes:
+        ids = history_ids + upcoming_ids
+        raw = struct.pack(SNAPSHOT_HEADER, SNAPSHOT_VERSION, len(history_ids), len(upcoming_ids)) + struct.pack(f">{len(ids)}q", *ids)
+        return zlib.compress(raw, level=9)
+
+    @staticmethod
+    def unpack(data: bytes) -> tuple[list[int], list[int]]:
+        """Inverse of pack, refuses anything that would decompress past SNAPSHOT_MAX_TRACKS tracks"""
+        max_length = struct.calcsize(SNAPSHOT_HEADER) + SNAPSHOT_MAX_TRACKS * 8
+        decompressor = zlib.decompressobj()
+        raw = decompressor.decompress(data, max_length)
+        if decompressor.unconsumed_tail:
+            raise ValueError(f"Snapshot holds more than {SNAPSHOT_MAX_TRACKS} tracks")
+        version, history_count, upcoming_count = struct.unpack_from(SNAPSHOT_HEADER, raw)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unknown snapshot version {version}")
+        ids = list(struct.unpack_from(f">{history_count + upcoming_count}q", raw, struct.calcsize(SNAPSHOT_HEADER)))
+        return ids[:history_count], ids[history_count:]
+
+    @override
+    @classmethod
+    async def create_table(cls, db: Connection):
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {SessionSnapshot}(
+            guild_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            start_index INTEGER NOT NULL DEFAULT 0,
+            track_count INTEGER NOT NULL DEFAULT 0,
+            data BLOB NOT NULL,
+            PRIMARY KEY (guild_id, name),
+            FOREIGN KEY (guild_id) REFERENCES {Guild}(id)
+                ON UPDATE CASCADE ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED
+        )
+        """
+        await db.execute(query)
+
+    @override
+    @classmethod
+    async def create_triggers(cls, db: Connection):
+        triggers = [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {SessionSnapshot}_insert_settings_before_insert
+            BEFORE INSERT ON {SessionSnapshot}
+            BEGIN
+                INSERT INTO {MusicSettings}(guild_id)
+                VALUES(NEW.guild_id)
+                ON CONFLICT DO NOTHING;
+            END
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {SessionSnapshot}_delete_old_after_insert
+            AFTER INSERT ON {SessionSnapshot}
+            BEGIN
+                DELETE FROM {SessionSnapshot}
+                WHERE guild_id = NEW.guild_id AND name NOT IN (
+                    SELECT name FROM {SessionSnapshot}
+                    WHERE guild_id = NEW.guild_id
+                    ORDER BY CAST(name AS INTEGER) DESC
+                    LIMIT {SNAPSHOT_KEEP}
+                );
+            END
+            """
+        ]
+        for t in triggers:
+            await db.execute(t)
+
+    @classmethod
+    async def save(cls, db: Connection, guild_id: int, name: str, history: list[str], upcoming: list[str], start_index: int) -> SessionSnapshot:
+        """Writes the queue as one snapshot row, then drops dictionary tracks only pruned snapshots used"""
+        ids = await SnapshotTrack.storeMany(db, guild_id, history + upcoming)
+        data = cls.pack([ids[e] for e in history], [ids[e] for e in upcoming])
+        snapshot = SessionSnapshot(guild_id, name, start_index, len(history) + len(upcoming), data)
+        query = f"""
+        INSERT OR REPLACE INTO {SessionSnapshot} (guild_id, name, start_index, track_count, data)
+        VALUES (:guild_id, :name, :start_index, :track_count, :data)
+        """
+        await db.execute(query, snapshot.asdict())
+        used: set[int] = set()
+        for kept in await cls.selectAllWhere(db, guild_id):
+            history_ids, upcoming_ids = cls.unpack(kept.data)
+            used.update(history_ids, upcoming_ids)
+        removed = await SnapshotTrack.deleteUnused(db, guild_id, used)
+        logger.debug(f"SessionSnapshot.save: {snapshot.track_count} tracks in {len(data):,} bytes, {removed} unused tracks dropped")
+        return snapshot
+
+    async def load(self, db: Connection) -> tuple[list[str], list[str]]:
+        """The encoded history and upcoming tracks, one dictionary query for the distinct tracks"""
+        history_ids, upcoming_ids = self.unpack(self.data)
+        tracks = await SnapshotTrack.selectMany(db, self.guild_id, set(history_ids) | set(upcoming_ids))
+        return [tracks[i] for i in history_ids], [tracks[i] for i in upcoming_ids]
+
+    async def loadWavelink(self, db: Connection, node: Node) -> tuple[list[Playable], list[Playable]]:
+        history, upcoming = await self.load(db)
+        playables = await decode_tracks(node, history + upcoming)
+        # split where the history ended before dropping what couldn't be decoded
+        return ([t for t in playables[:len(history)] if t is not None],
+                [t for t in playables[len(history):] if t is not None])
+
+    @classmethod
+    async def selectAllWhere(cls, db: Connection, guild_id: int) -> list[SessionSnapshot]:
+        query = f"""
+        SELECT * FROM {SessionSnapshot}
+        WHERE guild_id = ?
+        ORDER BY CAST(name AS INTEGER) DESC
+        """
+        db.row_factory = SessionSnapshot.row_factory # pyright: ignore [reportAttributeAccessIssue]
+        async with db.execute(query, (guild_id,)) as cur:
+            res: list[SessionSnapshot] = await cur.fetchall() # pyright: ignore [reportAssignmentType]
         return res
 
+    @classmethod
+    async def selectPrior(cls, db: Connection, guild_id: int) -> SessionSnapshot | None:
+        query = f"""
+        SELECT * FROM {SessionSnapshot}
+        WHERE guild_id = ?
+        ORDER BY CAST(name AS INTEGER) DESC
+        LIMIT 1
+        """
+        db.row_factory = SessionSnapshot.row_factory # pyright: ignore [reportAttributeAccessIssue]
+        async with db.execute(query, (guild_id,)) as cur:
+            res: SessionSnapshot | None = await cur.fetchone() # pyright: ignore [reportAssignmentType]
+        return res
+
+    @classmethod
+    async def migrateTrackLists(cls, db: Connection) -> int:
+        """Moves sessions saved as TrackLists before snapshots existed into snapshots, returns how many were moved"""
+        query = f"""
+        SELECT * FROM {TrackListDetails}
+        WHERE flags & {TrackListFlags.session.value}
+        """
+        db.row_factory = TrackListDetails.row_factory # pyright: ignore [reportAttributeAccessIssue]
+        async with db.execute(query) as cur:
+            sessions: list[TrackListDetails] = await cur.fetchall() # pyright: ignore [reportAssignmentType]
+        for details in sessions:
+            encoded = [t.encoded for t in await TrackList.selectAllWhere(db, details.guild_id, details.name)]
+            if encoded and details.name.isnumeric():
+                current = min(max(details.start_index, 0), len(encoded) - 1)
+                await cls.save(db, details.guild_id, details.name, history=encoded[:current + 1], upcoming=encoded[current + 1:], start_index=current)
+            await TrackList.deleteAll(db, details.guild_id, details.name)
+            await db.execute(f"DELETE FROM {TrackListDetails} WHERE guild_id = ? AND name = ?", (details.guild_id, details.name))
+        if sessions:
+            logger.info(f"SessionSnapshot.migrateTrackLists: moved {len(sessions)} saved sessions out of TrackList")
+        return len(sessions)
+
+    @classmethod
+    async def selectWhere(cls, db: Connection, guild_id: int, name: str) -> SessionSnapshot | None:
+        query = f"""
+        SELECT * FROM {SessionSnapshot}
+        WHERE guild_id = ? AND name = ?
+        """
+        db.row_factory = SessionSnapshot.row_factory # pyright: ignore [reportAttributeAccessIssue]
+        async with db.execute(query, (guild_id, name)) as cur:
+            res: SessionSnapshot | None = await cur.fetchone() # pyright: ignore [reportAssignmentType]
+        return res
+
+
+class DeltaOp(IntEnum):
+    """Never change these, only add on to the end. They're used in the database"""
+    insert = 0
+    delete = 1
+    cursor = 2
+
+
+@dataclass
+class QueueDelta(Table, schema_version=1, trigger_version=1, table_group=__package__):
+    """
+    One edit to a live session's tracks since its last checkpoint snapshot, replayed in seq order on top of that snapshot
+    idx counts through the history and the upcoming tracks as one list, so playing the next track is only a cursor move
+    insert rows carry the encoded tracks joined by newlines, a cursor row's idx is the length of the history at the time
+    """
+    guild_id: int
+    seq: int
+    op: DeltaOp
+    idx: int
+    count: int
+    data: str | None
+
+    @override
+    @classmethod
+    async def create_table(cls, db: Connection):
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {QueueDelta}(
+            guild_id INTEGER NOT NULL,
+            seq INTEGER NOT NULL,
+            op INTEGER NOT NULL,
+            idx INTEGER NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            data TEXT,
+            PRIMARY KEY (guild_id, seq)
+        ) WITHOUT ROWID
+        """
+        await db.execute(query)
+
+    @classmethod
+    async def appendMany(cls, db: Connection, deltas: list[QueueDelta]) -> None:
+        query = f"""
+        INSERT OR REPLACE INTO {QueueDelta} (guild_id, seq, op, idx, count, data)
+        VALUES (:guild_id, :seq, :op, :idx, :count, :data)
+        """
+        await db.executemany(query, (d.asdict() for d in deltas))
+
+    @classmethod
+    async def selectAllWhere(cls, db: Connection, guild_id: int) -> list[QueueDelta]:
+        query = f"""
+        SELECT * FROM {QueueDelta}
+        WHERE guild_id = ?
+        ORDER BY seq
+        """
+        db.row_factory = QueueDelta.row_factory # pyright: ignore [reportAttributeAccessIssue]
+        async with db.execute(query, (guild_id,)) as cur:
+            res: list[QueueDelta] = await cur.fetchall() # pyright: ignore [reportAssignmentType]
+        return res
+
+    @classmethod
+    async def deleteAll(cls, db: Connection, guild_id: int) -> None:
+        await db.execute(f"DELETE FROM {QueueDelta} WHERE guild_id = ?", (guild_id,))
+
+    @staticmethod
+    def replay(tracks: list[str], cursor: int, deltas: list[QueueDelta]) -> tuple[list[str], int]:
+        """Applies deltas to the tracks of a snapshot, returns the tracks after and the history length they leave"""
+        items = BlockList(tracks)
+        for delta in deltas:
+            if delta.op == DeltaOp.insert:
+                assert delta.data is not None
+                items.insert_many(delta.idx, delta.data.split("\n"))
+            elif delta.op == DeltaOp.delete:
+                del items[delta.idx:delta.idx + delta.count]
+            elif delta.op == DeltaOp.cursor:
+                cursor = delta.idx
+        return list(items), min(cursor, len(items))
+
+    @classmethod
+    async def loadCheckpoint(cls, db: Connection, guild_id: int, snapshot: str | None) -> tuple[list[str], list[str]]:
+        """The encoded history and upcoming tracks of the last checkpoint, the named snapshot with the logged edits replayed on it"""
+        tracks: list[str] = []
+        cursor = 0
+        if snapshot is not None and (base := await SessionSnapshot.selectWhere(db, guild_id, snapshot)) is not None:
+            history, upcoming = await base.load(db)
+            tracks, cursor = history + upcoming, len(history)
+        tracks, cursor = cls.replay(tracks, cursor, await cls.selectAllWhere(db, guild_id))
+        return tracks[:cursor], tracks[cursor:]
+
+
+@dataclass
+class HistorySpill(Table, schema_version=1, trigger_version=1, table_group=__package__):
+    """
+    The older part of a live session's history once it's been moved out of memory
+    idx counts from the oldest track of the session, only ever appended to or popped from the end
+    """
+    guild_id: int
+    idx: int
+    encoded: str
+
+    @override
+    @classmethod
+    async def create_table(cls, db: Connection):
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {HistorySpill}(
+            guild_id INTEGER NOT NULL,
+            idx INTEGER NOT NULL,
+            encoded TEXT NOT NULL,
+            PRIMARY KEY (guild_id, idx)
+        ) WITHOUT ROWID
+        """
+        await db.execute(query)
+
+    @classmethod
+    async def appendMany(cls, db: Connection, guild_id: int, start: int, encoded_tracks: list[str]) -> None:
+        query = f"""
+        INSERT OR REPLACE INTO {HistorySpill} (guild_id, idx, encoded)
+        VALUES (?, ?, ?)
+        """
+        await db.executemany(query, ((guild_id, start + i, encoded) for i, encoded in enumerate(encoded_tracks)))
+
+    @classmethod
+    async def selectRange(cls, db: Connection, guild_id: int, start: int, stop: int) -> list[str]:
+        query = f"""
+        SELECT encoded FROM {HistorySpill}
+        WHERE guild_id = ? AND idx >= ? AND idx < ?
+        ORDER BY idx
+        """
+        db.row_factory = None
+        async with db.execute(query, (guild_id, start, stop)) as cur:
+            return [row[0] for row in await cur.fetchall()]
+
+    @classmethod
+    async def popFrom(cls, db: Connection, guild_id: int, start: int) -> list[str]:
+        """Removes and returns every track from idx start onwards, oldest first"""
+        tracks = await cls.selectRange(db, guild_id, start, 2**63 - 1)
+        await db.execute(f"DELETE FROM {HistorySpill} WHERE guild_id = ? AND idx >= ?", (guild_id, start))
+        return tracks
+
+    @classmethod
+    async def deleteAll(cls, db: Connection, guild_id: int) -> None:
+        await db.execute(f"DELETE FROM {HistorySpill} WHERE guild_id = ?", (guild_id,))
+
+
+@dataclass
+class PlayerResume(Table, schema_version=1, trigger_version=1, table_group=__package__):
+    """
+    A live player as of its last checkpoint, kept up to date while it plays and left behind on shutdown or a crash to be picked back up
+    session_id is the node session the player lives in, the queue around it is the SessionSnapshot called snapshot plus the guild's QueueDelta rows
+    track and position are only needed when lavalink dropped the session and the player has to be rebuilt
+    saved_at is when the row was last written, in epoch seconds, it's left out when comparing two rows
+    """
+    guild_id: int
+    channel_id: int
+    node: str # identifier of the node
+    session_id: str
+    snapshot: str | None
+    track: str | None
+    position: int # in milliseconds
+    paused: bool
+    volume: int
+    saved_at: int=field(default=0, compare=False)
+
+    @override
+    @classmethod
+    async def create_table(cls, db: Connection):
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {PlayerResume}(
+            guild_id INTEGER NOT NULL,
+            channel_id INTEGER NOT NULL,
+            node TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            snapshot TEXT,
+            track TEXT,
+            position INTEGER NOT NULL DEFAULT 0,
+            paused INTEGER NOT NULL DEFAULT 0,
+            volume INTEGER NOT NULL DEFAULT 100,
+            saved_at INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id)
+        )
+        """
+        await db.execute(query)
+
+    async def upsert(self, db: Connection) -> PlayerResume:
+        self.saved_at = int(time.time())
+        query = f"""
+        INSERT OR REPLACE INTO {PlayerResume} (guild_id, channel_id, node, session_id, snapshot, track, position, paused, volume, saved_at)
+        VALUES (:guild_id, :channel_id, :node, :session_id, :snapshot, :track, :position, :paused, :volume, :saved_at)
+        """
+        await db.execute(query, self.asdict())
+        return self
+
+    @classmethod
+    async def selectAll(cls, db: Connection) -> list[PlayerResume]:
+        query = f"""
+        SELECT * FROM {PlayerResume}
+        """
+        db.row_factory = PlayerResume.row_factory # pyright: ignore [reportAttributeAccessIssue]
+        async with db.execute(query) as cur:
+            res: list[PlayerResume] = await cur.fetchall() # pyright: ignore [reportAssignmentType]
+        return res
+
+    @classmethod
+    async def selectSessions(cls, db: Connection) -> dict[str, str]:
+        """The session each node had players left in, keyed by node identifier"""
+        query = f"""
+        SELECT DISTINCT node, session_id FROM {PlayerResume}
+        """
+        db.row_factory = None
+        async with db.execute(query) as cur:
+            return {row[0]: row[1] for row in await cur.fetchall()}
+
+    @classmethod
+    async def deleteWhere(cls, db: Connection, guild_id: int) -> None:
+        await db.execute(f"DELETE FROM {PlayerResume} WHERE guild_id = ?", (guild_id,))
+
+    @classmethod
+    async def deleteStale(cls, db: Connection, max_age: int) -> int:
+        """Drops rows last saved more than max_age seconds ago along with their guild's QueueDelta rows, returns how many were dropped"""
+        cutoff = int(time.time()) - max_age
+        await db.execute(f"""
+        DELETE FROM {QueueDelta}
+        WHERE guild_id IN (SELECT guild_id FROM {PlayerResume} WHERE saved_at < ?)
+        """, (cutoff,))
+        async with db.execute(f"DELETE FROM {PlayerResume} WHERE saved_at < ?", (cutoff,)) as cur:
+            return cur.rowcount
+
 
 @dataclass
 class FavoriteTrack(Table, schema_version=1, trigger_version=1, table_group=__package__):
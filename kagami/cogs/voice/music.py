@@ -5,6 +5,7 @@ import queue
 from typing import (
     Literal, List, Callable, Any, cast, get_args, override
 )
+import asyncio
 import datetime
 import math
 import time
@@ -34,7 +35,7 @@ from discord.ext.commands import GroupCog, Cog, MessageNotFound
 from discord.app_commands import Transform, Transformer, Group, Choice, Range
 from discord import ButtonStyle
 import wavelink
-from wavelink import Playable, Search, TrackEndEventPayload, TrackStartEventPayload, WebsocketClosedEventPayload
+from wavelink import Playable, Search, NodeReadyEventPayload, TrackEndEventPayload, TrackStartEventPayload, WebsocketClosedEventPayload
 
 from bot import Kagami, config
 from common import errors
@@ -43,15 +44,20 @@ from common.interactions import respond
 from common.database import Table, DatabaseManager, ConnectionContext
 from common.tables import Guild, GuildSettings, PersistentSettings
 from common.paginator import Scroller, ScrollerState
+from common.blocklist import BlockList
 from common.types import MessageableGuildChannel
-from .voice import PlayerSession, StatusBar, NotInChannel, NotInSession, NoSession, TracklistCallback
-from .db import TrackList, TrackListDetails, TrackListFlags
+from .voice import PlayerSession, StatusBar, NotInChannel, NotInSession, NoSession, TracklistCallback, TrackRecord, CHECKPOINT_INTERVAL, RESUME_REFRESH
+from .db import TrackList, TrackListDetails, TrackListFlags, SessionSnapshot, PlayerResume
+from .nodes import LavalinkNode, NODE_CHECK_INTERVAL, RESUME_TIMEOUT, best_node, check_nodes, migrate_player
 from common.utils import acstr, ms_timestamp, secondsToTime, milliseconds_divmod
 
 from cogs.voice import voice
 
 logger = setup_logging(__name__)
 
+# a checkpoint older than this was written before lavalink let go of the player, it isn't picked back up and played on its own
+RESUME_MAX_AGE = RESUME_TIMEOUT + RESUME_REFRESH + CHECKPOINT_INTERVAL
+
 type VocalGuildChannel = VoiceChannel | discord.StageChannel
 type Interaction = discord.Interaction[Kagami]
 
@@ -159,25 +165,92 @@ class MusicCog(GroupCog, group_name="m"):
     def __init__(self, bot: Kagami):
         self.bot = bot
         self.dbman = bot.dbman
+        self.resume_task: asyncio.Task[None] | None = None
 
     @override
     async def cog_load(self):
         await self.bot.dbman.setup(table_group=__package__)
-        
-        node = wavelink.Node(uri=config.lavalink_uri, 
-                             password=config.lavalink_password, 
-                             client=self.bot)
-        await wavelink.Pool.connect(nodes=[node])
+        async with self.conn() as db:
+            if await SessionSnapshot.migrateTrackLists(db):
+                await db.commit()
+            if stale:=await PlayerResume.deleteStale(db, RESUME_MAX_AGE):
+                logger.info(f"cog_load: dropped {stale} players left too long ago to resume")
+                await db.commit()
+            sessions = await PlayerResume.selectSessions(db)
+
+        nodes = [LavalinkNode(identifier=n["uri"], uri=n["uri"], password=n["password"], client=self.bot, resume_session=sessions.get(n["uri"]))
+                 for n in [{"uri": config.lavalink_uri, "password": config.lavalink_password}, *config.lavalink_nodes]]
+        await wavelink.Pool.connect(nodes=nodes)
+        self.check_lavalink_nodes.start()
+        self.checkpoint_sessions.start()
+        if sessions:
+            self.resume_task = asyncio.create_task(self.resume_players())
 
     @override
     async def cog_unload(self):
+        self.check_lavalink_nodes.cancel()
+        self.checkpoint_sessions.cancel()
+        if self.resume_task:
+            self.resume_task.cancel()
         for guild in self.bot.guilds:
             if vc:=guild.voice_client:
+                if self.bot.closing and isinstance(vc, PlayerSession):
+                    try: # players are left running on lavalink for the next start to pick up
+                        if await vc.detach():
+                            continue
+                    except Exception as e:
+                        logger.error(f"cog_unload: failed to detach the player of guild {guild.id}: {e}", exc_info=True)
                 await vc.disconnect(force=False)
 
+    @tasks.loop(seconds=CHECKPOINT_INTERVAL)
+    async def checkpoint_sessions(self):
+        """Writes what changed in every live queue since the last run, so a crash loses at most CHECKPOINT_INTERVAL of edits"""
+        written = 0
+        for vc in self.bot.voice_clients:
+            if not isinstance(vc, PlayerSession):
+                continue
+            try:
+                written += await vc.checkpoint()
+            except Exception as e:
+                logger.error(f"checkpoint_sessions: failed to checkpoint guild {vc.guild.id if vc.guild else None}: {e}", exc_info=True)
+        if written:
+            logger.debug(f"checkpoint_sessions: wrote {written} tracks")
+
+    async def resume_players(self) -> None:
+        """Rejoins the sessions that were detached on the last shutdown, once the bot can see its guilds and channels"""
+        await self.bot.wait_until_ready()
+        async with self.conn() as db:
+            resumes = await PlayerResume.selectAll(db)
+        for resume in resumes:
+            try:
+                await self.resume_player(resume)
+            except Exception as e:
+                logger.error(f"resume_players: failed to resume guild {resume.guild_id}: {e}", exc_info=True)
+            async with self.conn() as db:
+                await PlayerResume.deleteWhere(db, resume.guild_id)
+                await db.commit()
+
+    async def resume_player(self, resume: PlayerResume) -> None:
+        channel = self.bot.get_channel(resume.channel_id)
+        node = wavelink.Pool.nodes.get(resume.node)
+        if not isinstance(channel, (VoiceChannel, discord.StageChannel)) or channel.guild.voice_client is not None:
+            return
+        if not any(not m.bot for m in channel.members): # nobody left to play to, the player is let go instead
+            if node and node.session_id == resume.session_id:
+                await node._destroy_player(resume.guild_id) # pyright: ignore [reportPrivateUsage]
+            return
+        await PlayerSession.reattach(channel, resume, node or best_node())
+
     def conn(self) -> ConnectionContext:
         return self.bot.dbman.conn()
 
+    @tasks.loop(seconds=NODE_CHECK_INTERVAL)
+    async def check_lavalink_nodes(self):
+        """Keeps the node stats used to place new players fresh and moves players off nodes that stopped answering"""
+        moved = await check_nodes()
+        if moved:
+            logger.info(f"check_lavalink_nodes: moved {moved} players to other nodes")
+
     async def send_session_confirmation(self, interaction: Interaction, epoch_seconds: int, count: int) -> bool:
         """
         time: epoch seconds converted to discord timestamp
@@ -240,17 +313,18 @@ class MusicCog(GroupCog, group_name="m"):
         assert session.guild 
         assert session.queue.history is not None
         async with self.conn() as db:
-            details = await TrackListDetails.selectPriorSession(db, session.guild.id)
-            # logger.debug(f"attempt_session_resume - details:{details}") # debug-dev
-            if not details: 
+            snapshot = await SessionSnapshot.selectPrior(db, session.guild.id)
+            # logger.debug(f"attempt_session_resume - snapshot:{snapshot}") # debug-dev
+            if not snapshot: 
                 return 0
-            track_count = await TrackList.selectTrackCountWhere(db, session.guild.id, name=details.name)
-            if track_count > 0 and await self.send_session_confirmation(interaction, int(details.name), track_count): 
+            track_count = snapshot.track_count
+            if track_count > 0 and await self.send_session_confirmation(interaction, int(snapshot.name), track_count): 
                 # logger.debug(f"attempt_session_resume - confirmation yes") # debug-dev
-                playable_tracks = await TrackList.selectAllWavelink(db, wavelink.Pool.get_node(), guild_id=session.guild.id, name=details.name)
+                history, upcoming = await snapshot.loadWavelink(db, session.node)
+                playable_tracks = [TrackRecord.from_playable(t) for t in history + upcoming]
                 # logger.debug(f"attempt_session_resume - playable tracks : {len(playable_tracks)}") # debug-dev
-                session.queue.history._items = playable_tracks[:details.start_index] if len(playable_tracks) > 0 else []
-                session.queue._items = playable_tracks[details.start_index:] if (len(playable_tracks) - 1) > details.start_index else []
+                session.queue.history.put(playable_tracks[:snapshot.start_index] if len(playable_tracks) > 0 else [])
+                session.queue.put(playable_tracks[snapshot.start_index:] if (len(playable_tracks) - 1) > snapshot.start_index else [])
                 return track_count
                 # logger.debug(f"attempt_session_resume - first track: {track}") # debug-dev
             else:
@@ -316,13 +390,15 @@ class MusicCog(GroupCog, group_name="m"):
             return
 
         assert query is not None
-        results = await session.search_and_queue(query, position=position)
+        player = session # session is reassigned below, the closure keeps its own typed reference
+        async def on_ingested(tracks: list[Playable]) -> None:
+            await respond(interaction, f"Queued {len(tracks)} more tracks from the playlist", send_followup=True, delete_after=5)
+            await player.update_status_bar()
+        results = await session.search_and_queue(query, position=position, on_ingested=on_ingested)
         # logger.debug(f"play - {len(results)=}") # debug-dev
         if len(results) == 1: # only a single track was returned
             track: Playable = results[0]
             # logger.debug(f"handle_play - {track.title=} {track.source=} {track.identifier=}")
-            if track.source == "http":
-                track._title = unquote(Path(str(urlparse(track.uri).path)).name)
 
             if session.current is not None and position is not None:
                 if position == 0:
@@ -342,6 +418,8 @@ class MusicCog(GroupCog, group_name="m"):
                 await respond(interaction, f"Playing `{session.current}`", 
                               delete_after=5)
         elif len(results) > 1: # many tracks returned
+            if session.current is None or position == 0: # playback first, the track list message can wait
+                await session.play_next()
             message = await respond(interaction, content="...", send_followup=True, ephemeral=True)
             guild = cast(discord.Guild, interaction.guild)
             session = cast(PlayerSession, guild.voice_client)
@@ -349,8 +427,6 @@ class MusicCog(GroupCog, group_name="m"):
             title = f"Queued {len(results)} tracks" if not position else f"Queued {len(results)} tracks at position {position}"
             scroller = Scroller(message, user, TracklistCallback(results, title=title), timeout=30)
             await scroller.update(interaction)
-            if session.current is None or position == 0:
-                await session.play_next()
         else: # no tracks returned
             await respond(interaction, "I couldn't find any tracks that matched",
                           delete_after=5)
@@ -450,6 +526,9 @@ class MusicCog(GroupCog, group_name="m"):
             return new - 1 
 
 
+        lowest = min(position, extent if extent is not None else position)
+        if lowest < 0: # spilled tracks are shown with their real index, they're brought back before anything is clamped
+            await session.restore_history(-lowest + 1)
         position = clamp_index(position)
         extent = clamp_index(extent) if extent is not None else position
         
@@ -503,6 +582,9 @@ class MusicCog(GroupCog, group_name="m"):
             return new - 1 
 
 
+        lowest = min(position, new_position, extent if extent is not None else position)
+        if lowest < 0: # spilled tracks are shown with their real index, they're brought back before anything is clamped
+            await session.restore_history(-lowest + 1)
         index = clamp_index(position)
         # new_index = clamp_index(new_position)
         new_index = new_position - 1
@@ -547,10 +629,10 @@ class MusicCog(GroupCog, group_name="m"):
         items = history_items + queue_items
         # total_tracks = len(items)
         if new_index < -1: # up to the last element of the history
-            temp = session.queue.history._items[new_index+1:]
-            session.queue.history._items = session.queue.history._items[:new_index + 1] + items[:-new_index]
-            session.queue._items = items[-new_index:] + temp + session.queue._items
-            # not sure if I need _items[:] (making a copy) when doing the concatonation
+            temp = session.queue.history[new_index+1:]
+            del session.queue.history[new_index+1:]
+            session.queue.history.put(items[:-new_index])
+            session.queue.put_many_at(0, items[-new_index:] + temp)
             spans_history = len(items[:-(new_index + 1)]) > 0
             spans_queue = len(items[-(new_index + 1):]) > 0
             if spans_history and spans_queue:
@@ -560,8 +642,8 @@ class MusicCog(GroupCog, group_name="m"):
             else:
                 content += f" in the history"
         elif new_index < 0: # including the last element of the history
-            session.queue.history._items = session.queue.history._items + items[0:1]
-            session.queue._items = items[1:] + session.queue._items
+            session.queue.history.put(items[0:1])
+            session.queue.put_many_at(0, items[1:])
             spans_history = len(items[0:1]) > 0
             spans_queue = len(items[1:]) > 0
             if spans_history and spans_queue:
@@ -571,7 +653,7 @@ class MusicCog(GroupCog, group_name="m"):
             else:
                 content += f" in the history"
         else: # >= 0
-            session.queue._items = session.queue._items[:new_index] + items + session.queue._items[new_index:]
+            session.queue.put_many_at(new_index, items)
             content += f" in the queue"
         await respond(interaction, content, delete_after=8)
 
@@ -598,6 +680,8 @@ class MusicCog(GroupCog, group_name="m"):
             session.cycle_queue_mode()
         else:
             session.queue.mode = mode
+        if session.queue.mode is wavelink.QueueMode.loop_all: # looping wraps around the whole history
+            await session.restore_history()
         await respond(interaction, f"Queue Mode: {session.queue.mode}", delete_after=5)
         await session.update_status_bar()
 
@@ -614,13 +698,17 @@ class MusicCog(GroupCog, group_name="m"):
         assert session.queue.history is not None
         queue_tracks = session.queue._items # pyright:ignore
         if (not session.queue.history.is_empty) and (session.current == session.queue.history[-1]): # ensures that you only will see history
-            history_tracks = session.queue.history._items[:-1]
+            history_length = session.history_length - 1
             magic_history_offset = 0
         else:
-            history_tracks = session.queue.history._items # pyright:ignore
+            history_length = session.history_length
             magic_history_offset = 1
         queue_length = len(queue_tracks)
-        history_length = len(history_tracks)
+
+        async def history_slice(first: int | None, last: int | None) -> list[TrackRecord]:
+            # only the shown page is read, older pages come from the spilled history
+            start, stop, _ = slice(first, last).indices(history_length)
+            return await session.history_range(start, stop) if start < stop else []
 
         first_page_index = -1 * ((history_length + 4) // ITEM_COUNT)
         last_page_index = (queue_length + 4) // ITEM_COUNT
@@ -631,10 +719,10 @@ class MusicCog(GroupCog, group_name="m"):
         W_INDEX, W_TITLE, W_DURATION = 7, 40, 8
 
 
-        def track_repr(track: Playable):
+        def track_repr(track: Playable | TrackRecord):
             return f"{acstr(track.title, W_TITLE)} - {acstr(ms_timestamp(track.length), W_DURATION, just="r")}"
 
-        def track_repr_index(track: Playable, index: int):
+        def track_repr_index(track: Playable | TrackRecord, index: int):
             return f"{acstr(index, W_INDEX, edges=("( ", ")"))} {acstr(track.title, W_TITLE)} - {acstr(ms_timestamp(track.length), W_DURATION, just="r")}"
 
         currently_playing = session.current
@@ -650,9 +738,9 @@ class MusicCog(GroupCog, group_name="m"):
             # Show 5 history tracks, 5 queue tracks and now playing in the middle
             # Because this page contains the first 5 tracks of both the history and the queue
             # the history and queue pages must be shift by 5 to account for it
-            history_slice = history_tracks[-5:]
-            for i, track in enumerate(history_slice):
-                index = len(history_slice) * -1 + i + magic_history_offset
+            history_tracks = await history_slice(-5, None)
+            for i, track in enumerate(history_tracks):
+                index = len(history_tracks) * -1 + i + magic_history_offset
                 temp = track_repr_index(track, index)
                 reps.append(temp)
             reps.append("-------")
@@ -667,9 +755,9 @@ class MusicCog(GroupCog, group_name="m"):
             # 10 history tracks, now playing at the bottom
             # Offset will be <= -1
             first, last = (offset * ITEM_COUNT - 5), (offset * ITEM_COUNT + 5)
-            history_slice = history_tracks[first:last]
-            for i, track in enumerate(history_slice):
-                index = len(history_slice) * -1 + i + last + magic_history_offset
+            history_tracks = await history_slice(first, last)
+            for i, track in enumerate(history_tracks):
+                index = len(history_tracks) * -1 + i + last + magic_history_offset
                 temp = track_repr_index(track, index)
                 reps.append(temp)
             reps.append("-------")
@@ -769,12 +857,24 @@ class MusicCog(GroupCog, group_name="m"):
         # await self.session_new_tracklist(session)
         await session.save_queue()
 
+    @GroupCog.listener()
+    async def on_wavelink_node_ready(self, payload: NodeReadyEventPayload) -> None:
+        """A node that came back without its session lost every player on it, they're sent to lavalink again where they were"""
+        if payload.resumed or not payload.node.players:
+            return
+        for player in list(payload.node.players.values()):
+            try:
+                await migrate_player(player, payload.node)
+            except Exception as e:
+                logger.error(f"node_ready: failed to restore guild {player.guild.id if player.guild else None} on {payload.node.identifier}: {e}", exc_info=True)
+
 
     @GroupCog.listener()
     async def on_wavelink_track_start(self, payload: TrackStartEventPayload) -> None:
         session = cast(PlayerSession, payload.player)
         if session.status_bar:
             await session.status_bar.refresh()
+        await session.spill_history()
 
 
     @GroupCog.listener()
@@ -794,19 +894,17 @@ class MusicCog(GroupCog, group_name="m"):
                 return
 
             assert session.queue.history
-            tracks = list(session.queue.history) + list(session.queue)
-            # logger.debug(f"voice_state_update - session track count: {len(tracks)}")
-            current_index = l-1 if (l:=len(session.queue.history)) > 0 else 0
+            history = await session.history_encoded()
+            upcoming = [t.encoded for t in session.queue]
+            # logger.debug(f"voice_state_update - session track count: {len(history) + len(upcoming)}")
+            current_index = l-1 if (l:=len(history)) > 0 else 0
             # logger.debug(f"voice_state_update - current index: {current_index}")
             epoch_seconds = int(time.time())
             name = f"{epoch_seconds}"
-            list_details = TrackListDetails(guild_id, name, start_index=current_index, flags=TrackListFlags.session)
-            # logger.debug(f"voice_state_update - track list details: {list_details}")
 
             async with self.conn() as db:
                 # logger.debug(f"voice_state_update - begin insert")
-                await list_details.insert(db)
-                await TrackList.insert_wavelink_tracks(db, tracks, guild_id=guild_id, name=name)
+                await SessionSnapshot.save(db, guild_id, name, history=history, upcoming=upcoming, start_index=current_index)
                 await db.commit()
                 # logger.debug(f"voice_state_update - committed changes")
 
@@ -0,0 +1,179 @@
+"""
+Lavalink nodes that keep their load stats, and picking or leaving nodes based on them
+New players go to the healthy node with the lowest penalty, players on a node that stops answering are moved to another
+Nodes keep their lavalink session for RESUME_TIMEOUT after the bot goes away and can pick up a session from before a restart
+"""
+from __future__ import annotations
+from typing import Any, override
+import asyncio
+
+import aiohttp
+import discord
+import wavelink
+from wavelink import NodeStatus, StatsEventPayload, StatsResponsePayload, StatsEventFrames
+from wavelink.websocket import Websocket
+
+from bot import config
+from common.logging import setup_logging
+
+logger = setup_logging(__name__)
+
+NODE_CHECK_INTERVAL_DEFAULT = 30
+NODE_CHECK_TIMEOUT_DEFAULT = 5
+NODE_MIGRATE_AFTER_DEFAULT = 2
+RESUME_TIMEOUT_DEFAULT = 120
+
+NODE_CHECK_INTERVAL: int = config.get("MUSIC_NODE_CHECK_SECONDS", int, NODE_CHECK_INTERVAL_DEFAULT)
+NODE_CHECK_TIMEOUT: int = config.get("MUSIC_NODE_CHECK_TIMEOUT", int, NODE_CHECK_TIMEOUT_DEFAULT)
+NODE_MIGRATE_AFTER: int = config.get("MUSIC_NODE_MIGRATE_AFTER", int, NODE_MIGRATE_AFTER_DEFAULT)
+RESUME_TIMEOUT: int = config.get("MUSIC_RESUME_SECONDS", int, RESUME_TIMEOUT_DEFAULT)
+f"""
+Environment Variables:
+    MUSIC_NODE_CHECK_SECONDS (default={NODE_CHECK_INTERVAL_DEFAULT}) - Seconds between asking every lavalink node for its stats
+    MUSIC_NODE_CHECK_TIMEOUT (default={NODE_CHECK_TIMEOUT_DEFAULT}) - Seconds a node gets to answer before the check counts as failed
+    MUSIC_NODE_MIGRATE_AFTER (default={NODE_MIGRATE_AFTER_DEFAULT}) - Failed checks in a row before a node's players are moved off it
+    MUSIC_RESUME_SECONDS (default={RESUME_TIMEOUT_DEFAULT}) - Seconds lavalink keeps a node's players playing after the bot disconnects, enough to cover a restart
+"""
+
+
+class StatsWebsocket(Websocket):
+    """
+    wavelink's websocket, it also hands the stats lavalink pushes every minute to its node since the event doesn't say which node sent them
+    and notes on the node whether its last ready resumed the session
+    """
+    @override
+    def dispatch(self, event: str, /, *args: Any, **kwargs: Any) -> None:
+        if event == "stats_update" and isinstance(self.node, LavalinkNode):
+            self.node.set_stats(args[0])
+        elif event == "node_ready" and isinstance(self.node, LavalinkNode):
+            self.node.resumed = args[0].resumed
+        super().dispatch(event, *args, **kwargs)
+
+
+class LavalinkNode(wavelink.Node):
+    """
+    A node that remembers its latest stats and how many checks in a row it failed
+    Stats come from the websocket and from check, frame stats are only ever sent over the websocket
+    resume_session is a session id from before a restart, the first connect asks lavalink to resume it
+    """
+    def __init__(self, *args: Any, resume_session: str | None=None, **kwargs: Any) -> None:
+        kwargs.setdefault("resume_timeout", RESUME_TIMEOUT)
+        super().__init__(*args, **kwargs)
+        self.stats: StatsEventPayload | StatsResponsePayload | None = None
+        self.frames: StatsEventFrames | None = None
+        self.failures: int = 0
+        self.resume_session: str | None = resume_session
+        self.resumed: bool = False
+
+    @override
+    async def _connect(self, *, client: discord.Client | None) -> None:
+        # the same as wavelink's apart from the websocket class and the session to resume
+        client_ = self._client or client
+        if not client_:
+            raise wavelink.InvalidClientException(f"Unable to connect {self!r} as you have not provided a valid discord.Client.")
+        self._client = client_
+        self._has_closed = False
+        if not self._session or self._session.closed:
+            self._session = aiohttp.ClientSession()
+        if self.resume_session and not self._session_id:
+            # sent as the Session-Id header, lavalink starts a new session instead if it already let this one go
+            self._session_id = self.resume_session
+            self.resume_session = None
+        websocket = StatsWebsocket(node=self)
+        self._websocket = websocket
+        await websocket.connect()
+
+    def set_stats(self, stats: StatsEventPayload | StatsResponsePayload) -> None:
+        self.stats = stats
+        if stats.frames is not None:
+            self.frames = stats.frames
+
+    @property
+    def healthy(self) -> bool:
+        return self.status is NodeStatus.CONNECTED and self.failures == 0
+
+    @property
+    def penalty(self) -> float:
+        """
+        The usual lavalink load balancing penalty, playing players plus cpu load and missing audio frames weighted to blow up as they get bad
+        Players this bot put on the node since the last stats count too so a burst of joins doesn't all land on one node
+        """
+        playing = len(self.players)
+        if self.stats is None:
+            return playing
+        penalty = max(self.stats.playing, playing) + 1.05 ** (100 * self.stats.cpu.system_load) * 10 - 10
+        if self.frames is not None: # per minute, out of 3000
+            penalty += 1.03 ** (500 * self.frames.deficit / 3000) * 600 - 600
+            penalty += (1.03 ** (500 * self.frames.nulled / 3000) * 300 - 300) * 2
+        return penalty
+
+    async def check(self) -> bool:
+        """Fetches the node's stats, a node that isn't connected or doesn't answer in time has failed the check"""
+        try:
+            if self.status is not NodeStatus.CONNECTED:
+                raise ConnectionError(f"node is {self.status.name}")
+            self.set_stats(await asyncio.wait_for(self.fetch_stats(), timeout=NODE_CHECK_TIMEOUT))
+            self.failures = 0
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"node check - {self.identifier} failed {self.failures} in a row: {e}")
+        return self.failures == 0
+
+
+def lavalink_nodes() -> list[LavalinkNode]:
+    return [node for node in wavelink.Pool.nodes.values() if isinstance(node, LavalinkNode)]
+
+def best_node(exclude: LavalinkNode | None=None) -> wavelink.Node:
+    """The healthy node with the lowest penalty, falls back on wavelink's pick when no node is healthy"""
+    nodes = [node for node in lavalink_nodes() if node.healthy and node is not exclude]
+    if not nodes:
+        return wavelink.Pool.get_node()
+    return min(nodes, key=lambda node: node.penalty)
+
+async def migrate_player(player: wavelink.Player, node: wavelink.Node) -> None:
+    """
+    Moves a player to another node, the voice connection and the current track carry over at the position it was at
+    The old node is asked to drop the player but it's most likely not answering anyway
+    """
+    assert player.guild is not None
+    old = player.node
+    position = player.position
+    old._players.pop(player.guild.id, None) # pyright: ignore [reportPrivateUsage]
+    try:
+        await asyncio.wait_for(old._destroy_player(player.guild.id), timeout=NODE_CHECK_TIMEOUT) # pyright: ignore [reportPrivateUsage]
+    except Exception:
+        pass
+    player._node = node # pyright: ignore [reportPrivateUsage]
+    node._players[player.guild.id] = player # pyright: ignore [reportPrivateUsage]
+    voice = player._voice_state["voice"] # pyright: ignore [reportPrivateUsage]
+    request: dict[str, Any] = {
+        "voice": {"sessionId": voice.get("session_id"), "token": voice.get("token"), "endpoint": voice.get("endpoint")},
+        "volume": player.volume,
+        "paused": player.paused,
+        "filters": player.filters(),
+    }
+    if player.current is not None:
+        request["track"] = {"encoded": player.current.encoded, "userData": dict(player.current.extras)}
+        request["position"] = position
+    await node._update_player(player.guild.id, data=request, replace=True) # pyright: ignore [reportPrivateUsage, reportArgumentType]
+    logger.info(f"migrate_player - moved guild {player.guild.id} from {old.identifier} to {node.identifier} at {position}ms")
+
+async def check_nodes() -> int:
+    """Checks every node and moves the players off the ones that failed NODE_MIGRATE_AFTER checks in a row, returns how many were moved"""
+    nodes = lavalink_nodes()
+    await asyncio.gather(*(node.check() for node in nodes))
+    moved = 0
+    for node in nodes:
+        if node.failures < NODE_MIGRATE_AFTER or not node.players:
+            continue
+        for player in list(node.players.values()):
+            target = best_node(exclude=node)
+            if target is node or not isinstance(target, LavalinkNode) or not target.healthy:
+                logger.warning(f"check_nodes - no healthy node to move the players of {node.identifier} to")
+                return moved
+            try:
+                await migrate_player(player, target)
+                moved += 1
+            except Exception as e:
+                logger.error(f"check_nodes - failed to move guild {player.guild.id if player.guild else None} off {node.identifier}: {e}", exc_info=True)
+    return moved
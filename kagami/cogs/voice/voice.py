@@ -1,29 +1,68 @@
 from __future__ import annotations
 from code import interact
-from typing import Any, Literal, cast, override, Callable, Awaitable
+from typing import Any, Literal, cast, override, Callable, Awaitable, Iterable, Iterator, SupportsIndex
 import asyncio
+import random
+import sys
 import time
+from contextlib import contextmanager
+from functools import partial
 from math import ceil
 
-from urllib.parse import urlparse, parse_qs
+from pathlib import Path
+from collections import OrderedDict
+from urllib.parse import unquote, urlparse, urlunparse, urlencode, parse_qs, parse_qsl
 
 import aiosqlite
 import discord
-from discord import NotFound, VoiceClient, VoiceChannel, ui, ButtonStyle, TextStyle
+from discord import NotFound, VoiceClient, VoiceChannel, StageChannel, ui, ButtonStyle, TextStyle
 from wavelink import Player, AutoPlayMode, QueueMode, Playable, Search
 import wavelink
-from bot import Kagami
+from bot import Kagami, config
 from common.interactions import respond
 from common.logging import setup_logging
 from common.errors import CustomCheck
 from common.utils import acstr, ms_timestamp
 from common.types import MessageableGuildChannel
 from common.paginator import ScrollerState, Scroller, SimpleCallback 
+from common.blocklist import BlockList
+from common.database import DatabaseManager
 
-from .db import TrackListDetails, TrackList, TrackListFlags
+from .db import TrackListDetails, TrackList, TrackListFlags, SessionSnapshot, HistorySpill, PlayerResume, QueueDelta, DeltaOp, decode_track, decode_tracks
+from .nodes import best_node
 
 logger = setup_logging(__name__)
 
+HISTORY_MEMORY_LIMIT_DEFAULT = 500
+HISTORY_SPILL_BATCH_DEFAULT = 100
+SEARCH_CACHE_TTL_DEFAULT = 900
+SEARCH_CACHE_ENTRIES_DEFAULT = 256
+SEARCH_CACHE_BYTES_DEFAULT = 32_000_000
+STATUS_BAR_INTERVAL_DEFAULT = 1.5
+CHECKPOINT_INTERVAL_DEFAULT = 15
+CHECKPOINT_COMPACT_AFTER_DEFAULT = 1000
+
+HISTORY_MEMORY_LIMIT: int = config.get("MUSIC_HISTORY_MEMORY_LIMIT", int, HISTORY_MEMORY_LIMIT_DEFAULT)
+HISTORY_SPILL_BATCH: int = config.get("MUSIC_HISTORY_SPILL_BATCH", int, HISTORY_SPILL_BATCH_DEFAULT)
+SEARCH_CACHE_TTL: int = config.get("MUSIC_SEARCH_CACHE_TTL", int, SEARCH_CACHE_TTL_DEFAULT)
+SEARCH_CACHE_ENTRIES: int = config.get("MUSIC_SEARCH_CACHE_ENTRIES", int, SEARCH_CACHE_ENTRIES_DEFAULT)
+SEARCH_CACHE_BYTES: int = config.get("MUSIC_SEARCH_CACHE_BYTES", int, SEARCH_CACHE_BYTES_DEFAULT)
+STATUS_BAR_INTERVAL: float = config.get("MUSIC_STATUS_BAR_INTERVAL", float, STATUS_BAR_INTERVAL_DEFAULT)
+CHECKPOINT_INTERVAL: int = config.get("MUSIC_CHECKPOINT_SECONDS", int, CHECKPOINT_INTERVAL_DEFAULT)
+CHECKPOINT_COMPACT_AFTER: int = config.get("MUSIC_CHECKPOINT_COMPACT_AFTER", int, CHECKPOINT_COMPACT_AFTER_DEFAULT)
+RESUME_REFRESH = 4 * CHECKPOINT_INTERVAL # an unchanged PlayerResume row is still rewritten this often, its saved_at shows the player was alive
+f"""
+Environment Variables:
+    MUSIC_HISTORY_MEMORY_LIMIT (default={HISTORY_MEMORY_LIMIT_DEFAULT}) - The most history tracks a session keeps in memory, older ones are moved to the database
+    MUSIC_HISTORY_SPILL_BATCH (default={HISTORY_SPILL_BATCH_DEFAULT}) - How far past the limit the history can grow before a batch is moved out
+    MUSIC_SEARCH_CACHE_TTL (default={SEARCH_CACHE_TTL_DEFAULT}) - Seconds a search result is reused before lavalink is asked again
+    MUSIC_SEARCH_CACHE_ENTRIES (default={SEARCH_CACHE_ENTRIES_DEFAULT}) - The most search results kept, the least recently used go first
+    MUSIC_SEARCH_CACHE_BYTES (default={SEARCH_CACHE_BYTES_DEFAULT}) - Rough memory cap of the cached results
+    MUSIC_STATUS_BAR_INTERVAL (default={STATUS_BAR_INTERVAL_DEFAULT}) - Least seconds between two edits of a status bar message
+    MUSIC_CHECKPOINT_SECONDS (default={CHECKPOINT_INTERVAL_DEFAULT}) - Seconds between writing the edits made to every live queue to the database
+    MUSIC_CHECKPOINT_COMPACT_AFTER (default={CHECKPOINT_COMPACT_AFTER_DEFAULT}) - Tracks the edit log of a queue can touch before it's folded into a fresh snapshot
+"""
+
 type Interaction = discord.Interaction[Kagami]
 
 class NotInChannel(CustomCheck):
@@ -36,12 +75,545 @@ class NoSession(CustomCheck):
     MESSAGE: str = "A voice session must be active to use this command"
 
 
+def track_size(track: Playable | TrackRecord) -> int:
+    """Rough estimate of the memory a track holds, the object plus the strings, dicts and objects hanging off it"""
+    def sizeof(value: object, depth: int=0) -> int:
+        size = sys.getsizeof(value)
+        if depth < 2 and isinstance(value, dict):
+            size += sum(sizeof(v, depth + 1) for v in value.values()) # pyright: ignore [reportUnknownVariableType, reportUnknownArgumentType]
+        elif depth < 2 and isinstance(value, TrackRecord):
+            size += sum(sizeof(getattr(value, name), depth + 1) for name in TrackRecord.__slots__)
+        elif depth < 2 and hasattr(value, "__dict__") and not isinstance(value, type):
+            size += sizeof(vars(value), depth + 1)
+        return size
+    return sizeof(track)
+
+
+class TrackRecord:
+    """
+    What the queues hold instead of a Playable, the encoded track and the fields the views show
+    A Playable carries its raw payload, a dict of attributes and a few helper objects, this is a fraction of that
+    hydrate builds the Playable back when the track is about to play
+    """
+    __slots__ = ("encoded", "identifier", "title", "author", "length", "uri", "source", "is_stream", "plugin_info", "user_data")
+
+    def __init__(self, encoded: str, identifier: str, title: str, author: str, length: int, uri: str | None=None,
+                 source: str="", is_stream: bool=False, plugin_info: dict[str, Any] | None=None, user_data: dict[str, Any] | None=None) -> None:
+        self.encoded: str = encoded
+        self.identifier: str = identifier
+        self.title: str = title
+        self.author: str = author
+        self.length: int = length
+        self.uri: str | None = uri
+        self.source: str = source
+        self.is_stream: bool = is_stream
+        self.plugin_info: dict[str, Any] | None = plugin_info # None rather than an empty dict for the usual plain tracks
+        self.user_data: dict[str, Any] | None = user_data
+
+    @classmethod
+    def from_playable(cls, track: Playable) -> TrackRecord:
+        raw: dict[str, Any] = track.raw_data # pyright: ignore [reportAssignmentType]
+        return cls(track.encoded, track.identifier, track.title, track.author, track.length, track.uri,
+                   sys.intern(track.source), track.is_stream, raw.get("pluginInfo") or None, dict(track.extras) or None)
+
+    def payload(self) -> dict[str, Any]:
+        """
+        The track payload lavalink would send for this track, decoded locally from the encoded string
+        Falls back to the stored fields when it can't be decoded, only the artwork and isrc are lost then
+        """
+        payload = decode_track(self.encoded) or {
+            "encoded": self.encoded,
+            "info": {
+                "identifier": self.identifier,
+                "isSeekable": not self.is_stream,
+                "author": self.author,
+                "length": self.length,
+                "isStream": self.is_stream,
+                "position": 0,
+                "title": self.title,
+                "uri": self.uri,
+                "artworkUrl": None,
+                "isrc": None,
+                "sourceName": self.source
+            },
+        }
+        payload["info"]["title"] = self.title # keeps titles that were changed after the search, like http files
+        payload["pluginInfo"] = self.plugin_info or {}
+        payload["userData"] = self.user_data or {}
+        return payload
+
+    def hydrate(self) -> Playable:
+        """The full Playable for this track"""
+        return Playable(self.payload()) # pyright: ignore [reportArgumentType]
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (TrackRecord, Playable)):
+            return NotImplemented
+        return self.encoded == other.encoded
+
+    def __hash__(self) -> int:
+        return hash(self.encoded)
+
+    def __str__(self) -> str:
+        return self.title
+
+    def __repr__(self) -> str:
+        return f"TrackRecord(source={self.source}, title={self.title}, identifier={self.identifier})"
+
+
+def playlist_video_url(query: str) -> str | None:
+    """The link to just the video when query links to a video inside a youtube playlist, None for anything else"""
+    url = urlparse(query.strip())
+    params = parse_qs(url.query)
+    if url.scheme not in ("http", "https") or "v" not in params or "list" not in params:
+        return None
+    return urlunparse((url.scheme, url.netloc, url.path, "", urlencode({"v": params["v"][0]}), ""))
+
+def compact(track: Any) -> Any:
+    """Playables become TrackRecords, anything else is passed through for the queue's own checks to reject"""
+    return TrackRecord.from_playable(track) if isinstance(track, Playable) else track
+
+def hydrate(track: Playable | TrackRecord) -> Playable:
+    return track.hydrate() if isinstance(track, TrackRecord) else track
+
+
+class SearchCache:
+    """
+    Results of Playable.search kept for a while so repeated plays of the same link or query skip lavalink
+    Shared by every guild, bounded by entry count and a rough byte size with the least recently used dropped first
+    Tracks are kept as TrackRecords and every hit hands out fresh Playables, so callers can edit what they get
+    """
+    TRACKING_PARAMS = {"si", "feature", "pp", "fbclid", "gclid"}
+
+    def __init__(self, ttl: float, max_entries: int, max_bytes: int) -> None:
+        self.ttl: float = ttl
+        self.max_entries: int = max_entries
+        self.max_bytes: int = max_bytes
+        # key -> (expires at, size, tracks, playlist payload without its tracks or None for plain results)
+        self._entries: OrderedDict[str, tuple[float, int, list[TrackRecord], dict[str, Any] | None]] = OrderedDict()
+        self.bytes: int = 0
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @classmethod
+    def normalize(cls, query: str) -> str:
+        """Urls lose their fragment and tracking params and get their params sorted, anything else is compared case and spacing insensitively"""
+        query = query.strip()
+        url = urlparse(query)
+        if url.scheme in ("http", "https") and url.netloc:
+            params = sorted((k, v) for k, v in parse_qsl(url.query, keep_blank_values=True)
+                            if k not in cls.TRACKING_PARAMS and not k.startswith("utm_"))
+            return urlunparse((url.scheme.lower(), url.netloc.lower(), url.path, url.params, urlencode(params), ""))
+        return " ".join(query.split()).casefold()
+
+    def get(self, query: str) -> Search | None:
+        key = self.normalize(query)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] < time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        _, _, tracks, playlist = entry
+        if playlist is None:
+            return [t.hydrate() for t in tracks]
+        return wavelink.Playlist({**playlist, "tracks": [t.payload() for t in tracks]}) # pyright: ignore [reportArgumentType]
+
+    def put(self, query: str, results: Search) -> None:
+        if len(results) == 0: # might just be lavalink having a bad moment
+            return
+        key = self.normalize(query)
+        tracks = [TrackRecord.from_playable(t) for t in results]
+        playlist: dict[str, Any] | None = None
+        if isinstance(results, wavelink.Playlist):
+            plugin = {"type": results.type, "url": results.url, "artworkUrl": results.artwork, "author": results.author}
+            playlist = {"info": {"name": results.name, "selectedTrack": results.selected},
+                        "pluginInfo": {k: v for k, v in plugin.items() if v is not None}}
+        size = sys.getsizeof(key) + sum(track_size(t) for t in tracks)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, tracks, playlist)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        self.bytes -= self._entries.pop(key)[1]
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.bytes = 0
+
+    async def search(self, query: str) -> Search:
+        """Playable.search with the cache in front of it"""
+        results = self.get(query)
+        if results is None:
+            results = await Playable.search(query)
+            self.put(query, results)
+        logger.debug(f"search_cache - {self.hits} hits {self.misses} misses, {len(self)} entries ~{self.bytes:,} bytes")
+        return results
+
+
+search_cache = SearchCache(SEARCH_CACHE_TTL, SEARCH_CACHE_ENTRIES, SEARCH_CACHE_BYTES)
+
+
+class QueueJournal:
+    """
+    The edits made to a session's tracks since its last checkpoint, history and upcoming counted as one list like QueueDelta
+    Deleting tracks and putting the same ones back at the same place cancels out, so playing through the queue logs nothing
+    Marked full when there's no base snapshot yet, an edit can't be logged, or the log grows past CHECKPOINT_COMPACT_AFTER tracks,
+    the next checkpoint then writes a new snapshot instead
+    """
+    def __init__(self) -> None:
+        self.ops: list[tuple[DeltaOp, int, int, str | None]] = [] # (op, idx, count, data) waiting for the next checkpoint
+        self.full: bool = True
+        self.base: str | None = None # name of the snapshot the logged edits apply to
+        self.logged: int = 0 # tracks touched by the edits already in the database
+        self.pending: int = 0 # tracks touched by ops
+        self.seq: int = 0
+        self.cursor: int = 0 # history length as of the last checkpoint
+        self.suspended: int = 0
+        self.last_deleted: list[str] | None = None # tracks of the last op if it was a delete
+
+    @contextmanager
+    def suspend(self) -> Iterator[None]:
+        """Edits made inside aren't logged, for moves that leave the combined list as it was like spilling history"""
+        self.suspended += 1
+        try:
+            yield
+        finally:
+            self.suspended -= 1
+
+    def grow(self, count: int) -> bool:
+        self.pending += count
+        if self.logged + self.pending > CHECKPOINT_COMPACT_AFTER:
+            self.reset()
+        return not self.full
+
+    def insert(self, index: int, tracks: list[TrackRecord]) -> None:
+        if self.suspended or self.full or not tracks:
+            return
+        encoded = [t.encoded for t in tracks]
+        if self.last_deleted == encoded and self.ops[-1][:2] == (DeltaOp.delete, index):
+            self.ops.pop()
+            self.pending -= len(encoded)
+            self.last_deleted = None
+            return
+        self.last_deleted = None
+        if self.grow(len(encoded)):
+            self.ops.append((DeltaOp.insert, index, len(encoded), "\n".join(encoded)))
+
+    def delete(self, index: int, tracks: list[TrackRecord]) -> None:
+        if self.suspended or self.full or not tracks:
+            return
+        if self.grow(len(tracks)):
+            self.ops.append((DeltaOp.delete, index, len(tracks), None))
+            self.last_deleted = [t.encoded for t in tracks]
+
+    def reset(self) -> None:
+        """Drops the log, the next checkpoint compacts"""
+        if self.suspended:
+            return
+        self.full = True
+        self.ops.clear()
+        self.pending = 0
+        self.last_deleted = None
+
+    def take(self, guild_id: int, cursor: int) -> list[QueueDelta]:
+        """Hands over the ops as QueueDelta rows for a checkpoint and starts a new batch"""
+        deltas = [QueueDelta(guild_id, self.seq + i, op, idx, count, data) for i, (op, idx, count, data) in enumerate(self.ops)]
+        if cursor != self.cursor:
+            deltas.append(QueueDelta(guild_id, self.seq + len(deltas), DeltaOp.cursor, cursor, 0, None))
+        self.seq += len(deltas)
+        self.logged += self.pending
+        self.cursor = cursor
+        self.ops.clear()
+        self.pending = 0
+        self.last_deleted = None
+        return deltas
+
+    def compacted(self, cursor: int) -> None:
+        """The log was folded into a snapshot of the tracks as they are right now"""
+        self.full = False
+        self.ops.clear()
+        self.pending = 0
+        self.logged = 0
+        self.seq = 0
+        self.cursor = cursor
+        self.last_deleted = None
+
+
+class JournaledTracks(BlockList[TrackRecord]):
+    """
+    The BlockList a SessionQueue keeps its tracks in, every edit is told to a QueueJournal once one is bound
+    offset gives where this list starts in the journal's combined list, the spilled history for the history and the whole history for upcoming
+    """
+    def __init__(self, items: Iterable[TrackRecord]=()) -> None:
+        self.journal: QueueJournal | None = None
+        self.offset: Callable[[], int] = lambda: 0
+        self.inserting: bool = False
+        super().__init__(items)
+
+    def bind(self, journal: QueueJournal, offset: Callable[[], int]) -> None:
+        self.journal = journal
+        self.offset = offset
+
+    def _clamp(self, index: int) -> int:
+        if index < 0:
+            index = max(index + len(self), 0)
+        return min(index, len(self))
+
+    @override
+    def _reset(self, items: list[TrackRecord]) -> None:
+        super()._reset(items)
+        if self.journal and not self.inserting: # anything rebuilding the whole list can't be logged as edits
+            self.journal.reset()
+
+    @override
+    def insert(self, index: int, value: TrackRecord) -> None:
+        index = self._clamp(index)
+        self.inserting = True
+        try:
+            super().insert(index, value)
+        finally:
+            self.inserting = False
+        if self.journal:
+            self.journal.insert(self.offset() + index, [value])
+
+    @override
+    def insert_many(self, index: int, values: Iterable[TrackRecord]) -> None:
+        values = list(values)
+        index = self._clamp(index)
+        super().insert_many(index, values)
+        if self.journal:
+            self.journal.insert(self.offset() + index, values)
+
+    @override
+    def __setitem__(self, index: SupportsIndex | slice, value: Any) -> None:
+        if isinstance(index, slice) or not self.journal:
+            return super().__setitem__(index, value) # slices come back through __delitem__ and insert_many
+        i = self._index(index)
+        old = self[i]
+        super().__setitem__(i, value)
+        self.journal.delete(self.offset() + i, [old])
+        self.journal.insert(self.offset() + i, [value])
+
+    @override
+    def __delitem__(self, index: SupportsIndex | slice) -> None:
+        if not self.journal:
+            return super().__delitem__(index)
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            removed = self[start:stop] if step == 1 else []
+            super().__delitem__(index)
+            self.journal.delete(self.offset() + start, removed)
+            return
+        i = self._index(index)
+        old = self[i]
+        super().__delitem__(i)
+        self.journal.delete(self.offset() + i, [old])
+
+    @override
+    def clear(self) -> None:
+        del self[:]
+
+
+class SessionQueue(wavelink.Queue):
+    """
+    wavelink's Queue with its list swapped for a BlockList, so edits deep into a long queue stay O(log n)
+    Tracks are stored as TrackRecords, get and get_at hand back a Playable for the player
+    """
+    def __init__(self, *, history: bool=True) -> None:
+        super().__init__(history=False)
+        self._items: JournaledTracks = JournaledTracks() # pyright: ignore [reportIncompatibleVariableOverride]
+        # narrowed from wavelink's Queue, the history is only ever built here so it's always a SessionQueue
+        self._history: SessionQueue | None = SessionQueue(history=False) if history else None # pyright: ignore [reportIncompatibleVariableOverride]
+
+    @property
+    @override
+    def history(self) -> SessionQueue | None:
+        return self._history
+
+    @override
+    @staticmethod
+    def _check_compatibility(item: object) -> bool: # pyright: ignore [reportIncompatibleMethodOverride]
+        if not isinstance(item, (TrackRecord, Playable)):
+            raise TypeError("This queue is restricted to Playable objects.")
+        return True
+
+    @override
+    def put(self, item: list[Playable] | Playable | wavelink.Playlist | list[TrackRecord] | TrackRecord, /, *, atomic: bool=True) -> int: # pyright: ignore [reportIncompatibleMethodOverride]
+        if isinstance(item, (TrackRecord, Playable)):
+            return super().put(compact(item), atomic=atomic)
+        return super().put([compact(t) for t in item], atomic=atomic)
+
+    @override
+    def put_at(self, index: int, value: Playable | TrackRecord, /) -> None: # pyright: ignore [reportIncompatibleMethodOverride]
+        super().put_at(index, compact(value))
+
+    def put_many_at(self, index: int, tracks: list[Playable] | list[TrackRecord]) -> int:
+        """Inserts every track starting at index, the queue counterpart of list[index:index] = tracks"""
+        self._check_atomic(tracks)
+        self._items.insert_many(index, [compact(t) for t in tracks])
+        self._wakeup_next()
+        return len(tracks)
+
+    @override
+    def __setitem__(self, index: int, value: Playable | TrackRecord, /) -> None: # pyright: ignore [reportIncompatibleMethodOverride]
+        super().__setitem__(index, compact(value))
+
+    @override
+    def get(self) -> Playable:
+        track = hydrate(super().get())
+        self._loaded = track
+        return track
+
+    @override
+    def get_at(self, index: int, /) -> Playable:
+        track = hydrate(super().get_at(index))
+        self._loaded = track
+        return track
+
+    def move(self, index: int, new_index: int) -> None:
+        self._items.move(index, new_index)
+
+    @override
+    def shuffle(self) -> None:
+        items = list(self._items)
+        random.shuffle(items)
+        self._items[:] = items
+
+    @override
+    def copy(self) -> SessionQueue:
+        queue = SessionQueue(history=False)
+        queue._items = JournaledTracks(self._items)
+        return queue
+
+
 class PlayerSession(Player):
     # _disconect_callback: Awaitable[[PlayerSession], None, None] | None = None
     def __init__(self, *args: Any, **kwargs: Any):
+        if not kwargs.get("nodes"):
+            kwargs["nodes"] = [best_node()]
         super().__init__(*args, **kwargs)
+        # narrowed from wavelink's Queue, the player's queue is replaced here before anything can use it
+        self.queue: SessionQueue = SessionQueue() # pyright: ignore [reportIncompatibleVariableOverride]
         self.autoplay = AutoPlayMode.partial
         self.status_bar: StatusBar | None = None
+        self.spilled_history: int = 0 # oldest history tracks that live in HistorySpill instead of memory
+        self.spilled_bytes: int = 0 # rough size of the records those tracks took up
+        self.spill_lock: asyncio.Lock = asyncio.Lock() # one spill or restore at a time, each awaits the database halfway through
+        self.ingest_tasks: set[asyncio.Task[None]] = set() # playlists still being queued in the background
+        self.journal: QueueJournal = QueueJournal() # edits since the last checkpoint
+        self.checkpoint_lock: asyncio.Lock = asyncio.Lock()
+        self.checkpointed: PlayerResume | None = None # the PlayerResume row last written, None once the session ended
+        assert self.queue.history is not None
+        self.queue.history._items.bind(self.journal, lambda: self.spilled_history) # pyright: ignore [reportAttributeAccessIssue]
+        self.queue._items.bind(self.journal, lambda: self.history_length)
+
+    @property
+    def history_length(self) -> int:
+        """The whole history, including the part that was spilled to the database"""
+        assert self.queue.history is not None
+        return self.spilled_history + len(self.queue.history)
+
+    def dbman(self) -> DatabaseManager:
+        assert isinstance(self.client, Kagami)
+        return self.client.dbman
+
+    async def spill_history(self) -> int:
+        """
+        Moves the oldest history tracks to the database once the history is HISTORY_SPILL_BATCH past HISTORY_MEMORY_LIMIT
+        Loop all mode needs the whole history in memory to wrap around so nothing is spilled then
+        Returns how many tracks were moved
+        """
+        assert self.queue.history is not None and self.guild
+        async with self.spill_lock:
+            excess = len(self.queue.history) - HISTORY_MEMORY_LIMIT
+            if excess < HISTORY_SPILL_BATCH or self.queue.mode is QueueMode.loop_all:
+                return 0
+            tracks = self.queue.history[:excess]
+            async with self.dbman().conn() as db:
+                if self.spilled_history == 0: # leftovers of a session that never got to clean up
+                    await HistorySpill.deleteAll(db, self.guild.id)
+                await HistorySpill.appendMany(db, self.guild.id, self.spilled_history, [t.encoded for t in tracks])
+                await db.commit()
+                front = self.queue.history[:excess]
+                if len(front) != excess or any(a is not b for a, b in zip(front, tracks)):
+                    # the history was edited while the tracks were written, they are taken back out and spilled next time
+                    await HistorySpill.popFrom(db, self.guild.id, self.spilled_history)
+                    await db.commit()
+                    return 0
+            with self.journal.suspend():
+                del self.queue.history[:excess]
+            self.spilled_history += excess
+            self.spilled_bytes += sum(track_size(t) for t in tracks)
+        logger.debug(f"spill_history: moved {excess} tracks out of memory in guild {self.guild.id}, "
+                     f"{self.spilled_history} spilled freeing ~{self.spilled_bytes:,} bytes")
+        return excess
+
+    async def restore_history(self, count: int | None=None) -> int:
+        """Brings spilled tracks back until at least count are in memory, or all of them when count is None"""
+        assert self.queue.history is not None and self.guild
+        async with self.spill_lock:
+            needed = self.spilled_history if count is None else min(count - len(self.queue.history), self.spilled_history)
+            if needed <= 0:
+                return 0
+            start = self.spilled_history - needed
+            async with self.dbman().conn() as db:
+                encoded = await HistorySpill.popFrom(db, self.guild.id, start)
+                await db.commit()
+            decoded = await decode_tracks(self.node, encoded)
+            tracks = [t for t in decoded if t is not None]
+            with self.journal.suspend():
+                self.queue.history.put_many_at(0, tracks)
+            if len(tracks) != len(decoded): # the combined list lost tracks, the logged edits no longer line up with it
+                self.journal.reset()
+            self.spilled_history = start
+            self.spilled_bytes = self.spilled_bytes * start // (start + needed)
+        return needed
+
+    async def history_range(self, start: int, stop: int) -> list[TrackRecord]:
+        """Tracks start to stop of the whole history, the spilled part is read back without moving it into memory"""
+        assert self.queue.history is not None and self.guild
+        tracks: list[TrackRecord] = []
+        async with self.spill_lock:
+            if start < self.spilled_history:
+                async with self.dbman().conn() as db:
+                    encoded = await HistorySpill.selectRange(db, self.guild.id, start, min(stop, self.spilled_history))
+                tracks = [TrackRecord.from_playable(t) for t in await decode_tracks(self.node, encoded) if t is not None]
+            tracks.extend(cast(list[TrackRecord], self.queue.history[max(start - self.spilled_history, 0):max(stop - self.spilled_history, 0)]))
+        return tracks
+
+    async def history_encoded(self) -> list[str]:
+        assert self.queue.history is not None and self.guild
+        spilled: list[str] = []
+        async with self.spill_lock:
+            if self.spilled_history:
+                async with self.dbman().conn() as db:
+                    spilled = await HistorySpill.selectRange(db, self.guild.id, 0, self.spilled_history)
+            return spilled + [t.encoded for t in self.queue.history]
+
+    async def clear_spilled_history(self) -> None:
+        assert self.guild
+        async with self.spill_lock:
+            if self.spilled_history == 0:
+                return
+            async with self.dbman().conn() as db:
+                await HistorySpill.deleteAll(db, self.guild.id)
+                await db.commit()
+            self.spilled_history = 0
+            self.spilled_bytes = 0
 
     # @override
     # def cleanup(self) -> None:
@@ -49,38 +621,170 @@ class PlayerSession(Player):
 
     async def save_queue(self) -> None:
         return # temporarilly disabled to get the update out
-        logger.debug("save_queue - pre assert")
-        logger.debug(f"save_queue - {self}")
-        # assert self.queue.history # because the history could be None since history is a queue but doesn't have a history of it's own
+        await self.snapshot_queue()
+
+    async def snapshot_queue(self) -> str | None:
+        """Saves the whole history and the upcoming tracks as a SessionSnapshot, returns its name or None if there was nothing to save"""
+        assert self.guild and self.queue.history is not None
+        history_tracks = await self.history_encoded()
+        upcoming_tracks = [t.encoded for t in self.queue]
+        if len(history_tracks) + len(upcoming_tracks) == 0:
+            return None
+        name = str(int(time.time()))
+        async with self.dbman().conn() as db:
+            await SessionSnapshot.save(db, self.guild.id, name,
+                                       history=history_tracks,
+                                       upcoming=upcoming_tracks,
+                                       start_index=max(len(history_tracks) - 1, 0))
+            await db.commit()
+        logger.debug(f"snapshot_queue: saved {len(history_tracks) + len(upcoming_tracks)} tracks of guild {self.guild.id} as {name}")
+        return name
+
+    def resume_state(self) -> PlayerResume | None:
+        """The PlayerResume row for the session as it is now, None when there's no node session it could be resumed in"""
         assert self.guild
-        logger.debug("save_queue - post assert")
+        node = self.node
+        if not node.session_id or self.channel is None:
+            return None
+        return PlayerResume(guild_id=self.guild.id, channel_id=self.channel.id, node=node.identifier,
+                            session_id=node.session_id, snapshot=self.journal.base,
+                            track=self.current.encoded if self.current else None,
+                            position=self.position, paused=self.paused, volume=self.volume)
 
-        history_tracks, history_length = (list(self.queue.history), len(self.queue.history)) if self.queue.history else ([], 0)
+    async def checkpoint(self) -> int:
+        """
+        Writes the edits made to the tracks since the last checkpoint as QueueDelta rows and refreshes the session's PlayerResume row
+        When the journal is full the tracks are saved as a new snapshot and the log is started over instead
+        Returns how many tracks were written, a compaction counts every track
+        """
+        assert self.guild
+        async with self.checkpoint_lock:
+            if self.checkpointed is None and not self.connected:
+                return 0
+            journal = self.journal
+            resume = None
+            written = 0
+            try:
+                if journal.full:
+                    history = await self.history_encoded() # holds spill_lock, no spill can move tracks out from under the read
+                    upcoming = [t.encoded for t in self.queue]
+                    journal.compacted(len(history)) # anything edited from here on is logged against these tracks
+                    name = str(int(time.time())) if history or upcoming else None
+                    journal.base = name
+                    resume = self.resume_state()
+                    async with self.dbman().conn() as db:
+                        if name is not None:
+                            await SessionSnapshot.save(db, self.guild.id, name, history=history, upcoming=upcoming,
+                                                       start_index=max(len(history) - 1, 0))
+                        await QueueDelta.deleteAll(db, self.guild.id)
+                        if resume:
+                            await resume.upsert(db)
+                        await db.commit()
+                    written = len(history) + len(upcoming)
+                else:
+                    deltas = journal.take(self.guild.id, self.history_length)
+                    resume = self.resume_state()
+                    fresh = self.checkpointed is None or time.time() - self.checkpointed.saved_at < RESUME_REFRESH
+                    if not deltas and resume == self.checkpointed and fresh:
+                        return 0
+                    async with self.dbman().conn() as db:
+                        await QueueDelta.appendMany(db, deltas)
+                        if resume:
+                            await resume.upsert(db)
+                        await db.commit()
+                    written = sum(d.count for d in deltas)
+            except Exception:
+                journal.reset() # whatever was taken is lost, compacting next time covers it
+                raise
+            self.checkpointed = resume
+            return written
 
-        tracks = history_tracks + list(self.queue)
-        logger.debug(f"save_queue - self track count: {len(tracks)}")
-        current_index = history_length-1 if history_length > 0 else 0
-        logger.debug(f"save_queue - current index: {current_index}")
-        name = str(int(time.time()))
-        list_details = TrackListDetails(self.guild.id, name, start_index=current_index, flags=TrackListFlags.session)
-        logger.debug(f"save_queue - track list details: {list_details}")
+    async def clear_checkpoint(self) -> None:
+        """Forgets the session's checkpoint once it has ended for good"""
+        assert self.guild
+        async with self.checkpoint_lock:
+            self.checkpointed = None
+            async with self.dbman().conn() as db:
+                await QueueDelta.deleteAll(db, self.guild.id)
+                await PlayerResume.deleteWhere(db, self.guild.id)
+                await db.commit()
 
-        if len(tracks) == 0:
-            return
+    async def detach(self) -> PlayerResume | None:
+        """
+        Lets go of the session for a restart without ending the player on lavalink, it stays in the node's session for RESUME_TIMEOUT
+        A last checkpoint is written and the player paused so nothing plays to no one, reattach picks it back up
+        Returns the saved row, None when the node isn't connected and there's nothing to come back to
+        """
+        assert self.guild
+        if self.status_bar:
+            await self.status_bar.kill()
+        for task in self.ingest_tasks:
+            task.cancel()
+        await self.checkpoint()
+        resume = self.checkpointed
+        if resume is None:
+            return None
+        node = self.node
+        if self.current and not self.paused:
+            await node._update_player(self.guild.id, data={"paused": True}) # pyright: ignore [reportPrivateUsage]
+        # forgotten on both sides so closing the client doesn't destroy the player or leave the channel through it
+        node._players.pop(self.guild.id, None) # pyright: ignore [reportPrivateUsage]
+        self.client._connection._remove_voice_client(self.guild.id) # pyright: ignore [reportPrivateUsage]
+        logger.info(f"detach: left guild {self.guild.id} playing on {node.identifier} at {resume.position}ms")
+        return resume
 
-        assert isinstance(self.client, Kagami)
-        async with self.client.dbman.conn() as db:
-            logger.debug(f"save_queue - begin insert")
-            await list_details.insert(db)
-            await TrackList.insert_wavelink_tracks(db, tracks, guild_id=self.guild.id, name=name)
-            await db.commit()
-            logger.debug(f"save_queue - committed changes")
+    @classmethod
+    async def reattach(cls, channel: VoiceChannel | StageChannel, resume: PlayerResume, node: wavelink.Node) -> PlayerSession:
+        """
+        Rejoins the channel of a detached session on node and puts its queue back
+        If node still has the lavalink player it carries on from where it was paused,
+        otherwise the saved track is played again from the saved position
+        The queue comes back from the last checkpoint, the snapshot it names with the logged edits replayed on it
+        """
+        session = await channel.connect(cls=partial(cls, nodes=[node])) # pyright: ignore [reportArgumentType]
+        assert session.queue.history is not None
+        async with session.checkpoint_lock: # nothing is checkpointed until the queue is back
+            # joining only sends lavalink the new voice state, a player it kept is left on its track
+            info = await node.fetch_player_info(resume.guild_id) if node.session_id == resume.session_id else None
+            async with session.dbman().conn() as db:
+                history_encoded, upcoming_encoded = await QueueDelta.loadCheckpoint(db, resume.guild_id, resume.snapshot)
+            history = [t for t in await decode_tracks(node, history_encoded) if t is not None]
+            upcoming = [t for t in await decode_tracks(node, upcoming_encoded) if t is not None]
+            with session.journal.suspend():
+                session.queue.history.put(history)
+                session.queue.put(upcoming)
+            # the first checkpoint folds the old log into a snapshot of the restored queue
+        await session.spill_history()
+        current = hydrate(session.queue.history[-1]) if resume.track and len(session.queue.history) else None
+        if info is not None and info.track is not None:
+            session._current = session._original = current or info.track
+            session._volume = info.volume
+            session._paused = info.paused
+            session._filters = info.filters
+            session._last_position = info.state.position
+            session._last_update = time.monotonic_ns()
+            session.queue._loaded = session._current # pyright: ignore [reportPrivateUsage]
+            if not resume.paused:
+                await session.pause(False)
+        elif current is not None:
+            await session.play(current, add_history=False, start=resume.position, volume=resume.volume, paused=resume.paused)
+        logger.info(f"reattach: {'resumed' if info and info.track else 'rebuilt'} the player of guild {resume.guild_id} on {node.identifier} "
+                    f"with {len(history) + len(upcoming)} tracks")
+        return session
 
     @override
-    async def disconnect(self, **kwargs: dict[str, Any]) -> None:
+    async def _destroy(self) -> None:
+        await super()._destroy()
+        await self.clear_checkpoint()
+
+    @override
+    async def disconnect(self, **kwargs: Any) -> None:
         if self.status_bar:
             await self.status_bar.kill()
+        for task in self.ingest_tasks:
+            task.cancel()
         await self.save_queue()
+        await self.clear_spilled_history()
         return await super().disconnect(**kwargs)
 
     def shift_queue(self, shift: int) -> int:
@@ -96,11 +800,13 @@ class PlayerSession(Player):
             tracks = self.queue.history[shift:]
             count = -len(tracks)
             del self.queue.history[shift:]
-            self.queue._items = tracks + self.queue._items
+            self.queue.put_many_at(0, tracks)
         return count
 
     async def skipto(self, index: int) -> int:
         assert self.queue.history is not None
+        if index < 0:
+            await self.restore_history(-index + 1)
         new_index = self.shift_queue(index)
         if new_index == 0 and index > 1:
             # await self.pause(True) 
@@ -108,7 +814,7 @@ class PlayerSession(Player):
         elif new_index == 0 and index == 1:
             await self.skip()
         elif len(self.queue.history) > 0:
-            await self.play(self.queue.history[-1], add_history=False)
+            await self.play(hydrate(self.queue.history[-1]), add_history=False)
         else:
             self.autoplay = AutoPlayMode.disabled
             await self.pause(True)
@@ -118,34 +824,83 @@ class PlayerSession(Player):
             # await self.pause(True)
         return new_index
 
-    async def search_and_queue(self, query: str, position: int | None=None) -> list[Playable] | wavelink.Playlist:
+    async def search_and_queue(self, query: str, position: int | None=None,
+                               on_ingested: Callable[[list[Playable]], Awaitable[None]] | None=None) -> list[Playable] | wavelink.Playlist:
+        """
+        Searches and queues the results at position, or at the end when it's None
+        A link to a video inside a playlist queues the video on its own first and loads the playlist after,
+        on_ingested is called with the tracks that were added that way once they're in
+        """
         # logger.debug(f"search_and_queue - {position=}")
         if position: position = min(max(1, position), len(self.queue)) - 1 # (-1) turns this into an index
         # logger.debug(f"search_and_queue - {position=}")
         # position 1 corresponds to the next track in the queue
         # position 0 means play this shit right now, to be handled by the command that ran this method
-        results: Search = await Playable.search(query)
+        if (video_url := playlist_video_url(query)) is not None:
+            results: Search = await search_cache.search(video_url)
+            if len(results) > 0 and not isinstance(results, wavelink.Playlist):
+                last = self.queue_tracks(position, [results[0]])
+                self.start_ingest(self.ingest_playlist_rest(query, results[0], last, on_ingested))
+                return [results[0]]
+        results = await search_cache.search(query)
         if len(results) == 0:
             return []
         if isinstance(results, wavelink.Playlist):
-            parsed_query = cast(str, urlparse(results.url).query)
-            params = parse_qs(parsed_query)
-            if position is None:
-                if "v" in params.items(): # isolates the specific video from the link
-                    self.queue.put(results[results.selected])
-                else:
-                    self.queue.put(results)
-            else:
-                if "v" in params.items(): # isolates the specific video from the link
-                    self.queue.put_at(position, results[results.selected])
-                else:
-                    self.queue._items = self.queue._items[:position] + list(results) + self.queue._items[position:]
+            self.queue_tracks(position, list(results))
         else:
             # logger.debug(f"search_and_queue - {bool(position)=}")
-            self.queue.put_at(position, results[0]) if position is not None else self.queue.put(results[0])
+            if results[0].source == "http": # named after the file, done before queueing since the queue keeps its own copy of the title
+                results[0]._title = unquote(Path(str(urlparse(results[0].uri).path)).name)
+            self.queue_tracks(position, [results[0]])
             results = [results[0]]
         return results
 
+    def queue_tracks(self, position: int | None, tracks: list[Playable]) -> tuple[TrackRecord, int]:
+        """Puts the tracks at position or the end, returns the record of the last one and where it ended up"""
+        index = len(self.queue) if position is None else position
+        if index < 0: # same as list.insert
+            index = max(index + len(self.queue), 0)
+        index = min(index, len(self.queue))
+        self.queue.put_many_at(index, tracks)
+        last = index + len(tracks) - 1
+        return self.queue._items[last], last # pyright: ignore [reportUnknownMemberType]
+
+    def start_ingest(self, ingest: Awaitable[Any]) -> None:
+        async def run() -> None:
+            try:
+                await ingest
+            except Exception as e:
+                logger.error(f"ingest - failed to queue the rest of a playlist: {e}", exc_info=True)
+        task = asyncio.create_task(run())
+        self.ingest_tasks.add(task)
+        task.add_done_callback(self.ingest_tasks.discard)
+
+    def find_queued(self, record: TrackRecord, hint: int) -> int:
+        """Index of this exact record in the queue, hint is checked first, -1 if it isn't queued anymore"""
+        items: BlockList[TrackRecord] = self.queue._items # pyright: ignore [reportUnknownMemberType]
+        if hint < len(items) and items[hint] is record:
+            return hint
+        return next((i for i, t in enumerate(items) if t is record), -1)
+
+    async def ingest_playlist_rest(self, query: str, video: Playable, last: tuple[TrackRecord, int],
+                                   on_ingested: Callable[[list[Playable]], Awaitable[None]] | None) -> None:
+        """
+        Loads the playlist a video link pointed into and queues the rest of it behind the video, wrapping around like youtube does
+        The video is found again by identity since the queue may have been edited while the playlist loaded, once it's played or removed the rest goes to the front
+        """
+        results = await search_cache.search(query)
+        if not isinstance(results, wavelink.Playlist):
+            return
+        tracks = list(results)
+        selected = results.selected
+        if not 0 <= selected < len(tracks) or tracks[selected] != video:
+            selected = next((i for i, t in enumerate(tracks) if t == video), -1)
+        rest = tracks[selected + 1:] + tracks[:selected] if selected >= 0 else tracks
+        record, hint = last
+        self.queue.put_many_at(self.find_queued(record, hint) + 1, rest)
+        if on_ingested is not None:
+            await on_ingested(rest)
+
     async def play_next(self) -> Playable | None:
         "Simple wrapper to get and play the next track in the queue"
         if not self.queue.is_empty:
@@ -235,6 +990,12 @@ class StatusBar(ui.View):
         self.style: str = style
         self.seek_milliseconds: int = 5000
         self.volume_interval: int = 10
+        self.rendered: tuple[str, tuple[str, ...]] | None = None # what the message was last set to
+        self.flusher: asyncio.Task[None] | None = None
+        self.dirty: bool = False # an update was asked for that hasn't been rendered yet
+        self.pending_resend: bool = False
+        self.last_render: float = 0
+        self.edits_avoided: int = 0 # requests folded into another edit or dropped since nothing changed
         if style == "minimal":
             self.clear_items()
 
@@ -310,55 +1071,73 @@ class StatusBar(ui.View):
         """
         Used to resend the status by by deleting the old and sending a new message
         """
+        state = self.render()
         if self.message is not None:
             # print(f"{self.message.id=}")
             old_message = self.message
             await old_message.delete()
-            self.message = await self.channel.send(content=self.get_content(), view=self)
-            await self.update()
             # _, self.message = await asyncio.gather(old_message.delete(), self.channel.send(content=self.get_content()))
-        else:
-            self.message = await self.channel.send(content=self.get_content(), view=self)
-            await self.update()
+        self.message = await self.channel.send(content=state[0], view=self)
+        self.rendered = state
 
     async def refresh(self) -> None:
-        voice_client = self.channel.guild.voice_client
-        if voice_client is None:
-            await self.kill()
-        else:
-            if self.message != self.channel.last_message:
-                await self.resend()
-            else:
-                await self.update()
+        """Like update but resends the message when it isn't the last one in the channel anymore"""
+        self.schedule(resend=True)
 
     async def update(self) -> None:
         """
         Updates the statusbar message if anything has changed, otherwise do nothing
+        Requests are coalesced, the message is edited at most once every STATUS_BAR_INTERVAL seconds
+        with whatever the state is by then, so a burst of skips becomes one or two edits
         """
-        if self.message is None:
+        self.schedule(resend=False)
+
+    def schedule(self, resend: bool) -> None:
+        self.pending_resend = self.pending_resend or resend
+        if self.flusher is not None and not self.flusher.done():
+            if self.dirty:
+                self.edits_avoided += 1 # folded into the edit that's already waiting
+            self.dirty = True
             return
+        self.dirty = True
+        self.flusher = asyncio.create_task(self.flush())
+
+    async def flush(self) -> None:
+        """Renders until no request is left, waiting out the interval since the last render between each"""
+        while self.dirty and not self.is_finished():
+            wait = self.last_render + STATUS_BAR_INTERVAL - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            resend, self.pending_resend, self.dirty = self.pending_resend, False, False
+            try:
+                await self.apply(resend)
+            except Exception as e:
+                logger.error(f"status_bar - failed to update: {e}", exc_info=True)
+            self.last_render = time.monotonic()
+
+    async def apply(self, resend: bool) -> None:
+        voice_client = self.channel.guild.voice_client
+        if voice_client is None:
+            await self.kill()
+        elif resend and self.message != self.channel.last_message:
+            await self.resend()
+        elif self.message is not None:
+            state = self.render()
+            if state == self.rendered:
+                self.edits_avoided += 1
+                return
+            try:
+                await self.message.edit(content=state[0], view=self)
+                self.rendered = state
+            except discord.NotFound:
+                self.message = None
+
+    def render(self) -> tuple[str, tuple[str, ...]]:
+        """Sets the buttons to match the session and returns what the message should look like, the content and the button state"""
         assert (guild:=self.channel.guild) is not None, "Can't exist outside of a guild"
         assert (voice_client:=guild.voice_client) is not None, "Voice session must exist"
         session = cast(PlayerSession, voice_client)
-        is_anything_changed = False 
-        # used to to know if the message needs to be edited in case anything changed
-        # may seem redundant but without this I edit the message when I don't need to
-        # Ideally I would only edit the message when I need to but the instance is owned by the
-        # session and if a pause command is run I'd like it to update the view
-        # I wanted to just check if message.view != self but you can't actually do that
-        # only other thing would be making a copy of the current view and comparing it but that is a waste of memory
-
-        before = self.play_pause.emoji
-        # logger.debug(f"{before=}")
         self.play_pause.emoji = "▶️" if session.paused else "⏸️"
-        after = self.play_pause.emoji
-        # logger.debug(f"{after=}")
-        # logger.debug(f"{before=}")
-        is_anything_changed = is_anything_changed or before != after
-        # logger.debug(f"{is_anything_changed}")
-
-        before = self.loop_mode.emoji
-        before2 = self.loop_mode.style
         match session.queue.mode:
             case QueueMode.loop:
                 self.loop_mode.emoji = "🔂"
@@ -369,29 +1148,15 @@ class StatusBar(ui.View):
             case QueueMode.normal:
                 self.loop_mode.emoji = "🔁"
                 self.loop_mode.style = ButtonStyle.grey
-        after = self.loop_mode.emoji.id
-        after2 = self.loop_mode.style
-        is_anything_changed = is_anything_changed or before != after or before2 != after2
-        # logger.debug(f"{is_anything_changed}")
-
-        before = self.volume_up.label
         self.volume_up.label = f"{session.volume}"
         self.volume_down.label = f"{session.volume}"
-        after = self.volume_up.label
-        is_anything_changed = is_anything_changed or before != after
-        # logger.debug(f"{is_anything_changed}")
-        
-        # old vs new content is done differently since I need the new content to edit the message
-        old_content = self.message.content
-        new_content = self.get_content()
-        if is_anything_changed or old_content != new_content:
-            # logger.debug("editting status message")
-            try:
-                await self.message.edit(content=new_content, view=self)
-            except discord.NotFound:
-                self.message = None
+        buttons = (str(self.play_pause.emoji), str(self.loop_mode.emoji), str(self.loop_mode.style), str(self.volume_up.label))
+        return self.get_content(), buttons
 
     async def kill(self) -> None:
+        if self.flusher is not None and self.flusher is not asyncio.current_task():
+            self.flusher.cancel()
+        logger.debug(f"status_bar - killed after {self.edits_avoided} avoided edits")
         try:
             await self.message.delete() if self.message else ...
         except discord.NotFound:
@@ -441,6 +1206,8 @@ class StatusBar(ui.View):
             await self.kill()
         session = cast(PlayerSession, interaction.guild.voice_client)
         session.cycle_queue_mode()
+        if session.queue.mode is QueueMode.loop_all:
+            await session.restore_history()
         await self.update()
 
     @ui.button(emoji="🔊", style=ButtonStyle.secondary, row=0)
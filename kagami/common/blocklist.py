@@ -0,0 +1,234 @@
+"""
+A list that stays cheap to edit in the middle no matter how long it gets
+Items are kept in blocks of up to 2 * BLOCK_SIZE with a fenwick tree over the block lengths,
+so finding an index is O(log n) and an insert or delete only ever shifts the items of one block
+Range operations split at most two blocks and splice whole blocks in or out
+"""
+from __future__ import annotations
+from collections.abc import Iterable, Iterator, MutableSequence
+from itertools import accumulate, chain, islice
+from typing import Any, SupportsIndex, overload, override
+
+BLOCK_SIZE = 256
+
+
+class BlockList[T](MutableSequence[T]):
+    def __init__(self, items: Iterable[T]=()) -> None:
+        self._blocks: list[list[T]] = []
+        self._tree: list[int] = [0] # fenwick tree of block lengths, 1 indexed
+        self._len: int = 0
+        self._reset(list(items))
+
+    def _reset(self, items: list[T]) -> None:
+        self._blocks = [items[i:i + BLOCK_SIZE] for i in range(0, len(items), BLOCK_SIZE)]
+        self._len = len(items)
+        self._build()
+
+    def _build(self) -> None:
+        """Rebuilds the tree after blocks were added or removed, O(number of blocks)"""
+        prefix = [0, *accumulate(map(len, self._blocks))]
+        # node i covers the blocks after i with its lowest bit cleared, up to and including i
+        self._tree = [prefix[i] - prefix[i & (i - 1)] for i in range(len(prefix))]
+
+    def _grow(self, block_index: int, delta: int) -> None:
+        i = block_index + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _locate(self, index: int) -> tuple[int, int]:
+        """(block, offset) of an in range, non negative index"""
+        pos, rest = 0, index
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = pos + step
+            if nxt < len(self._tree) and self._tree[nxt] <= rest:
+                pos = nxt
+                rest -= self._tree[nxt]
+            step >>= 1
+        return pos, rest
+
+    def _index(self, index: SupportsIndex) -> int:
+        i = index.__index__()
+        if i < 0:
+            i += self._len
+        if not 0 <= i < self._len:
+            raise IndexError("BlockList index out of range")
+        return i
+
+    def _split(self, *indices: int) -> list[int]:
+        """
+        Splits blocks so each index starts one, returns those blocks' positions in the same order
+        Every index is located before anything is split, the tree is left stale for the caller to rebuild
+        """
+        located = [(i, self._locate(i) if i < self._len else (len(self._blocks), 0)) for i in indices]
+        positions: dict[int, int] = {}
+        # splitting from the back keeps the positions located further forward valid
+        for i, (b, offset) in sorted(located, key=lambda x: x[0], reverse=True):
+            if offset > 0:
+                block = self._blocks[b]
+                self._blocks[b:b + 1] = [block[:offset], block[offset:]]
+                positions = {k: v + 1 for k, v in positions.items()}
+                positions[i] = b + 1
+            else:
+                positions[i] = b
+        return [positions[i] for i in indices]
+
+    def _join(self, b: int) -> None:
+        """Merges block b into the one before it when both are small, keeps splices from fragmenting the list"""
+        if 0 < b < len(self._blocks) and len(self._blocks[b - 1]) + len(self._blocks[b]) <= BLOCK_SIZE:
+            self._blocks[b - 1].extend(self._blocks.pop(b))
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __iter__(self) -> Iterator[T]:
+        return chain.from_iterable(self._blocks)
+
+    def __reversed__(self) -> Iterator[T]:
+        for block in reversed(self._blocks):
+            yield from reversed(block)
+
+    def __contains__(self, value: object) -> bool:
+        return any(value in block for block in self._blocks)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, (BlockList, list)):
+            return NotImplemented
+        return len(self) == len(other) and all(a == b for a, b in zip(self, other)) # pyright: ignore [reportUnknownArgumentType]
+
+    def __repr__(self) -> str:
+        return f"BlockList({list(self)!r})"
+
+    @overload
+    def __getitem__(self, index: SupportsIndex) -> T: ...
+    @overload
+    def __getitem__(self, index: slice) -> list[T]: ...
+    @override
+    def __getitem__(self, index: SupportsIndex | slice) -> T | list[T]:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                return list(self)[index]
+            if start >= stop:
+                return []
+            b, offset = self._locate(start)
+            first = islice(self._blocks[b], offset, None)
+            return list(islice(chain(first, chain.from_iterable(islice(self._blocks, b + 1, None))), stop - start))
+        b, offset = self._locate(self._index(index))
+        return self._blocks[b][offset]
+
+    @overload
+    def __setitem__(self, index: SupportsIndex, value: T) -> None: ...
+    @overload
+    def __setitem__(self, index: slice, value: Iterable[T]) -> None: ...
+    @override
+    def __setitem__(self, index: SupportsIndex | slice, value: Any) -> None:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                items = list(self)
+                items[index] = value
+                self._reset(items)
+                return
+            values = list(value)
+            del self[start:stop]
+            self.insert_many(start, values)
+            return
+        b, offset = self._locate(self._index(index))
+        self._blocks[b][offset] = value
+
+    @override
+    def __delitem__(self, index: SupportsIndex | slice) -> None:
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._len)
+            if step != 1:
+                items = list(self)
+                del items[index]
+                self._reset(items)
+                return
+            if start >= stop:
+                return
+            left, right = self._split(start, stop)
+            del self._blocks[left:right]
+            self._len -= stop - start
+            self._join(left)
+            self._build()
+            return
+        b, offset = self._locate(self._index(index))
+        del self._blocks[b][offset]
+        self._len -= 1
+        if not self._blocks[b]:
+            del self._blocks[b]
+            self._build()
+        else:
+            self._grow(b, -1)
+
+    @override
+    def insert(self, index: int, value: T) -> None:
+        if index < 0:
+            index = max(index + self._len, 0)
+        index = min(index, self._len)
+        if not self._blocks:
+            self._reset([value])
+            return
+        if index == self._len:
+            b = len(self._blocks) - 1
+            self._blocks[b].append(value)
+        else:
+            b, offset = self._locate(index)
+            self._blocks[b].insert(offset, value)
+        self._len += 1
+        block = self._blocks[b]
+        if len(block) > 2 * BLOCK_SIZE:
+            self._blocks[b:b + 1] = [block[:BLOCK_SIZE], block[BLOCK_SIZE:]]
+            self._build()
+        else:
+            self._grow(b, 1)
+
+    def insert_many(self, index: int, values: Iterable[T]) -> None:
+        """Inserts every value starting at index, O(k + log n) plus a rebuild of the block tree"""
+        values = list(values)
+        if not values:
+            return
+        if index < 0:
+            index = max(index + self._len, 0)
+        index = min(index, self._len)
+        b, = self._split(index)
+        self._blocks[b:b] = [values[i:i + BLOCK_SIZE] for i in range(0, len(values), BLOCK_SIZE)]
+        self._len += len(values)
+        self._join(b + (len(values) - 1) // BLOCK_SIZE + 1)
+        self._join(b)
+        self._build()
+
+    def move(self, index: int, new_index: int) -> None:
+        """Moves the item at index so that it ends up at new_index"""
+        self.insert(new_index, self.pop(index))
+
+    @override
+    def append(self, value: T) -> None:
+        self.insert(self._len, value)
+
+    @override
+    def extend(self, values: Iterable[T]) -> None:
+        self.insert_many(self._len, values)
+
+    @override
+    def pop(self, index: int=-1) -> T:
+        value = self[index]
+        del self[index]
+        return value
+
+    @override
+    def clear(self) -> None:
+        self._reset([])
+
+    @override
+    def index(self, value: Any, start: int=0, stop: int | None=None) -> int:
+        for i, item in enumerate(islice(self, start, stop), start):
+            if item is value or item == value:
+                return i
+        raise ValueError(f"{value!r} is not in BlockList")
+
+    def copy(self) -> BlockList[T]:
+        return BlockList(self)
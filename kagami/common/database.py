@@ -447,6 +447,16 @@ class Table(TableBase, metaclass=TableMeta, schema_version=0, trigger_version=0,
         """
         await db.execute(query)
 
+    @classmethod
+    async def temp_columns(cls, db: aiosqlite.Connection) -> set[str]:
+        """
+        Column names of the temp copy, a table created on this run has no metadata yet and gets "updated"
+        on the next startup, so insert_from_temp can be handed a copy that already has the current schema
+        """
+        db.row_factory = None
+        rows = await db.execute_fetchall(f"PRAGMA table_info(temp_{cls.__tablename__})")
+        return {row[1] for row in rows}
+
     @classmethod
     async def drop_temp(cls, db: aiosqlite.Connection):
         await db.execute(f"DROP TABLE IF EXISTS temp_{cls.__tablename__}")
@@ -900,6 +910,7 @@ class DatabaseManager(ManagerBase, metaclass=ManagerMeta, table_registry=TableRe
 
             await DatabaseManager.registry.create_tables(db, table_group)
             await DatabaseManager.registry.create_triggers(db, table_group)
+            await DatabaseManager.registry.create_indexes(db, table_group)
             await db.commit()
         logger.debug(f"Setup Table Group: {table_group}")
 
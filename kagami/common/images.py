@@ -0,0 +1,115 @@
+"""
+Image ingestion for uploads that end up as emojis
+Downloads are streamed with a size cap and decoding / resizing runs on a worker thread
+so a large upload can't stall the event loop and with it the gateway heartbeat
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+import aiohttp
+from PIL import Image, ImageSequence, UnidentifiedImageError
+
+from common.logging import setup_logging
+logger = setup_logging(__name__)
+
+EMOJI_SIZE = 128 # discord never displays emojis any larger
+EMOJI_MAX_BYTES = 256_000 # discord's upload limit for emojis
+MAX_SOURCE_PIXELS = 64_000_000 # anything bigger is refused before it's decoded
+CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 30 # seconds for the whole download
+
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="image_ingest")
+
+
+class ImageTooLarge(ValueError):
+    pass
+
+class InvalidImage(ValueError):
+    pass
+
+class DownloadFailed(ValueError):
+    pass
+
+
+async def download_capped(url: str, max_bytes: int) -> bytes:
+    """
+    Streams the file at url into memory, raising ImageTooLarge as soon as it goes past max_bytes
+    Raises DownloadFailed for an error status, a connection error or when it takes longer than DOWNLOAD_TIMEOUT
+    """
+    buffer = BytesIO()
+    try:
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)) as session:
+            async with session.get(url) as r:
+                r.raise_for_status()
+                if r.content_length is not None and r.content_length > max_bytes:
+                    raise ImageTooLarge(f"File is {r.content_length:,} bytes, the limit is {max_bytes:,}")
+                async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                    if buffer.tell() + len(chunk) > max_bytes:
+                        raise ImageTooLarge(f"File is over the {max_bytes:,} byte limit")
+                    buffer.write(chunk)
+    except aiohttp.ClientResponseError as e:
+        raise DownloadFailed(f"Download failed with status {e.status}") from e
+    except aiohttp.ClientError as e:
+        raise DownloadFailed(f"Download failed: {e}") from e
+    except TimeoutError as e:
+        raise DownloadFailed(f"Download took longer than {DOWNLOAD_TIMEOUT} seconds") from e
+    return buffer.getvalue()
+
+def shrink_frames(image: Image.Image, size: int, max_bytes: int) -> BytesIO:
+    """
+    Downscales every frame of an animated GIF or WebP and saves them back as the same format, keeping the frame timings
+    Raises ImageTooLarge when the result is still over max_bytes, dropping frames would change the animation
+    """
+    frames: list[Image.Image] = []
+    durations: list[int] = []
+    for frame in ImageSequence.Iterator(image):
+        scaled = frame.convert("RGBA")
+        durations.append(frame.info.get("duration", 100)) # webp only fills in the duration once the frame is loaded
+        scaled.thumbnail((size, size), Image.Resampling.LANCZOS)
+        frames.append(scaled)
+    out = BytesIO()
+    options = {"quality": 90, "method": 6} if image.format == "WEBP" else {"optimize": True, "disposal": 2}
+    frames[0].save(out, format=image.format, save_all=True, append_images=frames[1:],
+                   duration=durations, loop=image.info.get("loop", 0), **options)
+    if out.tell() > max_bytes:
+        raise ImageTooLarge(f"Animation is still {out.tell():,} bytes at {size}x{size}, the limit is {max_bytes:,}")
+    return out
+
+def shrink_image(data: bytes, size: int=EMOJI_SIZE, max_bytes: int=EMOJI_MAX_BYTES) -> bytes:
+    """
+    Decodes an image, downscales it to fit within size x size and re-encodes it
+    Gives an optimized PNG, or a WebP when the PNG is still over max_bytes
+    Animated GIFs and WebPs stay animated in their own format, see shrink_frames
+    Blocking, run it through shrink_image_async from the event loop
+    """
+    try:
+        with Image.open(BytesIO(data)) as image:
+            frame_count = getattr(image, "n_frames", 1)
+            if image.width * image.height * frame_count > MAX_SOURCE_PIXELS:
+                raise ImageTooLarge(f"Image is {image.width}x{image.height} over {frame_count} frames, too many pixels to process")
+            if getattr(image, "is_animated", False) and image.format in ("GIF", "WEBP"):
+                out = shrink_frames(image, size, max_bytes)
+            else:
+                image.draft("RGB", (size, size)) # lets jpegs decode straight at a reduced scale
+                image = image.convert("RGBA")
+                image.thumbnail((size, size), Image.Resampling.LANCZOS)
+                out = BytesIO()
+                image.save(out, format="PNG", optimize=True)
+                if out.tell() > max_bytes:
+                    out = BytesIO()
+                    image.save(out, format="WEBP", quality=90, method=6)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage(f"Could not read the image: {e}") from e
+    result = out.getvalue()
+    logger.debug(f"shrink_image: {len(data):,} -> {len(result):,} bytes over {frame_count} frames")
+    return result
+
+async def shrink_image_async(data: bytes, size: int=EMOJI_SIZE, max_bytes: int=EMOJI_MAX_BYTES) -> bytes:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, shrink_image, data, size, max_bytes)
+
+async def ingest_image(url: str, max_download_bytes: int, size: int=EMOJI_SIZE) -> bytes:
+    """Downloads and shrinks an image for use as an emoji, raises ImageTooLarge, InvalidImage or DownloadFailed"""
+    data = await download_capped(url, max_download_bytes)
+    return await shrink_image_async(data, size)
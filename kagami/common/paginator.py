@@ -2,7 +2,7 @@ import collections
 import dataclasses
 import traceback
 from aiosqlite import Connection
-from typing import Any, Callable 
+from typing import Any, Callable, override
 from collections.abc import Awaitable, Generator
 from abc import ABC, abstractmethod
 import sys
@@ -200,6 +200,7 @@ class SimpleCallback[T](ABC):
     INDEX_DISPLAY_OFFSET: int = 1
     CODEBLOCK_LANGUAGE: str = "swift"
     CONTENT_SEPERATOR: str = "───"
+    CACHE_TOTAL_ITEM_COUNT: bool = False # only call get_total_item_count on the first page
 
     async def __call__(self, interaction: Interaction, state: ScrollerState) -> tuple[str, int, int]:
         return await self._callback(interaction, state)
@@ -213,6 +214,7 @@ class SimpleCallback[T](ABC):
         """
         self._bound_arguments: tuple[tuple[Any], dict[str, Any]] = (args, kwargs) # tuple, args and kwargs still need to be individually unpacked
         self._total_item_count: int = 0  # total number of items returned by get_total_item_count
+        self._has_total_item_count: bool = False
         self._items: list[T] = []        # items returned by call to get_items
         self._offset: int = 0            # ScrollerState offset clamped by the total item count
         self._first_index: int = -sys.maxsize
@@ -328,7 +330,9 @@ class SimpleCallback[T](ABC):
         self._offset = state.offset
         args, kwargs = self.bound_arguments
         async with interaction.client.dbman.conn() as db:
-            self._total_item_count = await self.get_total_item_count(db, interaction, state, *args, **kwargs)
+            if not (self.CACHE_TOTAL_ITEM_COUNT and self._has_total_item_count):
+                self._total_item_count = await self.get_total_item_count(db, interaction, state, *args, **kwargs)
+                self._has_total_item_count = True
             self._first_index, self._last_index = await self.get_first_last(db, interaction, state, *args, **kwargs)
             self._offset = self._clamp_offset()
             self._items = await self.get_items(db, interaction, state, *args, **kwargs)
@@ -354,6 +358,59 @@ class SimpleCallback[T](ABC):
                   f"```"
         return content, self.first_index, self.last_index
 
+
+class KeysetCallback[T, K](SimpleCallback[T]):
+    """
+    A SimpleCallback that pages with keyset cursors instead of LIMIT / OFFSET
+
+    The first and last key of every page shown are kept, so moving to a neighbouring page
+    or jumping to either end seeks straight to it and costs the same on page 1 as on page 500
+    Keys must be unique and follow the order the items are listed in
+    The total item count is only queried once for the life of the callback
+    """
+    CACHE_TOTAL_ITEM_COUNT: bool = True
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._page_keys: dict[int, tuple[K, K]] = {} # page index: (first key, last key)
+
+    @abstractmethod
+    def item_key(self, item: T) -> K:
+        """
+        Abstract method giving the cursor key of an item
+        """
+        ...
+
+    @abstractmethod
+    async def get_items_after(self, db: Connection, interaction: Interaction, state: ScrollerState, key: K | None, limit: int, reverse: bool, *args: Any, **kwargs: Any) -> list[T]:
+        """
+        Abstract method for getting up to limit items following key in listing order
+        When reverse is true it's the items before key instead, nearest to key first
+        A key of None starts from the first item, or the last when reversed
+        """
+        ...
+
+    @override
+    async def get_items(self, db: Connection, interaction: Interaction, state: ScrollerState, *args: Any, **kwargs: Any) -> list[T]:
+        page, size = self._offset, self.PAGE_ITEM_COUNT
+        if page <= self.first_index:
+            items = await self.get_items_after(db, interaction, state, None, size, False, *args, **kwargs)
+        elif (previous := self._page_keys.get(page - 1)) is not None:
+            items = await self.get_items_after(db, interaction, state, previous[1], size, False, *args, **kwargs)
+        elif (following := self._page_keys.get(page + 1)) is not None:
+            items = await self.get_items_after(db, interaction, state, following[0], size, True, *args, **kwargs)
+            items.reverse()
+        elif page >= self.last_index:
+            remainder = self.total_item_count - page * size
+            items = await self.get_items_after(db, interaction, state, None, remainder, True, *args, **kwargs)
+            items.reverse()
+        else: # no cursor near this page, only happens when starting somewhere in the middle
+            items = await self.get_items_after(db, interaction, state, None, (page + 1) * size, False, *args, **kwargs)
+            items = items[page * size:]
+        if items:
+            self._page_keys[page] = (self.item_key(items[0]), self.item_key(items[-1]))
+        return items
+
 # class OldSimpleCallbackBuilder[ITEM_TYPE]:
 #     """
 #     Exists to quickly throw together callbacks without needing to remember the boilerplate required to do so 
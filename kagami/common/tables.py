@@ -8,6 +8,7 @@ from dataclasses import dataclass
 import aiosqlite
 from aiosqlite import Connection
 from io import BytesIO
+import hashlib
 
 
 @dataclass
@@ -225,11 +226,59 @@ class PersistentSettings(Table, schema_version=1, trigger_version=1):
 
 
 @dataclass
-class BotEmoji(Table, schema_version=1, trigger_version=1):
+class BotAsset(Table, schema_version=1, trigger_version=1):
+    """
+    Content addressed store for binary files like emoji images
+    Rows are keyed by the sha256 of their data so identical files are only stored once
+    """
+    hash: str
+    data: bytes
+
+    @staticmethod
+    def hash_data(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    @classmethod
+    async def create_table(cls, db: Connection):
+        query = f"""
+        CREATE TABLE IF NOT EXISTS {BotAsset} (
+            hash TEXT NOT NULL,
+            data BLOB NOT NULL,
+            PRIMARY KEY (hash)
+        )
+        """
+        await db.execute(query)
+
+    @classmethod
+    async def store(cls, db: Connection, data: bytes) -> str:
+        """Inserts the data if it isn't already stored and returns its hash"""
+        hash = cls.hash_data(data)
+        query = f"""
+        INSERT OR IGNORE INTO {BotAsset} (hash, data)
+        VALUES (?, ?)
+        """
+        await db.execute(query, (hash, data))
+        return hash
+
+    @classmethod
+    async def selectData(cls, db: Connection, hash: str) -> bytes | None:
+        query = f"""
+        SELECT data FROM {BotAsset}
+        WHERE hash = ?
+        """
+        db.row_factory = None
+        async with db.execute(query, (hash,)) as cur:
+            res = await cur.fetchone()
+        return res[0] if res is not None else None
+
+
+@dataclass
+class BotEmoji(Table, schema_version=2, trigger_version=2):
+    """The image itself lives in BotAsset and is only loaded when it's asked for"""
     id: int
     name: str
     # prefix: str
-    image_data: bytes
+    image_hash: str | None=None
 
     # def get_image(self) -> ImageFile.ImageFile:
     #     image: ImageFile.ImageFile | None = None 
@@ -237,11 +286,15 @@ class BotEmoji(Table, schema_version=1, trigger_version=1):
     #         image = Image.open(BytesIO(self.image_data))
     #     return image
 
-    def get_image_file(self) -> discord.File | None:
-        if self.image_data is not None:
-            with BytesIO(self.image_data) as f:
-                file = discord.File(fp=f)
-            return file
+    async def get_image_data(self, db: Connection) -> bytes | None:
+        if self.image_hash is None:
+            return None
+        return await BotAsset.selectData(db, self.image_hash)
+
+    async def get_image_file(self, db: Connection) -> discord.File | None:
+        image_data = await self.get_image_data(db)
+        if image_data is not None:
+            return discord.File(fp=BytesIO(image_data), filename=f"{self.name}.png")
         else:
             return None
 
@@ -249,8 +302,11 @@ class BotEmoji(Table, schema_version=1, trigger_version=1):
         emoji = await bot.fetch_application_emoji(self.id)
         return emoji
 
-    async def to_discord(self, bot: commands.Bot) -> discord.Emoji:
-        emoji = await bot.create_application_emoji(name=self.name, image=self.image_data)
+    async def to_discord(self, db: Connection, bot: commands.Bot) -> discord.Emoji:
+        image_data = await self.get_image_data(db)
+        if image_data is None:
+            raise ValueError(f"BotEmoji {self.name} has no stored image")
+        emoji = await bot.create_application_emoji(name=self.name, image=image_data)
         return emoji
 
     async def delete_discord(self, bot: commands.Bot) -> None:
@@ -261,9 +317,11 @@ class BotEmoji(Table, schema_version=1, trigger_version=1):
     #     return f"{self.prefix}_{self.name}"
 
     @classmethod
-    async def from_discord(cls, emoji: discord.Emoji) -> BotEmoji:
-        data = await emoji.read()
-        return BotEmoji(id=emoji.id, name=emoji.name, image_data=data)
+    async def from_discord(cls, db: Connection, emoji: discord.Emoji, image_data: bytes | None=None) -> BotEmoji:
+        """Stores the emoji's image, downloading it unless the bytes are passed in"""
+        data = image_data if image_data is not None else await emoji.read()
+        image_hash = await BotAsset.store(db, data)
+        return BotEmoji(id=emoji.id, name=emoji.name, image_hash=image_hash)
 
     @classmethod
     async def create_table(cls, db: Connection):
@@ -280,13 +338,62 @@ class BotEmoji(Table, schema_version=1, trigger_version=1):
             CREATE TABLE IF NOT EXISTS {BotEmoji} (
             id INTEGER NOT NULL,
             name TEXT NOT NULL,
-            image_data BLOB,
+            image_hash TEXT,
             PRIMARY KEY (id),
-            UNIQUE (name)
+            UNIQUE (name),
+            FOREIGN KEY (image_hash) REFERENCES {BotAsset}(hash)
         )
         """
         await db.execute(query)
 
+    @classmethod
+    async def insert_from_temp(cls, db: Connection):
+        """Updating from schema version 1 -> 2 to move the inline image_data into BotAsset"""
+        if "image_data" not in await cls.temp_columns(db):
+            await super().insert_from_temp(db)
+        elif cls.__schema_version__ == 2:
+            await BotAsset.create_table(db)
+            db.row_factory = None
+            rows = await db.execute_fetchall(f"SELECT id, name, image_data FROM temp_{BotEmoji}")
+            emojis: list[tuple[int, str, str | None]] = []
+            for id, name, image_data in rows:
+                image_hash = await BotAsset.store(db, image_data) if image_data is not None else None
+                emojis.append((id, name, image_hash))
+            query = f"""
+            INSERT INTO {BotEmoji} (id, name, image_hash)
+            VALUES (?, ?, ?)
+            """
+            await db.executemany(query, emojis)
+
+    @classmethod
+    async def create_triggers(cls, db: Connection):
+        # Images are shared between emojis, they're only removed once nothing points at them
+        def drop_unused(row: str) -> str:
+            return f"""
+            DELETE FROM {BotAsset}
+            WHERE hash = {row}.image_hash
+            AND NOT EXISTS (SELECT 1 FROM {BotEmoji} WHERE image_hash = {row}.image_hash);
+            """
+        triggers = [
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {BotEmoji}_drop_unused_asset_after_delete
+            AFTER DELETE ON {BotEmoji}
+            BEGIN
+                {drop_unused("OLD")}
+            END;
+            """,
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {BotEmoji}_drop_unused_asset_after_update
+            AFTER UPDATE OF image_hash ON {BotEmoji}
+            WHEN OLD.image_hash IS NOT NEW.image_hash
+            BEGIN
+                {drop_unused("OLD")}
+            END;
+            """,
+        ]
+        for trigger in triggers:
+            await db.execute(trigger)
+
     @classmethod
     async def selectFromID(cls, db: Connection, id: int) -> BotEmoji | None:
         query = f"""
@@ -301,8 +408,8 @@ class BotEmoji(Table, schema_version=1, trigger_version=1):
     @override
     async def insert(self, db: Connection):
         query = f"""
-            INSERT OR IGNORE INTO {BotEmoji} (id, name, image_data)
-            VALUES (:id, :name, :image_data)
+            INSERT OR IGNORE INTO {BotEmoji} (id, name, image_hash)
+            VALUES (:id, :name, :image_hash)
         """
         await db.execute(query, self.asdict())
 
@@ -324,8 +431,8 @@ class BotEmoji(Table, schema_version=1, trigger_version=1):
         await db.execute(query, (id,))
 
     @classmethod
-    async def insertFromDiscord(cls, db: Connection, emoji: discord.Emoji) -> BotEmoji:
-        converted = await BotEmoji.from_discord(emoji)
+    async def insertFromDiscord(cls, db: Connection, emoji: discord.Emoji, image_data: bytes | None=None) -> BotEmoji:
+        converted = await BotEmoji.from_discord(db, emoji, image_data)
         await converted.insert(db)
         return converted
 